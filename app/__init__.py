@@ -11,7 +11,10 @@ def create_app():
     # CORS per development
     CORS(app, origins=config.CORS_ORIGINS)
     
-    # Inizializza database
+    # Cartelle media/static
+    config.ensure_directories()
+    
+    # Inizializza database (nessun DDL se lo schema è già alla versione corrente)
     with app.app_context():
         from .db import init_db
         init_db()
@@ -22,11 +25,21 @@ def create_app():
     from .routes.pages import pages_bp
     from .routes.cards import cards_bp
     from .routes.assets import assets_bp
+    from .routes.api import api_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(books_bp, url_prefix='/books')
     app.register_blueprint(pages_bp, url_prefix='/books/<int:book_id>/pages')
     app.register_blueprint(cards_bp)
     app.register_blueprint(assets_bp)
+    app.register_blueprint(api_bp, url_prefix='/api')
+    
+    # Compressione risposte e file statici precompressi
+    from .services.compression import init_compression
+    init_compression(app)
+    
+    # Helper template per URL media con fingerprint
+    from .services.media import media_url
+    app.jinja_env.globals['media_url'] = media_url
     
     return app
\ No newline at end of file
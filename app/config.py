@@ -6,6 +6,15 @@ Configurazione semplificata per l'applicazione Flask
 import os
 from pathlib import Path
 
+def parse_libraries(value):
+    """'nome=/percorso,altro=/percorso' -> {'nome': '/percorso', 'altro': '/percorso'}"""
+    libraries = {}
+    for item in (value or '').split(','):
+        name, _, path = item.partition('=')
+        if name.strip() and path.strip():
+            libraries[name.strip()] = path.strip()
+    return libraries
+
 class Config:
     """Configurazione base dell'applicazione Flask"""
     
@@ -27,11 +36,64 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'svg'}
     
+    # Media: URL con fingerprint servite con Cache-Control immutable.
+    # MEDIA_OFFLOAD: '' (Flask legge il file), 'x-accel-redirect' (nginx) o 'x-sendfile'
+    MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+    MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD', '')
+    MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/_protected_media/')
+    
+    # Compressione risposte (gzip, brotli se installato) sopra COMPRESS_MIN_SIZE byte
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', '1') == '1'
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_BR_QUALITY = 5
+    
+    # Runtime: atlas sprite per pagina (una sola immagine per tutte le carte)
+    RUNTIME_ATLAS = os.environ.get('RUNTIME_ATLAS', '0') == '1'
+    ATLAS_DIR = MEDIA_DIR / '_atlas'
+    
+    # Elaborazione immagini: slot CPU condivisi tra worker e import (file lock).
+    # Oltre IMAGE_QUEUE_TIMEOUT secondi di attesa gli upload ricevono 503 + Retry-After.
+    IMAGE_WORKER_SLOTS = int(os.environ.get('IMAGE_WORKER_SLOTS', max(1, (os.cpu_count() or 2) - 1)))
+    IMAGE_RESERVED_SLOTS = 1  # riservati agli upload singoli (interattivi)
+    IMAGE_QUEUE_TIMEOUT = 2.0
+    IMAGE_RETRY_AFTER = 5
+    IMAGE_SLOTS_DIR = Path(os.environ.get('IMAGE_SLOTS_DIR', BASE_DIR / '.image_slots'))
+    
+    # Decodifica a memoria limitata: i pixel decodificati (dopo la riduzione JPEG
+    # in decodifica) non superano IMAGE_MEMORY_CEILING_MB a 4 byte per pixel
+    IMAGE_MEMORY_CEILING_MB = int(os.environ.get('IMAGE_MEMORY_CEILING_MB', 64))
+    MAX_IMAGE_PIXELS = IMAGE_MEMORY_CEILING_MB * 1024 * 1024 // 4
+    
+    # Librerie di simboli in sola lettura indicizzate sul posto (python index_library.py)
+    PICTOGRAM_LIBRARIES = parse_libraries(os.environ.get('PICTOGRAM_LIBRARIES', ''))
+    LIBRARY_CACHE_DIR = MEDIA_DIR / '_library'  # derivati generati al primo accesso
+    LIBRARY_MAX_AGE = 60 * 60
+    
+    # Runtime: aggiornamenti live via SSE (/books/<id>/events)
+    SSE_HEARTBEAT = 15      # secondi tra i ping sulle connessioni inattive
+    SSE_MAX_DURATION = 300  # poi il browser si riconnette (EventSource)
+    # Stream aperti per worker (0 = nessun limite); gunicorn.conf.py lo imposta con gthread
+    SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 0))
+    
+    # Anteprima bozze dei libri pubblicati: durata dei link firmati (secondi)
+    DRAFT_PREVIEW_MAX_AGE = int(os.environ.get('DRAFT_PREVIEW_MAX_AGE', 12 * 3600))
+    
+    # Sweeper media: file più recenti esclusi (upload o import non ancora salvati)
+    MEDIA_SWEEP_MIN_AGE = int(os.environ.get('MEDIA_SWEEP_MIN_AGE', 3600))
+    # Scansione completata riusata (report e poi --delete) solo per questi secondi
+    MEDIA_SWEEP_MAX_SCAN_AGE = int(os.environ.get('MEDIA_SWEEP_MAX_SCAN_AGE', 3600))
+    
+    # Statistiche dei tocchi: buffer in memoria per worker, scritto a blocchi
+    TAP_BUFFER_SIZE = 10000    # tocchi in attesa oltre i quali i nuovi sono scartati
+    TAP_FLUSH_SIZE = 500       # scrittura anticipata oltre questi tocchi in attesa
+    TAP_FLUSH_INTERVAL = 5.0   # secondi tra le scritture
+    
     # CORS settings (per development)
     CORS_ORIGINS = ['http://localhost:3000', 'http://localhost:5000']
     
-    def __init__(self):
-        # Crea cartelle necessarie
+    def ensure_directories(self):
+        """Crea le cartelle necessarie (chiamato da create_app, non all'import)"""
         self.MEDIA_DIR.mkdir(parents=True, exist_ok=True)
         self.STATIC_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -3,10 +3,149 @@ Database module for Flask app
 Setup database SQLAlchemy completo e autonomo
 """
 
-from sqlalchemy import create_engine
+import sqlite3
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.schema import CreateTable
 from .config import config
 
+# Versione dello schema: incrementare quando cambiano tabelle/colonne.
+# Su SQLite viene salvata in PRAGMA user_version, così all'avvio non serve
+# eseguire create_all (DDL + reflection) se il database è già aggiornato.
+SCHEMA_VERSION = 16
+
+def _rebuild_sqlite_tables(*table_names):
+    """Migrazione SQLite che ricrea le tabelle dallo schema attuale dei modelli
+    (SQLite non permette di modificare i vincoli FOREIGN KEY di una tabella esistente).
+    Procedura standard: nuova tabella, copia dei dati, drop, rename.
+    I trigger sono eliminati prima e ricreati dopo (il rename li verifica e il drop li elimina).
+    """
+    def migrate(conn):
+        triggers = conn.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")).all()
+        for trigger_name, _ in triggers:
+            conn.execute(text(f'DROP TRIGGER "{trigger_name}"'))
+        for name in table_names:
+            if not inspect(conn).has_table(name):
+                continue  # verrà creata da create_all
+            table = Base.metadata.tables[name]
+            existing = {column['name'] for column in inspect(conn).get_columns(name)}
+            columns = ", ".join(f'"{column.name}"' for column in table.columns if column.name in existing)
+            ddl = str(CreateTable(table).compile(dialect=conn.dialect)).strip()
+            ddl = ddl.replace(f"CREATE TABLE {name} (", f"CREATE TABLE _new_{name} (", 1)
+            conn.execute(text(ddl))
+            conn.execute(text(f"INSERT INTO _new_{name} ({columns}) SELECT {columns} FROM {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+            conn.execute(text(f"ALTER TABLE _new_{name} RENAME TO {name}"))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        for _, sql in triggers:
+            conn.execute(text(sql))
+    return migrate
+
+def _gap_page_order(conn):
+    """Indice (book_id, order) e chiavi d'ordine a intervalli (page_order.ORDER_GAP = 1024).
+    Rinumera le pagine di ogni libro mantenendo l'ordine attuale (pareggi per id).
+    """
+    if not inspect(conn).has_table("page"):
+        return  # verrà creata da create_all
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_page_book_order ON page (book_id, "order")'))
+    rows = conn.execute(text('SELECT id, book_id FROM page ORDER BY book_id, "order", id')).all()
+    updates, book_id, position = [], None, 0
+    for page_id, page_book_id in rows:
+        position = position + 1 if page_book_id == book_id else 1
+        book_id = page_book_id
+        updates.append({"id": page_id, "order": position * 1024})
+    if updates:
+        conn.execute(text('UPDATE page SET "order" = :order WHERE id = :id'), updates)
+
+def _usage_triggers(conn):
+    """Indici, trigger che mantengono Asset.usage_count (definiti con il modello Card)
+    e conteggio iniziale delle carte esistenti
+    """
+    if not inspect(conn).has_table("asset"):
+        return  # verrà creata da create_all
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_asset_usage_count ON asset (usage_count, id)"))
+    if not inspect(conn).has_table("card"):
+        return  # trigger creati con la tabella card da create_all
+    from .models.card import USAGE_TRIGGERS
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_card_image_id ON card (image_id)"))
+    for trigger in USAGE_TRIGGERS:
+        conn.execute(text(trigger))
+    conn.execute(text("UPDATE asset SET usage_count = (SELECT COUNT(*) FROM card WHERE card.image_id = asset.id)"))
+
+def _label_search(conn):
+    """Indice full-text delle etichette (app.models.search_index) popolato dai dati esistenti"""
+    if not all(inspect(conn).has_table(name) for name in ("book", "page", "card")):
+        return  # creato da create_all
+    from .models.search_index import rebuild_search_index
+    rebuild_search_index(conn)
+
+def _snapshot_search(conn):
+    """Indice FTS5 delle versioni pubblicate, popolato dagli snapshot esistenti
+    (trigger di book_search ricreato: elimina anche le righe degli snapshot)
+    """
+    if not all(inspect(conn).has_table(name) for name in ("book", "page_snapshot")):
+        return  # creato da create_all
+    from .models.search_index import create_search_index
+    from .services.publish import index_snapshots
+    conn.execute(text("DROP TRIGGER IF EXISTS book_search_delete"))
+    create_search_index(conn)
+    for book_id in conn.execute(text("SELECT DISTINCT book_id FROM page_snapshot")).scalars().all():
+        index_snapshots(conn, book_id)
+
+def _add_column(table_name, column_name, ddl):
+    """ALTER TABLE ... ADD COLUMN se la tabella esiste e la colonna manca"""
+    def migrate(conn):
+        if not inspect(conn).has_table(table_name):
+            return  # verrà creata da create_all
+        if column_name not in {column['name'] for column in inspect(conn).get_columns(table_name)}:
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl}"))
+    return migrate
+
+# Migrazioni per database esistenti: versione -> statement SQL o funzioni(conn).
+# I database nuovi vengono creati direttamente da create_all.
+MIGRATIONS = {
+    2: ["CREATE INDEX IF NOT EXISTS ix_asset_url ON asset (url)"],
+    # ON DELETE CASCADE / SET NULL sulle foreign key di book, page e card
+    3: [_rebuild_sqlite_tables("book", "page", "card")],
+    4: [_gap_page_order],
+    # 5: tabella change_log (creata da create_all)
+    # 6: libri pubblicati (tabella page_snapshot creata da create_all)
+    6: [_add_column("book", "published_at", "FLOAT")],
+    7: [_add_column("asset", "phash", "VARCHAR(16)")],
+    # 8: librerie di simboli (tabella library_file creata da create_all)
+    8: [_add_column("asset", "keywords", "TEXT")],
+    9: [
+        _add_column("asset", "width", "INTEGER"),
+        _add_column("asset", "height", "INTEGER"),
+        _add_column("asset", "byte_size", "INTEGER"),
+        _add_column("asset", "content_hash", "VARCHAR(64)"),
+        _add_column("asset", "derivatives", "INTEGER NOT NULL DEFAULT 0"),
+    ],
+    10: [
+        _add_column("asset", "usage_count", "INTEGER NOT NULL DEFAULT 0"),
+        _usage_triggers,
+    ],
+    11: [_label_search],
+    # 12: statistiche dei tocchi (tabella card_tap_count creata da create_all)
+    13: [
+        _add_column("page", "version", "INTEGER NOT NULL DEFAULT 1"),
+        _add_column("card", "version", "INTEGER NOT NULL DEFAULT 1"),
+    ],
+    14: [_add_column("change_log", "page_id", "INTEGER")],
+    15: [_add_column("page", "slot_version", "INTEGER NOT NULL DEFAULT 1")],
+    16: [_snapshot_search],
+}
+
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite applica le foreign key (e quindi ON DELETE) solo se abilitate per connessione"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 # Configura engine database
 engine = create_engine(
     config.SQLALCHEMY_DATABASE_URI,
@@ -17,17 +156,58 @@ engine = create_engine(
 # Session factory
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+def dispose_engine():
+    """Scarta le connessioni ereditate dal processo padre dopo un fork
+    (gunicorn con preload_app): ogni worker apre le proprie connessioni.
+    close=False evita di chiudere le connessioni ancora usate dal master.
+    """
+    engine.dispose(close=False)
+
 class Base(DeclarativeBase):
     """Base class per tutti i modelli SQLAlchemy"""
     pass
 
-def init_db():
-    """Inizializza il database creando tutte le tabelle"""
+def get_schema_version(bind=None):
+    """Legge la versione dello schema salvata nel database (None se non supportata)"""
+    bind = bind or engine
+    if bind.dialect.name != "sqlite":
+        return None
+    with bind.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+def init_db(bind=None):
+    """Inizializza il database creando tutte le tabelle.
+    Se la versione salvata coincide con SCHEMA_VERSION non esegue alcun DDL.
+    """
+    bind = bind or engine
+    current = get_schema_version(bind)
+    if current == SCHEMA_VERSION:
+        return
+    
     # Import tutti i modelli per assicurarsi che siano registrati
-    from .models import book, page, card, asset  # noqa
+    from .models import book, page, card, asset, change, page_snapshot, library_file, search_index, card_tap  # noqa
+    
+    # Database esistente (user_version 0 = creato prima del versioning, schema 1)
+    if current is not None and inspect(bind).has_table("book"):
+        with bind.connect() as conn:
+            # Le ricostruzioni di tabelle richiedono le foreign key disattivate
+            # (il PRAGMA non ha effetto dentro una transazione)
+            conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            for version in range(max(current, 1) + 1, SCHEMA_VERSION + 1):
+                for statement in MIGRATIONS.get(version, []):
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(text(statement))
+            conn.commit()
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+    
+    # Crea tutte le tabelle (solo quelle mancanti)
+    Base.metadata.create_all(bind=bind)
     
-    # Crea tutte le tabelle
-    Base.metadata.create_all(bind=engine)
+    if bind.dialect.name == "sqlite":
+        with bind.begin() as conn:
+            conn.execute(text(f"PRAGMA user_version = {int(SCHEMA_VERSION)}"))
 
 def get_db():
     """
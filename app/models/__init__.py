@@ -7,6 +7,11 @@ from .book import Book
 from .page import Page  
 from .card import Card
 from .asset import Asset
+from .change import Change
+from .page_snapshot import PageSnapshot
+from .library_file import LibraryFile
+from .card_tap import CardTapCount
+from . import search_index  # noqa: F401  (indice FTS5 e trigger, creati con le tabelle)
 
 # Re-export per uso nell'app
-__all__ = ['Book', 'Page', 'Card', 'Asset']
\ No newline at end of file
+__all__ = ['Book', 'Page', 'Card', 'Asset', 'Change', 'PageSnapshot', 'LibraryFile', 'CardTapCount']
\ No newline at end of file
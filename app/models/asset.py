@@ -1,14 +1,56 @@
-from sqlalchemy import Integer, String
+from sqlalchemy import Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from ..db import Base
 
+def normalize_media_url(url: str | None) -> str:
+    """Normalize a stored asset url (see Asset.normalized_url).
+    Usable on raw column values without loading Asset instances.
+    """
+    if not url:
+        return ""
+    url = url.strip()
+    # Symbol libraries indexed in place (app.services.library)
+    if url.startswith("library/"):
+        return "/assets/" + url
+    # Absolute or data URLs pass through
+    if url.startswith("http://") or url.startswith("https://") or url.startswith("data:"):
+        return url
+    # Already a full static path
+    if url.startswith("/static/"):
+        return url
+    # '/media/...' -> '/static/media/...'
+    if url.startswith("/media/"):
+        return "/static" + url
+    # 'media/...' -> '/static/media/...'
+    if url.startswith("media/"):
+        return "/static/" + url
+    # plain filename or other relative -> assume static/media
+    return "/static/media/" + url.lstrip("/")
+
+# Bit di Asset.derivatives per i derivati JPEG generati all'upload (<nome>_<size>.jpg)
+DERIVATIVE_BITS = {"thumbnail": 1, "medium": 2, "large": 4}
+
 class Asset(Base):
     __tablename__ = "asset"
+    # Ordinamento "più usati" dall'indice, senza contare le carte
+    __table_args__ = (Index("ix_asset_usage_count", "usage_count", "id"),)
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     kind: Mapped[str] = mapped_column(String, nullable=False)  # 'image'
-    url: Mapped[str] = mapped_column(String, nullable=False)
+    url: Mapped[str] = mapped_column(String, nullable=False, index=True)
     alt: Mapped[str | None] = mapped_column(String, nullable=True)
+    # dHash 64 bit esadecimale per i quasi-duplicati (app.services.similarity)
+    phash: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    # Parole chiave per la ricerca (metadati delle librerie di simboli)
+    keywords: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Metadati intrinseci salvati all'upload: nessun accesso al disco per leggerli
+    width: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    height: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    byte_size: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)  # sha256 esadecimale
+    derivatives: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # Carte che usano l'asset, mantenuto dai trigger su card (app.models.card)
+    usage_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     cards = relationship("Card", back_populates="image")
@@ -19,23 +61,21 @@ class Asset(Base):
         Handles values like 'media/uuid.jpg', '/media/uuid.jpg',
         '/static/media/uuid.jpg', absolute http(s), or data URLs.
         """
-        if not self.url:
-            return ""
-        url = self.url.strip()
-        # Absolute or data URLs pass through
-        if url.startswith("http://") or url.startswith("https://") or url.startswith("data:"):
-            return url
-        # Already a full static path
-        if url.startswith("/static/"):
-            return url
-        # '/media/...' -> '/static/media/...'
-        if url.startswith("/media/"):
-            return "/static" + url
-        # 'media/...' -> '/static/media/...'
-        if url.startswith("media/"):
-            return "/static/" + url
-        # plain filename or other relative -> assume static/media
-        return "/static/media/" + url.lstrip("/")
+        return normalize_media_url(self.url)
+
+    def has_derivative(self, size_name: str) -> bool:
+        return bool((self.derivatives or 0) & DERIVATIVE_BITS.get(size_name, 0))
+
+    def derivative_url(self, size_name: str) -> str:
+        """URL del derivato size_name se disponibile, altrimenti dell'originale.
+        Usa solo le colonne della riga (nessuna verifica su disco).
+        """
+        url = self.normalized_url
+        if url.startswith("/assets/library/"):
+            return f"{url}?size={size_name}"  # generato al primo accesso
+        if url.startswith("/static/media/") and self.has_derivative(size_name):
+            return f"{url.rsplit('.', 1)[0]}_{size_name}.jpg"
+        return url
 
     def __repr__(self):
         return f"<Asset(id={self.id}, kind='{self.kind}', url='{self.url}')>"
\ No newline at end of file
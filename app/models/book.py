@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, ForeignKey
+from sqlalchemy import Float, Integer, String, ForeignKey
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from ..db import Base
 
@@ -8,10 +8,13 @@ class Book(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     title: Mapped[str] = mapped_column(String, nullable=False)
     locale: Mapped[str] = mapped_column(String, default="it-IT")
-    home_page_id: Mapped[int | None] = mapped_column(ForeignKey("page.id"), nullable=True)
+    home_page_id: Mapped[int | None] = mapped_column(ForeignKey("page.id", ondelete="SET NULL"), nullable=True)
+    # Ultima pubblicazione (timestamp): se valorizzato il runtime legge page_snapshot
+    published_at: Mapped[float | None] = mapped_column(Float, nullable=True)
     
     # Relationships
-    pages = relationship("Page", back_populates="book", foreign_keys="Page.book_id", cascade="all, delete-orphan")
+    # passive_deletes: pagine e carte sono eliminate dal database (ON DELETE CASCADE)
+    pages = relationship("Page", back_populates="book", foreign_keys="Page.book_id", cascade="all, delete-orphan", passive_deletes=True, order_by="[Page.order, Page.id]")
     home_page = relationship("Page", foreign_keys="Book.home_page_id", post_update=True)
     
     def __repr__(self):
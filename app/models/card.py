@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, ForeignKey
+from sqlalchemy import DDL, Integer, String, ForeignKey, event
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from ..db import Base
 
@@ -6,7 +6,7 @@ class Card(Base):
     __tablename__ = "card"
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    page_id: Mapped[int] = mapped_column(ForeignKey("page.id"), nullable=False)
+    page_id: Mapped[int] = mapped_column(ForeignKey("page.id", ondelete="CASCADE"), nullable=False)
     slot_row: Mapped[int] = mapped_column(Integer, nullable=False)
     slot_col: Mapped[int] = mapped_column(Integer, nullable=False)
     row_span: Mapped[int] = mapped_column(Integer, default=1)
@@ -15,8 +15,11 @@ class Card(Base):
     background_color: Mapped[str] = mapped_column(String, default="#FFFFFF")
     border_color: Mapped[str] = mapped_column(String, default="#000000")
     action_type: Mapped[str] = mapped_column(String, default="none")
-    image_id: Mapped[int | None] = mapped_column(ForeignKey("asset.id"), nullable=True)
-    target_page_id: Mapped[int | None] = mapped_column(ForeignKey("page.id"), nullable=True)
+    image_id: Mapped[int | None] = mapped_column(ForeignKey("asset.id"), nullable=True, index=True)
+    target_page_id: Mapped[int | None] = mapped_column(ForeignKey("page.id", ondelete="SET NULL"), nullable=True)
+    # Versione per il controllo di concorrenza ottimistico (app.services.concurrency)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
     
     # Relationships
     page = relationship("Page", back_populates="cards", foreign_keys="Card.page_id")
@@ -51,4 +54,35 @@ class Card(Base):
         self.slot_row = value
     
     def __repr__(self):
-        return f"<Card(id={self.id}, label='{self.label}', page_id={self.page_id})>"
\ No newline at end of file
+        return f"<Card(id={self.id}, label='{self.label}', page_id={self.page_id})>"
+
+
+# Asset.usage_count mantenuto dal database nella stessa transazione della modifica:
+# vale per ORM, statement Core (duplicazione libri) e ON DELETE CASCADE da pagine e libri.
+USAGE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS card_usage_insert AFTER INSERT ON card
+    WHEN NEW.image_id IS NOT NULL
+    BEGIN
+        UPDATE asset SET usage_count = usage_count + 1 WHERE id = NEW.image_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS card_usage_delete AFTER DELETE ON card
+    WHEN OLD.image_id IS NOT NULL
+    BEGIN
+        UPDATE asset SET usage_count = usage_count - 1 WHERE id = OLD.image_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS card_usage_update AFTER UPDATE OF image_id ON card
+    WHEN OLD.image_id IS NOT NEW.image_id
+    BEGIN
+        UPDATE asset SET usage_count = usage_count - 1 WHERE id = OLD.image_id;
+        UPDATE asset SET usage_count = usage_count + 1 WHERE id = NEW.image_id;
+    END
+    """,
+]
+
+for _trigger in USAGE_TRIGGERS:
+    event.listen(Card.__table__, "after_create", DDL(_trigger).execute_if(dialect="sqlite"))
@@ -0,0 +1,18 @@
+from sqlalchemy import Float, ForeignKey, Index, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+from ..db import Base
+
+class CardTapCount(Base):
+    """Tocchi delle carte nel runtime, aggregati per carta (vedi app.services.tap_analytics).
+    Eliminato con la carta; l'indice (book_id, count) dà le carte più usate di un libro.
+    """
+    __tablename__ = "card_tap_count"
+    __table_args__ = (Index("ix_card_tap_count_book", "book_id", "count"),)
+    
+    card_id: Mapped[int] = mapped_column(ForeignKey("card.id", ondelete="CASCADE"), primary_key=True)
+    book_id: Mapped[int] = mapped_column(ForeignKey("book.id", ondelete="CASCADE"), nullable=False)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_tapped_at: Mapped[float] = mapped_column(Float, nullable=False)  # epoch secondi
+    
+    def __repr__(self):
+        return f"<CardTapCount(card_id={self.card_id}, book_id={self.book_id}, count={self.count})>"
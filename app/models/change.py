@@ -0,0 +1,27 @@
+import time
+from sqlalchemy import Float, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+from ..db import Base
+
+class Change(Base):
+    """Registro delle modifiche per la sincronizzazione incrementale dei client.
+    L'id crescente è la versione: per un libro contano le righe con il suo
+    book_id (la modifica di un asset ha una riga per ogni libro che lo usa).
+    """
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_book", "book_id", "id"),
+        Index("ix_change_log_entity", "entity", "entity_id"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    book_id: Mapped[int | None] = mapped_column(Integer, nullable=True)  # niente FK: sopravvive al libro
+    # Pagina toccata (eventi SSE del runtime); NULL = modifica a livello di libro
+    page_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    entity: Mapped[str] = mapped_column(String, nullable=False)  # 'book', 'page', 'card', 'asset'
+    entity_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    op: Mapped[str] = mapped_column(String, nullable=False)  # 'insert', 'update', 'delete'
+    created_at: Mapped[float] = mapped_column(Float, nullable=False, default=time.time)
+    
+    def __repr__(self):
+        return f"<Change(id={self.id}, {self.entity}:{self.entity_id} {self.op}, book_id={self.book_id})>"
@@ -0,0 +1,22 @@
+from sqlalchemy import BigInteger, ForeignKey, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+from ..db import Base
+
+class LibraryFile(Base):
+    """Manifest di una libreria di simboli indicizzata sul posto (vedi app.services.library).
+    mtime/size del file e del JSON di metadati: una nuova scansione rielabora
+    solo i file cambiati.
+    """
+    __tablename__ = "library_file"
+    __table_args__ = (Index("ix_library_file_path", "library", "path", unique=True),)
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    library: Mapped[str] = mapped_column(String, nullable=False)
+    path: Mapped[str] = mapped_column(String, nullable=False)  # relativo alla radice della libreria
+    mtime_ns: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    meta_mtime_ns: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)  # 0 = nessun JSON
+    asset_id: Mapped[int] = mapped_column(ForeignKey("asset.id", ondelete="CASCADE"), nullable=False)
+    
+    def __repr__(self):
+        return f"<LibraryFile(library='{self.library}', path='{self.path}', asset_id={self.asset_id})>"
@@ -1,21 +1,31 @@
-from sqlalchemy import Integer, String, ForeignKey
+from sqlalchemy import Integer, String, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from ..db import Base
 
 class Page(Base):
     __tablename__ = "page"
+    # Liste di navigazione e riordino: pagine di un libro in ordine
+    __table_args__ = (Index("ix_page_book_order", "book_id", "order"),)
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    book_id: Mapped[int] = mapped_column(ForeignKey("book.id"), nullable=False)
+    book_id: Mapped[int] = mapped_column(ForeignKey("book.id", ondelete="CASCADE"), nullable=False)
     title: Mapped[str] = mapped_column(String, nullable=False)
     grid_cols: Mapped[int] = mapped_column(Integer, default=3)
     grid_rows: Mapped[int] = mapped_column(Integer, default=3)
+    # Chiave di ordinamento a intervalli (vedi app.services.page_order)
     order: Mapped[int] = mapped_column(Integer, default=0)
+    # Versione per il controllo di concorrenza ottimistico (app.services.concurrency)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
+    # Occupazione degli slot (nuove carte, spostamenti): CAS separato da version,
+    # così chi ha aperto il form della pagina non va in conflitto per una carta aggiunta
+    slot_version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
     
     # Relationships
     book = relationship("Book", back_populates="pages", foreign_keys="Page.book_id")
-    cards = relationship("Card", back_populates="page", foreign_keys="Card.page_id", cascade="all, delete-orphan")
-    target_cards = relationship("Card", foreign_keys="Card.target_page_id", back_populates="target_page")
+    # passive_deletes: carte eliminate (CASCADE) e target_page_id azzerato (SET NULL) dal database
+    cards = relationship("Card", back_populates="page", foreign_keys="Card.page_id", cascade="all, delete-orphan", passive_deletes=True)
+    target_cards = relationship("Card", foreign_keys="Card.target_page_id", back_populates="target_page", passive_deletes=True)
     
     def __repr__(self):
         return f"<Page(id={self.id}, title='{self.title}', book_id={self.book_id})>"
\ No newline at end of file
@@ -0,0 +1,23 @@
+from sqlalchemy import Boolean, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from ..db import Base
+
+class PageSnapshot(Base):
+    """Pagina pubblicata, denormalizzata per il runtime (vedi app.services.publish).
+    page_id senza foreign key: una pagina eliminata nelle bozze resta visibile
+    fino alla pubblicazione successiva.
+    """
+    __tablename__ = "page_snapshot"
+    __table_args__ = (Index("ix_page_snapshot_book_position", "book_id", "position"),)
+    
+    page_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    book_id: Mapped[int] = mapped_column(ForeignKey("book.id", ondelete="CASCADE"), nullable=False)
+    position: Mapped[int] = mapped_column(Integer, nullable=False)  # 1-based
+    is_home: Mapped[bool] = mapped_column(Boolean, default=False)
+    title: Mapped[str] = mapped_column(String, nullable=False)
+    grid_cols: Mapped[int] = mapped_column(Integer, default=3)
+    grid_rows: Mapped[int] = mapped_column(Integer, default=3)
+    data: Mapped[str] = mapped_column(Text, nullable=False)  # JSON: carte, navigazione, prefetch
+    
+    def __repr__(self):
+        return f"<PageSnapshot(page_id={self.page_id}, book_id={self.book_id}, position={self.position})>"
@@ -0,0 +1,151 @@
+"""
+Indice full-text (SQLite FTS5) su Card.label, Page.title e Book.title
+Tabelle virtuali, non modelli ORM: rowid = id dell'entità, la colonna book
+contiene l'id del libro come token per filtrare nella stessa MATCH.
+Mantenute dai trigger nella transazione della modifica (ORM, Core e ON DELETE
+CASCADE); interrogate da app.services.label_search.
+
+snapshot_card_search e snapshot_page_search indicizzano le versioni pubblicate
+(page_snapshot): riscritte da publish_book nella transazione della pubblicazione,
+con pagina, immagine e percorso dalla home già risolti (colonne UNINDEXED).
+"""
+
+from sqlalchemy import DDL, column, event, table, text
+from ..db import Base
+
+TOKENIZE = "unicode61 remove_diacritics 2"
+# Indici dei prefissi di 1-3 caratteri: typeahead senza scansione dei termini
+PREFIX = "1 2 3"
+
+card_search = table("card_search", column("rowid"), column("label"), column("book"), column("rank"), column("card_search"))
+page_search = table("page_search", column("rowid"), column("title"), column("book"), column("rank"), column("page_search"))
+book_search = table("book_search", column("rowid"), column("title"), column("rank"), column("book_search"))
+snapshot_card_search = table(
+    "snapshot_card_search", column("rowid"), column("label"), column("book"), column("page_id"),
+    column("page_title"), column("image_url"), column("content_hash"), column("path"),
+    column("rank"), column("snapshot_card_search"),
+)
+snapshot_page_search = table(
+    "snapshot_page_search", column("rowid"), column("title"), column("book"), column("path"),
+    column("rank"), column("snapshot_page_search"),
+)
+
+SEARCH_TABLES = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS card_search USING fts5(label, book, tokenize='{TOKENIZE}', prefix='{PREFIX}')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS page_search USING fts5(title, book, tokenize='{TOKENIZE}', prefix='{PREFIX}')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS book_search USING fts5(title, tokenize='{TOKENIZE}', prefix='{PREFIX}')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS snapshot_card_search USING fts5("
+    "label, book, page_id UNINDEXED, page_title UNINDEXED, image_url UNINDEXED, content_hash UNINDEXED, "
+    f"path UNINDEXED, tokenize='{TOKENIZE}', prefix='{PREFIX}')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS snapshot_page_search USING fts5("
+    f"title, book, path UNINDEXED, tokenize='{TOKENIZE}', prefix='{PREFIX}')",
+]
+
+# Righe degli snapshot di un libro (:match = 'book : "<id>"'): MATCH sulla colonna book,
+# senza scandire la tabella
+DELETE_SNAPSHOT_SEARCH = [
+    f"DELETE FROM {name} WHERE rowid IN (SELECT rowid FROM {name} WHERE {name} MATCH :match)"
+    for name in ("snapshot_card_search", "snapshot_page_search")
+]
+
+SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS card_search_insert AFTER INSERT ON card
+    BEGIN
+        INSERT INTO card_search (rowid, label, book)
+        VALUES (NEW.id, NEW.label, (SELECT book_id FROM page WHERE id = NEW.page_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS card_search_delete AFTER DELETE ON card
+    BEGIN
+        DELETE FROM card_search WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS card_search_update AFTER UPDATE OF label, page_id ON card
+    BEGIN
+        UPDATE card_search SET label = NEW.label, book = (SELECT book_id FROM page WHERE id = NEW.page_id)
+        WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS page_search_insert AFTER INSERT ON page
+    BEGIN
+        INSERT INTO page_search (rowid, title, book) VALUES (NEW.id, NEW.title, NEW.book_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS page_search_delete AFTER DELETE ON page
+    BEGIN
+        DELETE FROM page_search WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS page_search_update AFTER UPDATE OF title, book_id ON page
+    BEGIN
+        UPDATE page_search SET title = NEW.title, book = NEW.book_id WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS book_search_insert AFTER INSERT ON book
+    BEGIN
+        INSERT INTO book_search (rowid, title) VALUES (NEW.id, NEW.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS book_search_delete AFTER DELETE ON book
+    BEGIN
+        DELETE FROM book_search WHERE rowid = OLD.id;
+        DELETE FROM snapshot_card_search WHERE rowid IN (
+            SELECT rowid FROM snapshot_card_search WHERE snapshot_card_search MATCH 'book : "' || OLD.id || '"'
+        );
+        DELETE FROM snapshot_page_search WHERE rowid IN (
+            SELECT rowid FROM snapshot_page_search WHERE snapshot_page_search MATCH 'book : "' || OLD.id || '"'
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS book_search_update AFTER UPDATE OF title ON book
+    BEGIN
+        UPDATE book_search SET title = NEW.title WHERE rowid = NEW.id;
+    END
+    """,
+]
+
+
+def snapshot_match(book_id):
+    """Espressione MATCH per le righe degli snapshot di un libro"""
+    return f'book : "{int(book_id)}"'
+
+
+def delete_snapshot_search(conn, book_id):
+    """Elimina le righe degli snapshot del libro da snapshot_card_search e snapshot_page_search"""
+    for statement in DELETE_SNAPSHOT_SEARCH:
+        conn.execute(text(statement), {'match': snapshot_match(book_id)})
+
+
+def create_search_index(conn):
+    """Tabelle FTS5 e trigger (idempotente)"""
+    for statement in SEARCH_TABLES + SEARCH_TRIGGERS:
+        conn.execute(text(statement))
+
+
+def rebuild_search_index(conn):
+    """Ricostruisce l'indice dalle tabelle book, page e card"""
+    create_search_index(conn)
+    conn.execute(text("DELETE FROM card_search"))
+    conn.execute(text("DELETE FROM page_search"))
+    conn.execute(text("DELETE FROM book_search"))
+    conn.execute(text(
+        "INSERT INTO card_search (rowid, label, book) "
+        "SELECT card.id, card.label, page.book_id FROM card JOIN page ON page.id = card.page_id"
+    ))
+    conn.execute(text("INSERT INTO page_search (rowid, title, book) SELECT id, title, book_id FROM page"))
+    conn.execute(text("INSERT INTO book_search (rowid, title) SELECT id, title FROM book"))
+    conn.execute(text("INSERT INTO card_search (card_search) VALUES ('optimize')"))
+
+
+# Creato dopo le tabelle (anche con create_all su un database esistente: IF NOT EXISTS)
+for _statement in SEARCH_TABLES + SEARCH_TRIGGERS:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
@@ -0,0 +1,358 @@
+"""
+API JSON di sola lettura per il runtime (client AAC nativi)
+Payload compatti con sparse fieldsets (?fields[card]=label,image_url) e
+codifica MessagePack opzionale (Accept: application/msgpack oppure ?format=msgpack)
+Sincronizzazione incrementale: 'version' di /books/<id> e /books/<id>/changes?since=
+Un libro pubblicato è servito dagli snapshot (app.services.publish): le bozze
+solo con ?draft=<token> di anteprima (app.services.preview).
+"""
+
+import json
+from types import SimpleNamespace
+from flask import Blueprint, request, jsonify, Response
+from sqlalchemy.orm import joinedload
+from app.db import get_db, close_db
+from app.models.book import Book
+from app.models.page import Page
+from app.models.card import Card
+from app.services import change_feed, label_search, preview, tap_analytics
+from app.services.media import media_url
+from app.services.publish import get_snapshot, get_snapshots, snapshot_view
+
+try:
+    import msgpack
+except ImportError:  # dipendenza opzionale (pip install .[api])
+    msgpack = None
+
+api_bp = Blueprint('api', __name__)
+
+API_VERSION = 1
+MSGPACK_MIMETYPE = 'application/msgpack'
+MAX_TAPS_PER_REQUEST = 200
+
+# Campi disponibili per tipo (ordine = ordine nel payload)
+BOOK_FIELDS = ('id', 'title', 'locale', 'home_page_id', 'pages')
+PAGE_FIELDS = ('id', 'title', 'order', 'grid_cols', 'grid_rows', 'cards')
+CARD_FIELDS = (
+    'id', 'label', 'row', 'col', 'row_span', 'col_span',
+    'background_color', 'border_color', 'action_type',
+    'image_url', 'target_page_id', 'target_title',
+)
+
+
+class FieldsetError(ValueError):
+    """Campo richiesto in ?fields[...] non esistente"""
+
+
+def parse_fieldset(kind, allowed):
+    """Legge ?fields[kind]=a,b dalla query string (default: tutti i campi)"""
+    raw = request.args.get(f'fields[{kind}]')
+    if raw is None:
+        return allowed
+    requested = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise FieldsetError(f'Campi non validi per {kind}: {", ".join(unknown)}')
+    return tuple(name for name in allowed if name in requested)
+
+
+def _compact(data, fields):
+    """Solo i campi richiesti, omettendo i valori vuoti per ridurre il payload"""
+    return {name: data[name] for name in fields if data.get(name) is not None}
+
+
+def serialize_card(card, fields, target_titles):
+    data = {
+        'id': card.id,
+        'label': card.label,
+        'row': card.slot_row,
+        'col': card.slot_col,
+        'row_span': card.row_span if card.row_span != 1 else None,
+        'col_span': card.col_span if card.col_span != 1 else None,
+        'background_color': card.background_color,
+        'border_color': card.border_color,
+        'action_type': card.action_type if card.action_type != 'none' else None,
+        'image_url': media_url(card.image) if card.image else None,
+        'target_page_id': card.target_page_id if card.target_page_id in target_titles else None,
+        'target_title': target_titles.get(card.target_page_id),
+    }
+    return _compact(data, fields)
+
+
+def serialize_page(page, fieldsets, target_titles):
+    data = {
+        'id': page.id,
+        'title': page.title,
+        'order': page.order,
+        'grid_cols': page.grid_cols,
+        'grid_rows': page.grid_rows,
+    }
+    if 'cards' in fieldsets['page']:
+        cards = sorted(page.cards, key=lambda c: (c.slot_row, c.slot_col))
+        data['cards'] = [serialize_card(card, fieldsets['card'], target_titles) for card in cards]
+    return _compact(data, fieldsets['page'])
+
+
+def snapshot_page(snapshot):
+    """Pagina pubblicata con gli attributi letti da serialize_page"""
+    view = snapshot_view(snapshot)
+    page = view['current_page']
+    page.order = snapshot.position
+    page.cards = view['cards']
+    return page
+
+
+def wants_msgpack():
+    if request.args.get('format') == 'msgpack':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', MSGPACK_MIMETYPE])
+    return best == MSGPACK_MIMETYPE
+
+
+def api_response(payload, status=200):
+    """Serializza in JSON compatto o MessagePack in base alla richiesta"""
+    if wants_msgpack():
+        if msgpack is None:
+            return api_error('MessagePack non disponibile sul server', 406)
+        response = Response(msgpack.packb(payload, use_bin_type=True), status=status, mimetype=MSGPACK_MIMETYPE)
+    else:
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+        response = Response(body, status=status, mimetype='application/json')
+    response.headers['X-API-Version'] = str(API_VERSION)
+    response.vary.add('Accept')
+    return response
+
+
+def api_error(message, status):
+    response = jsonify({'success': False, 'message': message})
+    response.status_code = status
+    response.headers['X-API-Version'] = str(API_VERSION)
+    return response
+
+
+def _fieldsets():
+    return {
+        'book': parse_fieldset('book', BOOK_FIELDS),
+        'page': parse_fieldset('page', PAGE_FIELDS),
+        'card': parse_fieldset('card', CARD_FIELDS),
+    }
+
+
+@api_bp.route('/books/<int:book_id>')
+def get_book(book_id):
+    """Libro con pagine e carte (una sola query con eager loading; una in più
+    per gli snapshot di un libro pubblicato)
+    """
+    try:
+        fieldsets = _fieldsets()
+    except FieldsetError as e:
+        return api_error(str(e), 400)
+
+    drafts = preview.allows_draft(request.args.get('draft'), book_id)
+    db = get_db()
+    try:
+        # Versione letta nella stessa query del libro (stesso snapshot)
+        query = db.query(Book, change_feed.version_expression(book_id)).filter(Book.id == book_id)
+        if 'pages' in fieldsets['book']:
+            # Pagine in bozza caricate solo se il libro non è pubblicato (o in anteprima)
+            pages = Book.pages if drafts else Book.pages.and_(Book.published_at.is_(None))
+            pages_load = joinedload(pages)
+            if 'cards' in fieldsets['page']:
+                query = query.options(pages_load.joinedload(Page.cards).joinedload(Card.image))
+            else:
+                query = query.options(pages_load)
+        row = query.first()
+        if not row:
+            return api_error('Libro non trovato', 404)
+        book, version = row
+
+        data = {
+            'id': book.id,
+            'title': book.title,
+            'locale': book.locale,
+            'home_page_id': book.home_page_id,
+        }
+        if book.published_at is not None and not drafts:
+            snapshots = get_snapshots(db, book_id)
+            data['home_page_id'] = next((snapshot.page_id for snapshot in snapshots if snapshot.is_home), None)
+            if 'pages' in fieldsets['book']:
+                target_titles = {snapshot.page_id: snapshot.title for snapshot in snapshots}
+                data['pages'] = [serialize_page(snapshot_page(snapshot), fieldsets, target_titles) for snapshot in snapshots]
+        elif 'pages' in fieldsets['book']:
+            pages = sorted(book.pages, key=lambda p: (p.order, p.id))
+            target_titles = {page.id: page.title for page in pages}
+            data['pages'] = [serialize_page(page, fieldsets, target_titles) for page in pages]
+
+        return api_response({'v': API_VERSION, 'version': version, 'book': _compact(data, fieldsets['book'])})
+    finally:
+        close_db(db)
+
+
+@api_bp.route('/books/<int:book_id>/pages/<int:page_id>')
+def get_page(book_id, page_id):
+    """Pagina con carte, URL immagini e pagine target (una sola query; una in più
+    per lo snapshot di un libro pubblicato)
+    """
+    try:
+        fieldsets = _fieldsets()
+    except FieldsetError as e:
+        return api_error(str(e), 400)
+
+    drafts = preview.allows_draft(request.args.get('draft'), book_id)
+    db = get_db()
+    try:
+        query = db.query(Page, Book.published_at).join(Book, Book.id == Page.book_id).filter(
+            Page.id == page_id, Page.book_id == book_id
+        )
+        if 'cards' in fieldsets['page']:
+            # Carte in bozza caricate solo se il libro non è pubblicato (o in anteprima)
+            cards_load = joinedload(Page.cards if drafts else Page.cards.and_(Book.published_at.is_(None)))
+            query = query.options(
+                cards_load.joinedload(Card.image),
+                cards_load.joinedload(Card.target_page),
+            )
+        page, published_at = query.first() or (None, None)
+
+        if not drafts and (page is None or published_at is not None):
+            # Libro pubblicato: la pagina come nell'ultima pubblicazione
+            snapshot = get_snapshot(db, book_id, page_id)
+            if not snapshot:
+                return api_error('Pagina non trovata', 404)
+            page = snapshot_page(snapshot)
+            target_titles = {card.target_page.id: card.target_page.title for card in page.cards if card.target_page}
+            return api_response({'v': API_VERSION, 'page': serialize_page(page, fieldsets, target_titles)})
+        if not page:
+            return api_error('Pagina non trovata', 404)
+
+        target_titles = {}
+        if 'cards' in fieldsets['page']:
+            target_titles = {
+                card.target_page.id: card.target_page.title
+                for card in page.cards
+                if card.target_page and card.target_page.book_id == book_id
+            }
+
+        return api_response({'v': API_VERSION, 'page': serialize_page(page, fieldsets, target_titles)})
+    finally:
+        close_db(db)
+
+
+@api_bp.route('/books/<int:book_id>/changes')
+def get_changes(book_id):
+    """Modifiche del libro successive a ?since=<versione> (una riga per entità).
+    Con reset=true il client deve riscaricare il libro completo.
+    """
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', change_feed.DEFAULT_LIMIT, type=int)
+    if since is None or since < 0:
+        return api_error('Parametro since obbligatorio (versione intera >= 0)', 400)
+
+    db = get_db()
+    try:
+        feed = change_feed.changes_since(db, book_id, since, limit=max(1, min(limit, change_feed.DEFAULT_LIMIT)))
+        if not feed['changes'] and not feed['reset'] and not db.query(Book.id).filter(Book.id == book_id).first():
+            # Libro eliminato: la tombstone è nel feed finché non viene compattata
+            return api_error('Libro non trovato', 404)
+        return api_response({'v': API_VERSION, 'book_id': book_id, **feed})
+    finally:
+        close_db(db)
+
+
+def _serialize_path(path):
+    return [{'id': page_id, 'title': title} for page_id, title in path] if path else None
+
+
+def serialize_search(results, with_book):
+    """Risultati di label_search.search: carte e pagine con il percorso dalla home"""
+    paths = results['paths']
+    book_field = (lambda row: row.book_id) if with_book else (lambda row: None)
+    payload = {
+        'cards': [
+            _compact({
+                'id': card.id,
+                'label': card.label,
+                'book_id': book_field(card),
+                'page_id': card.page_id,
+                'page_title': card.page_title,
+                'image_url': media_url(SimpleNamespace(url=card.image_url, content_hash=card.content_hash))
+                if card.image_url else None,
+                'path': _serialize_path(paths.get(card.page_id)),
+            }, ('id', 'label', 'book_id', 'page_id', 'page_title', 'image_url', 'path'))
+            for card in results['cards']
+        ],
+        'pages': [
+            _compact({
+                'id': page.id,
+                'title': page.title,
+                'book_id': book_field(page),
+                'path': _serialize_path(paths.get(page.id)),
+            }, ('id', 'title', 'book_id', 'path'))
+            for page in results['pages']
+        ],
+    }
+    if with_book:
+        payload['books'] = [{'id': book.id, 'title': book.title} for book in results['books']]
+    return payload
+
+
+def _search_args():
+    return request.args.get('q', '').strip(), request.args.get('limit', label_search.DEFAULT_LIMIT, type=int)
+
+
+@api_bp.route('/books/<int:book_id>/search')
+def search_book(book_id):
+    """Typeahead del runtime: carte e pagine del libro che contengono parole
+    che iniziano con ?q=, con il percorso di pagine dalla home
+    (versione pubblicata; le bozze con ?draft=<token> di anteprima)
+    """
+    query, limit = _search_args()
+    db = get_db()
+    try:
+        drafts = preview.allows_draft(request.args.get('draft'), book_id)
+        results = label_search.search(db, query, book_id=book_id, limit=limit, drafts=drafts)
+        return api_response({'v': API_VERSION, 'q': query, **serialize_search(results, with_book=False)})
+    finally:
+        close_db(db)
+
+
+@api_bp.route('/search')
+def search_all():
+    """Ricerca globale di ?q= in libri, pagine e carte"""
+    query, limit = _search_args()
+    db = get_db()
+    try:
+        results = label_search.search(db, query, limit=limit)
+        return api_response({'v': API_VERSION, 'q': query, **serialize_search(results, with_book=True)})
+    finally:
+        close_db(db)
+
+
+@api_bp.route('/books/<int:book_id>/taps', methods=['POST'])
+def record_taps(book_id):
+    """Tocchi del runtime {"cards": [card_id, ...]} (un elemento per tocco).
+    Solo annotati in memoria: 202 senza scritture sul database.
+    """
+    data = request.get_json(silent=True) or {}
+    card_ids = data.get('cards')
+    if not isinstance(card_ids, list) or not all(isinstance(card_id, int) for card_id in card_ids):
+        return api_error('Campo cards obbligatorio (lista di id di carte)', 400)
+    if len(card_ids) > MAX_TAPS_PER_REQUEST:
+        return api_error(f'Massimo {MAX_TAPS_PER_REQUEST} tocchi per richiesta', 413)
+    accepted = tap_analytics.record_taps(book_id, card_ids)
+    return api_response({'v': API_VERSION, 'accepted': accepted}, 202)
+
+
+@api_bp.route('/books/<int:book_id>/taps')
+def get_taps(book_id):
+    """Carte più toccate del libro (parole frequenti), dai contatori già scritti"""
+    limit = max(1, min(request.args.get('limit', tap_analytics.DEFAULT_TOP, type=int), 100))
+    db = get_db()
+    try:
+        cards = [
+            {'id': card.id, 'label': card.label, 'page_id': card.page_id,
+             'count': card.count, 'last_tapped_at': card.last_tapped_at}
+            for card in tap_analytics.top_cards(db, book_id, limit)
+        ]
+        return api_response({'v': API_VERSION, 'book_id': book_id, 'cards': cards})
+    finally:
+        close_db(db)
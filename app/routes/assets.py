@@ -6,30 +6,40 @@ Gestisce upload, visualizzazione, modifica e eliminazione di asset
 import os
 import uuid
 from werkzeug.utils import secure_filename
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, send_from_directory
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, send_file, make_response
+from sqlalchemy import func, or_
 from sqlalchemy.exc import SQLAlchemyError
-from PIL import Image
 import mimetypes
 from app.db import get_db, close_db
 from app.models.asset import Asset
 from app.models.card import Card
+from app.services.media import send_media, media_url, stored_fingerprint
+from app.services import admission, library, similarity
+from app.services.images import ALLOWED_EXTENSIONS, IMAGE_SIZES, MAX_FILE_SIZE, ImageTooLarge, file_metadata, is_raster, process_image
 
 assets_bp = Blueprint('assets', __name__)
 
-# Configurazioni per upload
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp', 'svg'}
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-IMAGE_SIZES = {
-    'thumbnail': (150, 150),
-    'medium': (400, 400),
-    'large': (800, 800)
-}
-
 def allowed_file(filename):
     """Controlla se il file ha un'estensione permessa"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def process_upload(file_path, priority):
+    """Derivati dell'immagine caricata. Lo slot CPU (attesa massima IMAGE_QUEUE_TIMEOUT)
+    è preso solo attorno a process_image e solo per i raster: SVG e file non
+    leggibili non attendono e non ricevono 503. Solleva ImageTooLarge o admission.Saturated.
+    """
+    if not is_raster(file_path):
+        return None
+    with admission.image_slot(priority, current_app.config.get('IMAGE_QUEUE_TIMEOUT', 2.0)):
+        return process_image(file_path)
+
+def saturated_response(error, body, status=503):
+    """Risposta 503 con Retry-After quando gli slot di elaborazione sono tutti occupati"""
+    response = make_response(body, status)
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 def get_file_info(file):
     """Ottiene informazioni su un file caricato"""
     if not file or not file.filename:
@@ -50,55 +60,6 @@ def get_file_info(file):
         'mimetype': file.mimetype or mimetypes.guess_type(filename)[0]
     }
 
-def process_image(file_path, sizes=None):
-    """Processa un'immagine creando diverse dimensioni"""
-    if not sizes:
-        sizes = IMAGE_SIZES
-    
-    try:
-        with Image.open(file_path) as img:
-            # Converti in RGB se necessario
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            
-            # Ottieni dimensioni originali
-            original_size = img.size
-            
-            # Crea versioni ridimensionate
-            processed_sizes = {'original': original_size}
-            
-            base_path = os.path.splitext(file_path)[0]
-            
-            for size_name, (width, height) in sizes.items():
-                # Ridimensiona mantenendo proporzioni
-                img.thumbnail((width, height), Image.Resampling.LANCZOS)
-                
-                # Salva versione ridimensionata
-                size_path = f"{base_path}_{size_name}.jpg"
-                img.save(size_path, 'JPEG', quality=90, optimize=True)
-                
-                processed_sizes[size_name] = img.size
-                
-                # Ripristina immagine originale per prossimo ridimensionamento
-                img = Image.open(file_path)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                    img = background
-            
-            return processed_sizes
-            
-    except Exception as e:
-        print(f"Errore nel processamento dell'immagine: {e}")
-        return None
-
-
 @assets_bp.route('/assets')
 def list_assets():
     """Lista tutti gli asset disponibili"""
@@ -114,7 +75,10 @@ def list_assets():
         
         # Filtro per ricerca
         if search:
-            query = query.filter(Asset.url.ilike(f'%{search}%'))
+            pattern = f'%{search}%'
+            query = query.filter(or_(
+                Asset.url.ilike(pattern), Asset.alt.ilike(pattern), Asset.keywords.ilike(pattern)
+            ))
         
         # Filtro per tipo file
         if file_type:
@@ -128,13 +92,15 @@ def list_assets():
             order_column = Asset.url
         elif sort_by == 'kind':
             order_column = Asset.kind
+        elif sort_by == 'usage':
+            order_column = Asset.usage_count
         else:  # id
             order_column = Asset.id
         
         if sort_order == 'asc':
-            query = query.order_by(order_column.asc())
+            query = query.order_by(order_column.asc(), Asset.id.asc())
         else:
-            query = query.order_by(order_column.desc())
+            query = query.order_by(order_column.desc(), Asset.id.desc())
         
         # Paginazione
         assets = query.offset((page - 1) * per_page).limit(per_page).all()
@@ -144,6 +110,7 @@ def list_assets():
         stats = {
             'total': db.query(Asset).count(),
             'images': db.query(Asset).filter(Asset.kind.like('image%')).count(),
+            'total_size': db.query(func.coalesce(func.sum(Asset.byte_size), 0)).scalar(),
         }
         
         return render_template('assets/list.html',
@@ -178,6 +145,10 @@ def upload_asset():
             flash('Nessun file selezionato', 'error')
             return redirect(request.url)
         
+        # Gli upload multipli hanno priorità bulk sugli slot CPU
+        priority = admission.PRIORITY_BULK if sum(1 for file in files if file.filename) > 1 else admission.PRIORITY_INTERACTIVE
+        saturated = None
+        
         uploaded_assets = []
         errors = []
         
@@ -208,23 +179,46 @@ def upload_asset():
                 errors.append(f'{file.filename}: File già esistente')
                 continue
             
+            # Slot CPU esauriti: i file rimanenti non sono salvati
+            if saturated:
+                errors.append(f'{file.filename}: non caricato, server occupato')
+                continue
+            
             # Salva file
             file_path = os.path.join(upload_dir, file_info['filename'])
             file.save(file_path)
             
             # Processa immagini se necessario
+            sizes = None
             if file_info['mimetype'] and file_info['mimetype'].startswith('image/'):
                 try:
                     # Processa immagine e crea thumbnail
-                    process_image(file_path)
+                    sizes = process_upload(file_path, priority)
+                except ImageTooLarge as e:
+                    os.remove(file_path)
+                    errors.append(f'{file.filename}: {e}')
+                    continue
+                except admission.Saturated as e:
+                    os.remove(file_path)
+                    saturated = e
+                    errors.append(f'{file.filename}: non caricato, server occupato')
+                    continue
                 except Exception as e:
                     print(f"Errore nel processamento dell'immagine {file.filename}: {e}")
             
+            # Dimensioni, byte, hash del contenuto e derivati salvati sulla riga
+            metadata = file_metadata(file_path, sizes)
+            
+            # Avviso per i quasi-duplicati già presenti nella libreria
+            for distance, similar in similarity.find_similar(db, metadata['phash'], limit=3):
+                errors.append(f'{file.filename}: simile a "{similar.alt or similar.url}" (asset #{similar.id}), caricato comunque')
+            
             # Crea record nel database
             new_asset = Asset(
                 kind=file_info['mimetype'],
                 url=file_info['filename'],
-                alt=file_info['original_filename']
+                alt=file_info['original_filename'],
+                **metadata
             )
             
             db.add(new_asset)
@@ -232,6 +226,8 @@ def upload_asset():
         
         if uploaded_assets:
             db.commit()
+            for asset in uploaded_assets:
+                similarity.register(asset.id, asset.phash)
             flash(f'{len(uploaded_assets)} file caricati con successo!', 'success')
         
         if errors:
@@ -241,6 +237,10 @@ def upload_asset():
         if not uploaded_assets and not errors:
             flash('Nessun file da caricare', 'info')
         
+        if saturated and not uploaded_assets:
+            flash(f'Server occupato nell\'elaborazione di altre immagini: riprova tra {saturated.retry_after} secondi', 'warning')
+            return saturated_response(saturated, render_template('assets/upload.html'))
+        
         return redirect(url_for('assets.list_assets'))
     
     except Exception as e:
@@ -261,12 +261,16 @@ def view_asset(asset_id):
             flash('Asset non trovato', 'error')
             return redirect(url_for('assets.list_assets'))
         
-        # Trova carte che usano questo asset
-        cards_using_asset = db.query(Card).filter_by(image_id=asset_id).all()
+        # Carte che usano questo asset (nessuna query se il contatore è a zero)
+        cards_using_asset = db.query(Card).filter_by(image_id=asset_id).all() if asset.usage_count else []
+        
+        # Quasi-duplicati (hash percettivo)
+        similar_assets = similarity.find_similar(db, asset.phash, exclude=asset.id, limit=12)
         
         return render_template('assets/detail.html',
                              asset=asset,
-                             cards_using_asset=cards_using_asset)
+                             cards_using_asset=cards_using_asset,
+                             similar_assets=similar_assets)
     
     except SQLAlchemyError as e:
         flash(f'Errore database: {str(e)}', 'error')
@@ -330,10 +334,8 @@ def delete_asset(asset_id):
             return redirect(url_for('assets.list_assets'))
         
         # Controlla se è usato da qualche carta
-        cards_using = db.query(Card).filter_by(image_id=asset_id).count()
-        
-        if cards_using > 0:
-            flash(f'Impossibile eliminare: asset usato da {cards_using} carte', 'error')
+        if asset.usage_count > 0:
+            flash(f'Impossibile eliminare: asset usato da {asset.usage_count} carte', 'error')
             return redirect(url_for('assets.view_asset', asset_id=asset_id))
         
         # Elimina file fisico
@@ -352,6 +354,7 @@ def delete_asset(asset_id):
         asset_alt = asset.alt
         db.delete(asset)
         db.commit()
+        similarity.unregister(asset_id)
         
         flash(f'Asset "{asset_alt}" eliminato con successo!', 'success')
         return redirect(url_for('assets.list_assets'))
@@ -398,25 +401,38 @@ def api_upload():
         file.save(file_path)
         
         # Processa immagine
-        width, height = None, None
+        sizes = None
         
         if file_info['mimetype'] and file_info['mimetype'].startswith('image/'):
             try:
-                sizes = process_image(file_path)
-                if sizes:
-                    width, height = sizes['original']
+                sizes = process_upload(file_path, admission.PRIORITY_INTERACTIVE)
+            except ImageTooLarge as e:
+                os.remove(file_path)
+                return jsonify({'success': False, 'message': str(e)}), 413
+            except admission.Saturated as e:
+                os.remove(file_path)
+                return saturated_response(e, jsonify({
+                    'success': False,
+                    'message': 'Server occupato, riprovare più tardi',
+                    'retry_after': e.retry_after,
+                }))
             except Exception as e:
                 print(f"Errore processamento immagine: {e}")
         
+        metadata = file_metadata(file_path, sizes)
+        similar = similarity.find_similar(db, metadata['phash'], limit=5)
+        
         # Crea record
         new_asset = Asset(
             kind=file_info['mimetype'],
             url=file_info['filename'],
-            alt=file_info['original_filename']
+            alt=file_info['original_filename'],
+            **metadata
         )
         
         db.add(new_asset)
         db.commit()
+        similarity.register(new_asset.id, new_asset.phash)
         
         return jsonify({
             'success': True,
@@ -426,8 +442,12 @@ def api_upload():
                 'kind': new_asset.kind,
                 'url': new_asset.url,
                 'alt': new_asset.alt,
+                'width': new_asset.width,
+                'height': new_asset.height,
+                'byte_size': new_asset.byte_size,
                 'full_url': url_for('static', filename=f'media/{new_asset.url}')
-            }
+            },
+            'similar': [serialize_similar(distance, asset) for distance, asset in similar]
         })
     
     except Exception as e:
@@ -437,10 +457,79 @@ def api_upload():
         close_db(db)
 
 
+def serialize_similar(distance, asset):
+    return {'id': asset.id, 'url': media_url(asset), 'alt': asset.alt, 'distance': distance}
+
+
+@assets_bp.route('/assets/api/<int:asset_id>/similar')
+def api_similar(asset_id):
+    """Asset quasi-duplicati (distanza di Hamming del dHash <= ?distance)"""
+    db = get_db()
+    try:
+        asset = db.query(Asset).filter_by(id=asset_id).first()
+        if not asset:
+            return jsonify({'success': False, 'message': 'Asset non trovato'}), 404
+        if not asset.phash:
+            return jsonify({'success': False, 'message': 'Hash percettivo non disponibile per questo asset'}), 409
+        
+        max_distance = request.args.get('distance', similarity.NEAR_DUPLICATE_DISTANCE, type=int)
+        limit = request.args.get('limit', 20, type=int)
+        similar = similarity.find_similar(
+            db, asset.phash, max_distance=max(0, min(max_distance, 16)), exclude=asset.id, limit=max(1, min(limit, 100))
+        )
+        
+        return jsonify({
+            'success': True,
+            'similar': [serialize_similar(distance, other) for distance, other in similar]
+        })
+    finally:
+        close_db(db)
+
+
+@assets_bp.route('/assets/media/<fingerprint>/<path:filename>')
+def serve_media(fingerprint, filename):
+    """Serve un file media con URL immutabile (fingerprint del contenuto)"""
+    db = get_db()
+    try:
+        stored = stored_fingerprint(db, filename)
+    finally:
+        close_db(db)
+    if stored == fingerprint:
+        return send_media(filename, immutable=True)
+    # Asset senza hash salvato (o file non registrato): fingerprint dal file
+    current_url = url_for('assets.serve_media', fingerprint=stored, filename=filename) if stored else media_url(filename)
+    expected = url_for('assets.serve_media', fingerprint=fingerprint, filename=filename)
+    if current_url != expected:
+        if current_url.startswith('/assets/media/'):
+            # Contenuto cambiato: redirect al nuovo URL (non cacheabile)
+            return redirect(current_url)
+        return jsonify({'success': False, 'message': 'File non trovato'}), 404
+    return send_media(filename, immutable=True)
+
+
+@assets_bp.route('/assets/library/<name>/<path:path>')
+def serve_library(name, path):
+    """File di una libreria di simboli in sola lettura.
+    ?size=thumbnail|medium|large genera il derivato al primo accesso.
+    """
+    libraries = current_app.config.get('PICTOGRAM_LIBRARIES', {})
+    size = request.args.get('size')
+    file_path = None
+    if size:
+        try:
+            # Derivato da generare: attesa breve, se saturi si serve l'originale
+            with admission.image_slot(admission.PRIORITY_INTERACTIVE, timeout=0.5):
+                file_path = library.derivative_path(libraries, current_app.config['LIBRARY_CACHE_DIR'], name, path, size)
+        except admission.Saturated:
+            file_path = None
+    file_path = file_path or library.source_path(libraries, name, path)
+    if not file_path or not os.path.isfile(file_path):
+        return jsonify({'success': False, 'message': 'File non trovato'}), 404
+    # Risposte condizionali (ETag/Last-Modified) per le revalidazioni del browser
+    return send_file(file_path, conditional=True, max_age=current_app.config.get('LIBRARY_MAX_AGE', 3600))
+
+
 @assets_bp.route('/assets/<path:filename>')
 def serve_asset(filename):
     """Serve file statici degli asset"""
-    return send_from_directory(
-        os.path.join(current_app.static_folder, 'media'),
-        filename
-    )
+    return send_media(filename)
@@ -1,9 +1,68 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from sqlalchemy import delete, func
+from sqlalchemy.orm import joinedload
 from app.db import get_db, close_db
-from ..models import Book, Page, Card, Asset
+from app.services.atlas import get_page_atlas
+from app.services import change_feed, link_graph, preview
+from app.services.book_copy import duplicate_book
+from app.services.events import stream_events
+from app.services.publish import publish_book, get_snapshot, snapshot_view
+from app.services.link_graph import get_link_graph
+from ..models import Book, Page, Card
 
 books_bp = Blueprint('books', __name__)
 
+def attach_book_stats(db, books):
+    """Calcola numero di pagine e carte per ogni libro con due query aggregate
+    (una per le pagine, una per le carte) invece di una query per pagina.
+    """
+    book_ids = [book.id for book in books]
+    page_counts = {}
+    card_counts = {}
+    if book_ids:
+        page_counts = dict(
+            db.query(Page.book_id, func.count(Page.id))
+            .filter(Page.book_id.in_(book_ids))
+            .group_by(Page.book_id)
+            .all()
+        )
+        card_counts = dict(
+            db.query(Page.book_id, func.count(Card.id))
+            .join(Card, Card.page_id == Page.id)
+            .filter(Page.book_id.in_(book_ids))
+            .group_by(Page.book_id)
+            .all()
+        )
+    for book in books:
+        book.page_count = page_counts.get(book.id, 0)
+        book.total_cards = card_counts.get(book.id, 0)
+    return books
+
+def load_runtime_cards(db, page_id, book_id):
+    """Carte di una pagina runtime con immagini e pagine target nella stessa query.
+    Solo le pagine target dello stesso libro: una target di un altro libro resta
+    None (nessun link nel runtime e nessun lazy load per carta).
+    """
+    return db.query(Card).options(
+        joinedload(Card.image),
+        joinedload(Card.target_page.and_(Page.book_id == book_id))
+    ).filter(
+        Card.page_id == page_id
+    ).all()
+
+def runtime_atlas(page, cards):
+    """Atlas sprite della pagina se abilitato (config RUNTIME_ATLAS o ?atlas=1)"""
+    enabled = request.args.get('atlas', type=int)
+    if enabled is None:
+        enabled = current_app.config.get('RUNTIME_ATLAS', False)
+    if not enabled:
+        return None
+    try:
+        return get_page_atlas(page, cards)
+    except Exception as e:
+        print(f"Errore nella generazione dell'atlas: {e}")
+        return None
+
 @books_bp.route('/')
 def list_books():
     """Lista di tutti i libri con statistiche"""
@@ -11,16 +70,8 @@ def list_books():
     try:
         books = db.query(Book).all()
         
-        # Carica le pagine per ogni libro per mostrare le statistiche
-        for book in books:
-            book.pages = db.query(Page).filter(Page.book_id == book.id).all()
-            
-            # Conta le carte totali per ogni libro
-            total_cards = 0
-            for page in book.pages:
-                cards_count = db.query(Card).filter(Card.page_id == page.id).count()
-                total_cards += cards_count
-            book.total_cards = total_cards
+        # Statistiche pagine/carte per ogni libro
+        attach_book_stats(db, books)
         
         return render_template('books/list.html', books=books)
     finally:
@@ -39,7 +90,10 @@ def view_book(book_id):
         # Ottieni le pagine del libro (se il modello ha questa relazione)
         pages = getattr(book, 'pages', [])
         
-        return render_template('books/detail.html', book=book, pages=pages)
+        # Link di anteprima delle bozze (firmato) per un libro pubblicato
+        draft = preview.draft_token(book.id) if book.published_at is not None else None
+        
+        return render_template('books/detail.html', book=book, pages=pages, draft=draft)
     finally:
         close_db(db)
 
@@ -116,8 +170,13 @@ def delete_book(book_id):
             return redirect(url_for('books.list_books'))
         
         book_title = book.title
-        db.delete(book)
+        
+        # Un solo DELETE: pagine e carte eliminate dal database (ON DELETE CASCADE),
+        # target_page_id delle carte di altri libri azzerato (SET NULL)
+        db.execute(delete(Book).where(Book.id == book_id))
+        change_feed.record(db, 'book', book_id, change_feed.OP_DELETE, book_id)
         db.commit()
+        link_graph.invalidate(book_id=book_id)
         
         flash(f'Libro "{book_title}" eliminato con successo!', 'success')
         return redirect(url_for('books.list_books'))
@@ -129,6 +188,74 @@ def delete_book(book_id):
     finally:
         close_db(db)
 
+@books_bp.route('/<int:book_id>/duplicate', methods=['POST'])
+def duplicate(book_id):
+    """Duplica un libro (pagine e carte; le immagini sono condivise)"""
+    db = get_db()
+    try:
+        title = request.form.get('title', '').strip() or None
+        new_book_id = duplicate_book(db, book_id, title=title)
+        if new_book_id is None:
+            flash('Libro non trovato', 'error')
+            return redirect(url_for('books.list_books'))
+        db.commit()
+        
+        flash('Libro duplicato con successo!', 'success')
+        return redirect(url_for('books.view_book', book_id=new_book_id))
+        
+    except Exception as e:
+        db.rollback()
+        flash(f'Errore nella duplicazione del libro: {str(e)}', 'error')
+        return redirect(url_for('books.view_book', book_id=book_id))
+    finally:
+        close_db(db)
+
+@books_bp.route('/<int:book_id>/publish', methods=['POST'])
+def publish(book_id):
+    """Pubblica lo stato attuale delle bozze per il runtime"""
+    db = get_db()
+    try:
+        published = publish_book(db, book_id)
+        if published is None:
+            flash('Libro non trovato', 'error')
+            return redirect(url_for('books.list_books'))
+        db.commit()
+        
+        flash(f'Libro pubblicato ({published} pagine)', 'success')
+        return redirect(url_for('books.view_book', book_id=book_id))
+        
+    except Exception as e:
+        db.rollback()
+        flash(f'Errore nella pubblicazione del libro: {str(e)}', 'error')
+        return redirect(url_for('books.view_book', book_id=book_id))
+    finally:
+        close_db(db)
+
+def use_snapshots(book):
+    """Runtime dagli snapshot pubblicati (le bozze solo con un token di anteprima valido)"""
+    return book.published_at is not None and preview.request_draft(book) is None
+
+def page_navigation(all_pages, page):
+    """Posizione e pagine precedente/successiva (stesso formato degli snapshot)"""
+    ids = [p.id for p in all_pages]
+    index = ids.index(page.id)
+    return {
+        'position': index + 1,
+        'total': len(ids),
+        'prev_page_id': ids[index - 1] if index > 0 else None,
+        'next_page_id': ids[index + 1] if index + 1 < len(ids) else None,
+    }
+
+def render_snapshot(book, snapshot):
+    """Pagina runtime da uno snapshot pubblicato (nessuna altra query)"""
+    context = snapshot_view(snapshot)
+    return render_template('books/runtime_simple.html',
+                           book=book,
+                           published=True,
+                           draft=None,
+                           atlas=runtime_atlas(context['current_page'], context['cards']),
+                           **context)
+
 @books_bp.route('/<int:book_id>/runtime')
 def runtime_book(book_id):
     """Modalità runtime del libro AAC - visualizzazione end-user"""
@@ -139,6 +266,13 @@ def runtime_book(book_id):
             flash('Libro non trovato', 'error')
             return redirect(url_for('books.list_books'))
         
+        if use_snapshots(book):
+            snapshot = get_snapshot(db, book_id)
+            if not snapshot:
+                flash('La versione pubblicata non ha pagine.', 'warning')
+                return redirect(url_for('books.view_book', book_id=book_id))
+            return render_snapshot(book, snapshot)
+        
         # Trova la home page o la prima pagina
         home_page = None
         if book.home_page_id:
@@ -151,7 +285,7 @@ def runtime_book(book_id):
             # Prendi la prima pagina disponibile
             home_page = db.query(Page).filter(
                 Page.book_id == book_id
-            ).order_by(Page.order.asc()).first()
+            ).order_by(Page.order.asc(), Page.id.asc()).first()
         
         if not home_page:
             flash('Questo libro non ha ancora pagine. Creane una prima di aprirlo.', 'warning')
@@ -160,32 +294,37 @@ def runtime_book(book_id):
         # Ottieni tutte le pagine del libro per la navigazione
         all_pages = db.query(Page).filter(
             Page.book_id == book_id
-        ).order_by(Page.order.asc()).all()
+        ).order_by(Page.order.asc(), Page.id.asc()).all()
         
         # Ottieni le carte della home page con le immagini
-        cards = db.query(Card).filter(
-            Card.page_id == home_page.id
-        ).all()
-        
-        # Carica le immagini e pagine target associate alle carte
-        for card in cards:
-            if card.image_id:
-                card.image = db.query(Asset).filter(
-                    Asset.id == card.image_id
-                ).first()
-            if card.target_page_id:
-                card.target_page = db.query(Page).filter(
-                    Page.id == card.target_page_id,
-                    Page.book_id == book_id
-                ).first()
+        cards = load_runtime_cards(db, home_page.id, book_id)
+        
+        # Hint di prefetch per le pagine raggiungibili dalle carte
+        prefetch_pages, prefetch_images = get_link_graph(db, book_id).prefetch_for(home_page.id)
         
         return render_template('books/runtime_simple.html', 
                              book=book, 
                              current_page=home_page,
-                             all_pages=all_pages,
-                             cards=cards)
+                             nav=page_navigation(all_pages, home_page),
+                             cards=cards,
+                             atlas=runtime_atlas(home_page, cards),
+                             prefetch_pages=prefetch_pages,
+                             prefetch_images=prefetch_images,
+                             draft=preview.request_draft(book))
+    finally:
+        close_db(db)
+
+@books_bp.route('/<int:book_id>/events')
+def runtime_events(book_id):
+    """Stream SSE degli aggiornamenti del libro per il runtime (nessuna sessione tenuta aperta)"""
+    db = get_db()
+    try:
+        if not db.query(Book.id).filter(Book.id == book_id).first():
+            return 'Libro non trovato', 404
     finally:
         close_db(db)
+    
+    return stream_events(book_id, request.headers.get('Last-Event-ID', type=int))
 
 @books_bp.route('/<int:book_id>/runtime/<int:page_id>')
 def runtime_page(book_id, page_id):
@@ -197,6 +336,13 @@ def runtime_page(book_id, page_id):
             flash('Libro non trovato', 'error')
             return redirect(url_for('books.list_books'))
         
+        if use_snapshots(book):
+            snapshot = get_snapshot(db, book_id, page_id)
+            if not snapshot:
+                flash('Pagina non trovata', 'error')
+                return redirect(url_for('books.runtime_book', book_id=book_id))
+            return render_snapshot(book, snapshot)
+        
         page = db.query(Page).filter(
             Page.id == page_id,
             Page.book_id == book_id
@@ -204,34 +350,27 @@ def runtime_page(book_id, page_id):
         
         if not page:
             flash('Pagina non trovata', 'error')
-            return redirect(url_for('books.runtime_book', book_id=book_id))
+            return redirect(url_for('books.runtime_book', book_id=book_id, draft=preview.request_draft(book)))
         
         # Ottieni tutte le pagine del libro per la navigazione
         all_pages = db.query(Page).filter(
             Page.book_id == book_id
-        ).order_by(Page.order.asc()).all()
+        ).order_by(Page.order.asc(), Page.id.asc()).all()
         
         # Ottieni le carte della pagina con le immagini
-        cards = db.query(Card).filter(
-            Card.page_id == page.id
-        ).all()
-        
-        # Carica le immagini e pagine target associate alle carte
-        for card in cards:
-            if card.image_id:
-                card.image = db.query(Asset).filter(
-                    Asset.id == card.image_id
-                ).first()
-            if card.target_page_id:
-                card.target_page = db.query(Page).filter(
-                    Page.id == card.target_page_id,
-                    Page.book_id == book_id
-                ).first()
+        cards = load_runtime_cards(db, page.id, book_id)
+        
+        # Hint di prefetch per le pagine raggiungibili dalle carte
+        prefetch_pages, prefetch_images = get_link_graph(db, book_id).prefetch_for(page.id)
         
         return render_template('books/runtime_simple.html', 
                              book=book, 
                              current_page=page,
-                             all_pages=all_pages,
-                             cards=cards)
+                             nav=page_navigation(all_pages, page),
+                             cards=cards,
+                             atlas=runtime_atlas(page, cards),
+                             prefetch_pages=prefetch_pages,
+                             prefetch_images=prefetch_images,
+                             draft=preview.request_draft(book))
     finally:
-        close_db(db)
\ No newline at end of file
+        close_db(db)
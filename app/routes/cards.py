@@ -5,11 +5,13 @@ Gestisce il CRUD completo delle carte con grid editor
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 from app.db import get_db, close_db
 from app.models.book import Book
 from app.models.page import Page
 from app.models.card import Card
 from app.models.asset import Asset
+from app.services.concurrency import VersionConflict, check_version, claim_slots
 
 cards_bp = Blueprint('cards', __name__)
 
@@ -160,6 +162,14 @@ def create_card(book_id, page_id):
                     flash('Pagina di destinazione non valida', 'error')
                     return redirect(request.url)
         
+        # Slot verificato libero: nessun altro editor deve averlo occupato nel frattempo
+        try:
+            claim_slots(db, page)
+        except VersionConflict:
+            db.rollback()
+            flash('La pagina è stata modificata da un altro utente: controlla la posizione e riprova', 'warning')
+            return redirect(request.url)
+        
         # Crea nuova carta
         new_card = Card(
             label=text,
@@ -204,17 +214,10 @@ def edit_card(book_id, page_id, card_id):
         
         # GET: mostra form di modifica
         if request.method == 'GET':
-            assets = db.query(Asset).order_by(Asset.id.desc()).all()
-            pages = db.query(Page).filter_by(book_id=book_id).order_by(Page.order).all()
-            
-            return render_template('cards/edit.html',
-                                 book=book,
-                                 page=page,
-                                 card=card,
-                                 assets=assets,
-                                 pages=pages)
+            return render_edit_form(db, book, page, card)
         
-        # POST: aggiorna la carta
+        # POST: aggiorna la carta (rifiutata se salvata da altri dopo l'apertura del form)
+        check_version(card, request.form.get('version', type=int))
         text = request.form.get('text', '').strip()
         slot_col = request.form.get('x', type=int)
         slot_row = request.form.get('y', type=int)
@@ -242,6 +245,8 @@ def edit_card(book_id, page_id, card_id):
             if existing_card:
                 flash(f'Posizione ({slot_col}, {slot_row}) già occupata', 'error')
                 return redirect(request.url)
+            
+            claim_slots(db, page)
         
         # Gestione asset immagine
         image_asset_id = request.form.get('image_asset_id', type=int)
@@ -273,6 +278,16 @@ def edit_card(book_id, page_id, card_id):
         flash(f'Carta "{text}" aggiornata con successo!', 'success')
         return redirect(url_for('pages.view_page', book_id=book_id, page_id=page_id))
     
+    except (VersionConflict, StaleDataError):
+        # Salvata da un altro editor: form con lo stato attuale (e la nuova versione)
+        db.rollback()
+        card = db.query(Card).filter_by(id=card_id, page_id=page_id).first()
+        if not card:
+            flash('Carta eliminata da un altro utente', 'error')
+            return redirect(url_for('pages.view_page', book_id=book_id, page_id=page_id))
+        flash('La carta è stata modificata da un altro utente: controlla i valori attuali e salva di nuovo', 'warning')
+        return render_edit_form(db, card.page.book, card.page, card), 409
+    
     except SQLAlchemyError as e:
         db.rollback()
         flash(f'Errore nell\'aggiornamento della carta: {str(e)}', 'error')
@@ -296,6 +311,8 @@ def delete_card(book_id, page_id, card_id):
             flash('Carta non appartiene al libro specificato', 'error')
             return redirect(url_for('books.list_books'))
         
+        # Versione opzionale: non eliminare una carta modificata da altri nel frattempo
+        check_version(card, request.form.get('version', type=int))
         card_text = card.label
         db.delete(card)
         db.commit()
@@ -303,6 +320,11 @@ def delete_card(book_id, page_id, card_id):
         flash(f'Carta "{card_text}" eliminata con successo!', 'success')
         return redirect(url_for('pages.view_page', book_id=book_id, page_id=page_id))
     
+    except (VersionConflict, StaleDataError):
+        db.rollback()
+        flash('La carta è stata modificata da un altro utente: non è stata eliminata', 'warning')
+        return redirect(url_for('cards.view_card', book_id=book_id, page_id=page_id, card_id=card_id))
+    
     except SQLAlchemyError as e:
         db.rollback()
         flash(f'Errore nell\'eliminazione della carta: {str(e)}', 'error')
@@ -324,12 +346,16 @@ def move_card(book_id, page_id, card_id):
         if card.page.book.id != book_id:
             return jsonify({'success': False, 'message': 'Carta non appartiene al libro'}), 403
         
-        new_slot_col = request.json.get('x', type=int)
-        new_slot_row = request.json.get('y', type=int)
-        
-        if new_slot_col is None or new_slot_row is None:
+        data = request.get_json(silent=True) or {}
+        try:
+            new_slot_col = int(data['x'])
+            new_slot_row = int(data['y'])
+            expected_version = int(data['version']) if data.get('version') is not None else None
+        except (KeyError, TypeError, ValueError):
             return jsonify({'success': False, 'message': 'Posizione non valida'}), 400
         
+        check_version(card, expected_version)
+        
         page = card.page
         if new_slot_col < 0 or new_slot_col >= page.grid_cols or new_slot_row < 0 or new_slot_row >= page.grid_rows:
             return jsonify({
@@ -350,6 +376,7 @@ def move_card(book_id, page_id, card_id):
         
         # Sposta carta
         old_position = (card.slot_col, card.slot_row)
+        claim_slots(db, page)
         card.slot_col = new_slot_col
         card.slot_row = new_slot_row
         db.commit()
@@ -358,14 +385,54 @@ def move_card(book_id, page_id, card_id):
             'success': True,
             'message': f'Carta spostata da ({old_position[0]}, {old_position[1]}) a ({new_slot_col}, {new_slot_row})',
             'old_position': old_position,
-            'new_position': (new_slot_col, new_slot_row)
+            'new_position': (new_slot_col, new_slot_row),
+            'version': card.version
         })
     
+    except (VersionConflict, StaleDataError):
+        # Stato attuale nella risposta: il client aggiorna la griglia invece di sovrascrivere
+        db.rollback()
+        card = db.query(Card).filter_by(id=card_id, page_id=page_id).first()
+        if not card:
+            return jsonify({'success': False, 'message': 'Carta eliminata da un altro utente'}), 409
+        return jsonify({
+            'success': False,
+            'message': 'Carta o pagina modificata da un altro utente',
+            'card': serialize_card_state(card),
+            'slot_version': card.page.slot_version
+        }), 409
+    
     except SQLAlchemyError as e:
         db.rollback()
         return jsonify({'success': False, 'message': f'Errore database: {str(e)}'}), 500
     finally:
         close_db(db)
+
+
+def render_edit_form(db, book, page, card):
+    """Form di modifica della carta (anche con lo stato attuale dopo un conflitto)"""
+    assets = db.query(Asset).order_by(Asset.id.desc()).all()
+    pages = db.query(Page).filter_by(book_id=book.id).order_by(Page.order).all()
+    
+    return render_template('cards/edit.html',
+                         book=book,
+                         page=page,
+                         card=card,
+                         assets=assets,
+                         pages=pages)
+
+
+def serialize_card_state(card):
+    """Stato attuale della carta restituito nelle risposte di conflitto"""
+    return {
+        'id': card.id,
+        'label': card.label,
+        'x': card.slot_col,
+        'y': card.slot_row,
+        'version': card.version
+    }
+
+
 def find_free_position(page, occupied_positions):
     """Trova la prima posizione libera nella griglia"""
     for y in range(page.grid_rows):
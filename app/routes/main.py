@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request
 from ..db import get_db, close_db
-from ..models import Book, Page, Card
+from ..models import Book
+from .books import attach_book_stats
 
 main_bp = Blueprint('main', __name__)
 
@@ -23,16 +24,8 @@ def index():
         
         books = books_query.all()
         
-        # Carica le pagine per ogni libro per mostrare le statistiche
-        for book in books:
-            book.pages = db.query(Page).filter(Page.book_id == book.id).all()
-            
-            # Conta le carte totali per ogni libro
-            total_cards = 0
-            for page in book.pages:
-                cards_count = db.query(Card).filter(Card.page_id == page.id).count()
-                total_cards += cards_count
-            book.total_cards = total_cards
+        # Statistiche pagine/carte per ogni libro
+        attach_book_stats(db, books)
         
         return render_template('books/list.html', 
                              books=books, 
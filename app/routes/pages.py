@@ -1,5 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, jsonify
+from sqlalchemy import delete
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
 from app.db import get_db, close_db
+from app.services import change_feed, link_graph
+from app.services.concurrency import VersionConflict, check_version, release_slots
+from app.services.page_order import next_order, page_position, move_page, reorder_pages, ReorderError
 from ..models import Book, Page, Card
 
 pages_bp = Blueprint('pages', __name__)
@@ -35,13 +41,15 @@ def view_page(book_id, page_id):
         # Ottieni tutte le carte della pagina
         cards = db.query(Card).filter(Card.page_id == page_id).all()
         
+        position = page_position(db, page)
+        
         # Crea griglia per visualizzazione
         grid = [[None for _ in range(page.grid_cols)] for _ in range(page.grid_rows)]
         for card in cards:
             if 0 <= card.slot_row < page.grid_rows and 0 <= card.slot_col < page.grid_cols:
                 grid[card.slot_row][card.slot_col] = card
         
-        return render_template('pages/detail.html', book=book, page=page, cards=cards, grid=grid)
+        return render_template('pages/detail.html', book=book, page=page, cards=cards, grid=grid, position=position)
     finally:
         close_db(db)
 
@@ -64,16 +72,13 @@ def create_page(book_id):
                 flash('Il titolo è obbligatorio', 'error')
                 return render_template('pages/new.html', book=book)
             
-            # Calcola il prossimo numero d'ordine
-            max_order = db.query(Page).filter(Page.book_id == book_id).count()
-            
             # Crea nuova pagina
             new_page = Page(
                 book_id=book_id,
                 title=title,
                 grid_cols=max(1, min(grid_cols, 10)),  # Limita tra 1 e 10
                 grid_rows=max(1, min(grid_rows, 10)),  # Limita tra 1 e 10
-                order=max_order
+                order=next_order(book_id)  # MAX + intervallo, calcolato nell'INSERT
             )
             
             db.add(new_page)
@@ -93,13 +98,45 @@ def create_page(book_id):
     finally:
         close_db(db)
 
+@pages_bp.route('/reorder', methods=['POST'])
+def reorder(book_id):
+    """Riordina le pagine del libro: JSON {"page_ids": [...]} con l'ordine completo.
+    Con le chiavi a intervalli spostare una pagina aggiorna una sola riga.
+    """
+    db = get_db()
+    try:
+        data = request.get_json(silent=True) or {}
+        page_ids = data.get('page_ids')
+        if not isinstance(page_ids, list) or not all(isinstance(page_id, int) for page_id in page_ids):
+            return jsonify({'success': False, 'message': 'page_ids deve essere una lista di id'}), 400
+        
+        if not db.query(Book.id).filter(Book.id == book_id).first():
+            return jsonify({'success': False, 'message': 'Libro non trovato'}), 404
+        
+        updated = reorder_pages(db, book_id, page_ids)
+        db.commit()
+        
+        return jsonify({'success': True, 'updated': updated})
+    
+    except ReorderError as e:
+        db.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        db.rollback()
+        return jsonify({'success': False, 'message': f'Errore database: {str(e)}'}), 500
+    finally:
+        close_db(db)
+
 @pages_bp.route('/<int:page_id>/edit', methods=['GET', 'POST'])
 def edit_page(book_id, page_id):
     """Modifica una pagina esistente"""
     db = get_db()
     try:
         book = db.query(Book).filter(Book.id == book_id).first()
-        page = db.query(Page).filter(Page.id == page_id, Page.book_id == book_id).first()
+        # Carte e immagini caricate insieme alla pagina (usate dal template)
+        page = db.query(Page).options(
+            selectinload(Page.cards).selectinload(Card.image)
+        ).filter(Page.id == page_id, Page.book_id == book_id).first()
         
         if not book or not page:
             flash('Pagina non trovata', 'error')
@@ -109,39 +146,46 @@ def edit_page(book_id, page_id):
             title = request.form.get('title', '').strip()
             grid_cols = int(request.form.get('grid_cols', page.grid_cols))
             grid_rows = int(request.form.get('grid_rows', page.grid_rows))
-            order = int(request.form.get('order', page.order))
+            position = int(request.form.get('position', 0) or 0)
             
             if not title:
                 flash('Il titolo è obbligatorio', 'error')
-                # Carica le carte per il re-render del template
-                cards = db.query(Card).filter(Card.page_id == page_id).all()
-                for card in cards:
-                    if card.image_id:
-                        from ..models import Asset
-                        card.image = db.query(Asset).filter(Asset.id == card.image_id).first()
-                return render_template('pages/edit.html', book=book, page=page, cards=cards)
+                return render_template('pages/edit.html', book=book, page=page, cards=page.cards,
+                                       position=page_position(db, page))
+            
+            # Rifiutata se titolo o griglia sono cambiati dopo l'apertura del form
+            # (le carte aggiunte o spostate nel frattempo non contano)
+            check_version(page, request.form.get('version', type=int))
             
             # Aggiorna pagina
             page.title = title
-            page.grid_cols = max(1, min(grid_cols, 10))
-            page.grid_rows = max(1, min(grid_rows, 10))
-            page.order = order
+            grid = (max(1, min(grid_cols, 10)), max(1, min(grid_rows, 10)))
+            if grid != (page.grid_cols, page.grid_rows):
+                release_slots(page)
+            page.grid_cols, page.grid_rows = grid
+            if position and position != page_position(db, page):
+                move_page(db, page, position)
             
             db.commit()
             
             flash(f'Pagina "{title}" aggiornata con successo!', 'success')
             return redirect(url_for('pages.view_page', book_id=book_id, page_id=page_id))
         
-        # Carica le carte esistenti della pagina
-        cards = db.query(Card).filter(Card.page_id == page_id).all()
-        
-        # Carica le immagini associate alle carte
-        for card in cards:
-            if card.image_id:
-                from ..models import Asset
-                card.image = db.query(Asset).filter(Asset.id == card.image_id).first()
-        
-        return render_template('pages/edit.html', book=book, page=page, cards=cards)
+        return render_template('pages/edit.html', book=book, page=page, cards=page.cards,
+                               position=page_position(db, page))
+    
+    except (VersionConflict, StaleDataError):
+        # Salvata da un altro editor: form con lo stato attuale (e la nuova versione)
+        db.rollback()
+        page = db.query(Page).options(
+            selectinload(Page.cards).selectinload(Card.image)
+        ).filter(Page.id == page_id, Page.book_id == book_id).first()
+        if not page:
+            flash('Pagina eliminata da un altro utente', 'error')
+            return redirect(url_for('books.view_book', book_id=book_id))
+        flash('La pagina è stata modificata da un altro utente: controlla i valori attuali e salva di nuovo', 'warning')
+        return render_template('pages/edit.html', book=page.book, page=page, cards=page.cards,
+                               position=page_position(db, page)), 409
         
     finally:
         close_db(db)
@@ -160,12 +204,12 @@ def delete_page(book_id, page_id):
         
         page_title = page.title
         
-        # Controlla se questa è la home page del libro
-        if book.home_page_id == page_id:
-            book.home_page_id = None
-            
-        db.delete(page)
+        # Un solo DELETE: carte eliminate dal database (ON DELETE CASCADE),
+        # home_page_id del libro e target_page_id delle carte azzerati (SET NULL)
+        db.execute(delete(Page).where(Page.id == page_id, Page.book_id == book_id))
+        change_feed.record(db, 'page', page_id, change_feed.OP_DELETE, book_id)
         db.commit()
+        link_graph.invalidate(book_id=book_id)
         
         flash(f'Pagina "{page_title}" eliminata con successo!', 'success')
         return redirect(url_for('books.view_book', book_id=book_id))
@@ -4,6 +4,7 @@ Obiettivo: usare (se disponibili) gli schema Pydantic del backend FastAPI,
 senza confliggere con il package locale "app" di questa Flask app.
 
 Se il backend non è presente, esporta fallback a None in modo silenzioso.
+Gli schema vengono caricati in modo lazy al primo accesso.
 """
 
 from __future__ import annotations
@@ -45,22 +46,14 @@ def _import_classes(mod: ModuleType | None, names: Tuple[str, ...]) -> Tuple[Any
         out.append(getattr(mod, name, None))
     return tuple(out)
 
-# Prova a caricare gli schema dal backend, se presenti
-BookCreate = BookUpdate = BookRead = None
-PageCreate = PageUpdate = PageRead = None
-CardCreate = CardUpdate = CardRead = None
-AssetCreate = AssetUpdate = AssetRead = None
-
-if os.path.isdir(BACKEND_PATH):
-    book_mod = _load_backend_module(os.path.join('app', 'schemas', 'book.py'), 'backend_schemas_book')
-    page_mod = _load_backend_module(os.path.join('app', 'schemas', 'page.py'), 'backend_schemas_page')
-    card_mod = _load_backend_module(os.path.join('app', 'schemas', 'card.py'), 'backend_schemas_card')
-    asset_mod = _load_backend_module(os.path.join('app', 'schemas', 'asset.py'), 'backend_schemas_asset')
-
-    (BookCreate, BookUpdate, BookRead) = _import_classes(book_mod, ("BookCreate", "BookUpdate", "BookRead"))
-    (PageCreate, PageUpdate, PageRead) = _import_classes(page_mod, ("PageCreate", "PageUpdate", "PageRead"))
-    (CardCreate, CardUpdate, CardRead) = _import_classes(card_mod, ("CardCreate", "CardUpdate", "CardRead"))
-    (AssetCreate, AssetUpdate, AssetRead) = _import_classes(asset_mod, ("AssetCreate", "AssetUpdate", "AssetRead"))
+# Nome classe -> (file del backend, nome modulo)
+_SCHEMA_SOURCES = {
+    'Book': ('book.py', 'backend_schemas_book'),
+    'Page': ('page.py', 'backend_schemas_page'),
+    'Card': ('card.py', 'backend_schemas_card'),
+    'Asset': ('asset.py', 'backend_schemas_asset'),
+}
+_SCHEMA_SUFFIXES = ('Create', 'Update', 'Read')
 
 # Re-export per uso nel Flask app (principalmente per validazione)
 __all__ = [
@@ -68,4 +61,24 @@ __all__ = [
     'PageCreate', 'PageUpdate', 'PageRead',
     'CardCreate', 'CardUpdate', 'CardRead',
     'AssetCreate', 'AssetUpdate', 'AssetRead'
-]
\ No newline at end of file
+]
+
+def _load_entity_schemas(entity: str) -> None:
+    """Carica (una sola volta) gli schema di un'entità dal backend, se presente,
+    e li salva come attributi del modulo."""
+    names = tuple(f"{entity}{suffix}" for suffix in _SCHEMA_SUFFIXES)
+    mod = None
+    if os.path.isdir(BACKEND_PATH):
+        file_name, module_name = _SCHEMA_SOURCES[entity]
+        mod = _load_backend_module(os.path.join('app', 'schemas', file_name), module_name)
+    for name, value in zip(names, _import_classes(mod, names)):
+        globals()[name] = value
+
+def __getattr__(name: str) -> Any:
+    """Caricamento lazy: il backend viene letto solo al primo accesso a uno schema,
+    non all'import del package (che avviene ad ogni avvio dell'app)."""
+    if name in __all__:
+        entity = name[:-len(next(s for s in _SCHEMA_SUFFIXES if name.endswith(s)))]
+        _load_entity_schemas(entity)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,4 @@
+"""
+Services module for Flask app
+Logica applicativa condivisa tra i blueprint (cache, job, calcoli su più tabelle)
+"""
@@ -0,0 +1,127 @@
+"""
+Controllo di ammissione per l'elaborazione delle immagini
+Ridimensionamenti LANCZOS e derivati sono CPU-bound: senza limite un'ondata
+di upload multipli occupa tutti i core e la latenza delle pagine runtime sale.
+
+Gli slot sono file in IMAGE_SLOTS_DIR bloccati con flock, quindi condivisi
+tra tutti i worker gunicorn e i processi dell'import in blocco. Due priorità:
+- PRIORITY_INTERACTIVE (upload singolo, derivati al primo accesso): tutti gli slot;
+- PRIORITY_BULK (upload multipli, import): tutti tranne IMAGE_RESERVED_SLOTS.
+Chi non ottiene uno slot entro il timeout riceve Saturated: le route
+rispondono 503 con Retry-After invece di accodare lavoro senza limite.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from app.config import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: limite solo nel processo corrente
+    fcntl = None
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BULK = 'bulk'
+
+POLL_SECONDS = 0.05
+
+
+class Saturated(RuntimeError):
+    """Nessuno slot libero entro il timeout; retry_after in secondi per il client"""
+
+    def __init__(self, retry_after):
+        super().__init__('Elaborazione immagini satura')
+        self.retry_after = retry_after
+
+
+class SlotLimiter:
+    """slots slot condivisi tra processi; reserved slot solo per PRIORITY_INTERACTIVE"""
+
+    def __init__(self, lock_dir, slots, reserved=1, retry_after=5):
+        self.lock_dir = str(lock_dir)
+        self.slots = max(1, int(slots))
+        self.bulk_slots = max(1, self.slots - int(reserved))
+        self.retry_after = retry_after
+        self._local = [threading.Lock() for _ in range(self.slots)]
+
+    def _candidates(self, priority):
+        if priority == PRIORITY_BULK:
+            return range(self.bulk_slots)
+        # Gli interattivi provano prima gli slot riservati
+        return range(self.slots - 1, -1, -1)
+
+    def _try_slot(self, index):
+        """Handle dello slot se libero, altrimenti None"""
+        if not self._local[index].acquire(blocking=False):
+            return None
+        if fcntl is None:
+            return (index, None)
+        os.makedirs(self.lock_dir, exist_ok=True)
+        handle = open(os.path.join(self.lock_dir, f"slot-{index}.lock"), 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            self._local[index].release()
+            return None
+        return (index, handle)
+
+    def try_acquire(self, priority=PRIORITY_INTERACTIVE):
+        for index in self._candidates(priority):
+            slot = self._try_slot(index)
+            if slot:
+                return slot
+        return None
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Attende uno slot per al massimo timeout secondi (None = senza limite)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            slot = self.try_acquire(priority)
+            if slot:
+                return slot
+            if deadline is not None and time.monotonic() >= deadline:
+                raise Saturated(self.retry_after)
+            time.sleep(POLL_SECONDS)
+
+    def release(self, slot):
+        index, handle = slot
+        if handle is not None:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+        self._local[index].release()
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        slot = self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(slot)
+
+
+_limiter = None
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        _limiter = SlotLimiter(
+            config.IMAGE_SLOTS_DIR, config.IMAGE_WORKER_SLOTS,
+            config.IMAGE_RESERVED_SLOTS, config.IMAGE_RETRY_AFTER,
+        )
+    return _limiter
+
+
+def set_limiter(limiter):
+    """Sostituisce il limitatore (es. nei test); None = ricrea dalla configurazione"""
+    global _limiter
+    _limiter = limiter
+
+
+def image_slot(priority=PRIORITY_INTERACTIVE, timeout=None):
+    """Context manager: uno slot di elaborazione immagini per la durata del blocco"""
+    return get_limiter().slot(priority, timeout)
+
@@ -0,0 +1,39 @@
+"""
+Contatore di utilizzo degli asset (Asset.usage_count)
+Il contatore è mantenuto dai trigger su card (app.models.card) e rende
+"dove è usato" ed eliminazione senza query su card, oltre all'ordinamento
+per popolarità dall'indice ix_asset_usage_count.
+
+recount() lo ricalcola dalle carte (dopo import manuali nel database o
+modifiche con i trigger disattivati): un UPDATE per blocco di id, che
+scrive solo le righe divergenti.
+"""
+
+from sqlalchemy import func, select, update
+from app.models.asset import Asset
+from app.models.card import Card
+
+BATCH_SIZE = 1000
+
+
+def recount(db, batch_size=BATCH_SIZE):
+    """Riallinea usage_count al numero di carte, con un commit per blocco.
+    Ritorna il numero di asset corretti.
+    """
+    actual = select(func.count()).where(Card.image_id == Asset.id).scalar_subquery()
+    fixed = 0
+    last_id = 0
+    while True:
+        ids = db.execute(
+            select(Asset.id).where(Asset.id > last_id).order_by(Asset.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return fixed
+        fixed += db.execute(
+            update(Asset)
+            .where(Asset.id.in_(ids), Asset.usage_count != actual)
+            .values(usage_count=actual)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        last_id = ids[-1]
@@ -0,0 +1,169 @@
+"""
+Atlas sprite per pagina runtime
+Compone le immagini di tutte le carte di una pagina in un'unica immagine
+(WebP se supportato da Pillow, altrimenti PNG) con la mappa delle coordinate,
+così una pagina 6×6 fa una sola richiesta immagine invece di 36.
+
+L'atlas è salvato su disco con un fingerprint di carte/asset/file nel nome:
+viene rigenerato solo quando cambiano le carte o le immagini della pagina.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from PIL import Image, ImageOps, features
+from app.config import config
+from app.models.asset import normalize_media_url
+from app.services import admission, library
+
+# Lato della cella nell'atlas (px). Visualizzata a ATLAS_DISPLAY_SIZE,
+# quindi nitida anche su schermi ad alta densità.
+ATLAS_CELL_SIZE = 120
+ATLAS_DISPLAY_SIZE = 60
+ATLAS_COLUMNS = 6
+
+# Attesa massima di uno slot per generare la thumbnail di un simbolo di libreria
+LIBRARY_SLOT_TIMEOUT = 0.5
+
+
+def atlas_format():
+    return ('webp', 'WEBP') if features.check('webp') else ('png', 'PNG')
+
+
+def _local_image_path(asset):
+    """Percorso su disco dell'immagine (preferendo la thumbnail), None se remota o non leggibile"""
+    in_library = library.split_url(asset.url)
+    if in_library:
+        # Thumbnail generata al primo accesso: lavoro CPU, come in serve_library.
+        # Slot saturi: la carta resta fuori dall'atlas (immagine servita a parte)
+        try:
+            with admission.image_slot(admission.PRIORITY_INTERACTIVE, timeout=LIBRARY_SLOT_TIMEOUT):
+                return library.derivative_path(config.PICTOGRAM_LIBRARIES, config.LIBRARY_CACHE_DIR, *in_library, 'thumbnail')
+        except admission.Saturated:
+            return None
+    url = normalize_media_url(asset.url)
+    if not url.startswith('/static/'):
+        return None
+    path = os.path.join(str(config.STATIC_DIR), url[len('/static/'):])
+    if path.lower().endswith('.svg'):
+        return None
+    thumbnail = f"{os.path.splitext(path)[0]}_thumbnail.jpg"
+    for candidate in (thumbnail, path):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _atlas_sources(cards):
+    """(card, percorso immagine) per le carte con immagine locale, ordinati per id"""
+    sources = []
+    for card in sorted(cards, key=lambda c: c.id):
+        if card.image:
+            path = _local_image_path(card.image)
+            if path:
+                sources.append((card, path))
+    return sources
+
+
+def _fingerprint(page, sources):
+    digest = hashlib.sha1(f"{page.id}:{ATLAS_CELL_SIZE}:{ATLAS_COLUMNS}".encode())
+    for card, path in sources:
+        stat = os.stat(path)
+        digest.update(f"|{card.id}:{card.image.id}:{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _partial_path(path):
+    """File temporaneo per path, unico per processo e richiesta (stesso atlas da più worker)"""
+    return f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.part"
+
+
+def _remove_stale(atlas_dir, page_id, keep):
+    prefix = f"page-{page_id}-"
+    for name in os.listdir(atlas_dir):
+        if name.startswith(prefix) and not name.startswith(keep):
+            try:
+                os.remove(os.path.join(atlas_dir, name))
+            except OSError:
+                pass
+
+
+def _compose(sources, image_path):
+    columns = min(ATLAS_COLUMNS, len(sources))
+    rows = (len(sources) + columns - 1) // columns
+    sheet = Image.new('RGBA', (columns * ATLAS_CELL_SIZE, rows * ATLAS_CELL_SIZE), (255, 255, 255, 0))
+    positions = {}
+    for index, (card, path) in enumerate(sources):
+        x = (index % columns) * ATLAS_CELL_SIZE
+        y = (index // columns) * ATLAS_CELL_SIZE
+        try:
+            with Image.open(path) as img:
+                img.draft('RGB', (ATLAS_CELL_SIZE, ATLAS_CELL_SIZE))
+                tile = ImageOps.fit(img.convert('RGBA'), (ATLAS_CELL_SIZE, ATLAS_CELL_SIZE), Image.Resampling.LANCZOS)
+        except Exception as e:
+            print(f"Atlas: immagine non leggibile {path}: {e}")
+            continue
+        sheet.paste(tile, (x, y))
+        positions[card.id] = (x, y)
+
+    _, pil_format = atlas_format()
+    tmp_path = _partial_path(image_path)
+    if pil_format == 'WEBP':
+        sheet.save(tmp_path, pil_format, quality=85)
+    else:
+        sheet.save(tmp_path, pil_format, optimize=True)
+    os.replace(tmp_path, image_path)
+    return positions, sheet.size
+
+
+def get_page_atlas(page, cards):
+    """Atlas della pagina (generandolo se necessario).
+
+    Ritorna None se nessuna carta ha un'immagine locale, altrimenti un dict:
+    {'url', 'width', 'height', 'cell', 'display', 'positions': {card_id: (x, y)}}
+    con coordinate in pixel dell'atlas (scalare di display/cell per il CSS).
+    """
+    sources = _atlas_sources(cards)
+    if not sources:
+        return None
+
+    atlas_dir = str(config.ATLAS_DIR)
+    os.makedirs(atlas_dir, exist_ok=True)
+    ext, _ = atlas_format()
+    name = f"page-{page.id}-{_fingerprint(page, sources)}"
+    image_path = os.path.join(atlas_dir, f"{name}.{ext}")
+    map_path = os.path.join(atlas_dir, f"{name}.json")
+
+    atlas = None
+    if os.path.isfile(image_path) and os.path.isfile(map_path):
+        try:
+            with open(map_path) as f:
+                atlas = json.load(f)
+        except (OSError, ValueError):
+            atlas = None
+
+    if atlas is None:
+        positions, (width, height) = _compose(sources, image_path)
+        atlas = {
+            'url': f"/static/media/{config.ATLAS_DIR.name}/{name}.{ext}",
+            'width': width,
+            'height': height,
+            'cell': ATLAS_CELL_SIZE,
+            'display': ATLAS_DISPLAY_SIZE,
+            'positions': {str(card_id): xy for card_id, xy in positions.items()},
+        }
+        tmp_path = _partial_path(map_path)
+        with open(tmp_path, 'w') as f:
+            json.dump(atlas, f)
+        os.replace(tmp_path, map_path)
+        _remove_stale(atlas_dir, page.id, name)
+
+    # Coordinate già scalate per il CSS (background-position/size)
+    scale = atlas['display'] / atlas['cell']
+    atlas['css'] = {
+        int(card_id): (-round(x * scale), -round(y * scale))
+        for card_id, (x, y) in atlas['positions'].items()
+    }
+    atlas['css_size'] = (round(atlas['width'] * scale), round(atlas['height'] * scale))
+    return atlas
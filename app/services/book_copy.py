@@ -0,0 +1,76 @@
+"""
+Duplicazione di un libro con SQL set-based (INSERT ... SELECT)
+Libro, pagine e carte sono copiati con un numero fisso di statement,
+indipendente dal numero di pagine/carte, nella transazione della sessione.
+Gli id delle nuove pagine sono assegnati in una tabella temporanea
+(vecchio id -> nuovo id) usata per rimappare home_page_id e target_page_id.
+Le carte condividono le righe Asset dell'originale: nessun file viene copiato.
+"""
+
+from sqlalchemy import insert, select, text
+from app.models.book import Book
+from app.services import change_feed
+
+_PAGE_MAP = "_copy_page_map"
+
+
+def duplicate_book(db, book_id, title=None):
+    """Copia il libro book_id e ritorna l'id del nuovo libro (None se non esiste).
+    Non esegue commit: il chiamante conferma o annulla la transazione.
+    """
+    source = db.execute(
+        select(Book.title, Book.locale, Book.home_page_id).where(Book.id == book_id)
+    ).first()
+    if source is None:
+        return None
+
+    # Il primo INSERT prende il lock di scrittura: MAX(page.id) resta valido fino al commit
+    new_book_id = db.execute(
+        insert(Book).values(title=title or f"{source.title} (copia)", locale=source.locale)
+    ).inserted_primary_key[0]
+
+    db.execute(text(f"DROP TABLE IF EXISTS temp.{_PAGE_MAP}"))
+    db.execute(text(f"CREATE TEMP TABLE {_PAGE_MAP} (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)"))
+    try:
+        db.execute(
+            text(f"""
+                INSERT INTO {_PAGE_MAP} (old_id, new_id)
+                SELECT id, (SELECT COALESCE(MAX(id), 0) FROM page) + ROW_NUMBER() OVER (ORDER BY id)
+                FROM page WHERE book_id = :book_id
+            """),
+            {'book_id': book_id},
+        )
+        db.execute(
+            text(f"""
+                INSERT INTO page (id, book_id, title, grid_cols, grid_rows, "order")
+                SELECT m.new_id, :new_book_id, p.title, p.grid_cols, p.grid_rows, p."order"
+                FROM page AS p JOIN {_PAGE_MAP} AS m ON m.old_id = p.id
+            """),
+            {'new_book_id': new_book_id},
+        )
+        # Collegamenti interni rimappati sulle copie; quelli verso altri libri restano invariati
+        db.execute(text(f"""
+            INSERT INTO card (page_id, slot_row, slot_col, row_span, col_span, label,
+                              background_color, border_color, action_type, image_id, target_page_id)
+            SELECT m.new_id, c.slot_row, c.slot_col, c.row_span, c.col_span, c.label,
+                   c.background_color, c.border_color, c.action_type, c.image_id,
+                   COALESCE(t.new_id, c.target_page_id)
+            FROM card AS c
+            JOIN {_PAGE_MAP} AS m ON m.old_id = c.page_id
+            LEFT JOIN {_PAGE_MAP} AS t ON t.old_id = c.target_page_id
+            ORDER BY c.id
+        """))
+        if source.home_page_id is not None:
+            db.execute(
+                text(f"""
+                    UPDATE book SET home_page_id = (SELECT new_id FROM {_PAGE_MAP} WHERE old_id = :home_page_id)
+                    WHERE id = :new_book_id
+                """),
+                {'home_page_id': source.home_page_id, 'new_book_id': new_book_id},
+            )
+    finally:
+        db.execute(text(f"DROP TABLE IF EXISTS temp.{_PAGE_MAP}"))
+
+    change_feed.record(db, 'book', new_book_id, change_feed.OP_INSERT, new_book_id)
+
+    return new_book_id
@@ -0,0 +1,304 @@
+"""
+Import in blocco di set di pittogrammi da un archivio zip o da una cartella
+Pensato per l'onboarding (migliaia di file), al posto del multi-upload di
+upload_asset che elabora i file in serie in una sola richiesta HTTP:
+
+- le voci dell'archivio sono registrate su un database di stato SQLite
+  (come MediaSweeper) con il nome file già assegnato in static/media;
+- a blocchi, i file sono estratti in streaming e le immagini elaborate
+  (derivati + hash percettivo) in un pool di processi;
+- le righe Asset del blocco sono inserite con un solo INSERT e un commit;
+- ogni voce completata è marcata nello stato: un import interrotto riprende
+  dalle voci mancanti senza rielaborare quelle già importate.
+"""
+
+import mimetypes
+import os
+import sqlite3
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import bindparam, insert, select
+from werkzeug.utils import secure_filename
+from app.db import get_db, close_db
+from app.models.asset import Asset
+from app.services import admission, similarity
+from app.services.images import ALLOWED_EXTENSIONS, MAX_FILE_SIZE, ImageTooLarge, file_metadata, process_image
+from app.services.media_sweeper import iter_media_files
+
+BATCH_SIZE = 200
+COPY_CHUNK = 64 * 1024
+
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+STATUS_SKIPPED = 'skipped'
+STATUS_ERROR = 'error'
+
+_EXISTING_ASSETS = select(Asset.url, Asset.id).where(Asset.url.in_(bindparam('urls', expanding=True)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS import_entry (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,      -- percorso nell'archivio o nella cartella
+    size INTEGER NOT NULL,
+    filename TEXT NOT NULL,         -- nome assegnato in static/media
+    status TEXT NOT NULL DEFAULT 'pending',
+    asset_id INTEGER,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_import_entry_status ON import_entry (status, id);
+CREATE TABLE IF NOT EXISTS import_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def iter_source_entries(source):
+    """Voci dell'archivio o della cartella: (nome relativo, dimensione)"""
+    if os.path.isdir(source):
+        for name, size, _ in iter_media_files(source, excluded=()):
+            yield name, size
+        return
+    with zipfile.ZipFile(source) as archive:
+        for info in archive.infolist():
+            if not info.is_dir():
+                yield info.filename, info.file_size
+
+
+def skip_reason(name, size):
+    """Motivo per non importare una voce (None se va importata)"""
+    parts = name.split('/')
+    if any(part.startswith('.') or part == '__MACOSX' for part in parts):
+        return 'File nascosto'
+    extension = os.path.splitext(name)[1][1:].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        return 'Tipo di file non supportato'
+    if size > MAX_FILE_SIZE:
+        return 'File troppo grande'
+    return None
+
+
+def _process_file(path):
+    """Eseguita nei worker: (colonne Asset, errore). Derivati, hash percettivo e del contenuto.
+    Priorità bulk: l'import attende uno slot e lascia liberi quelli riservati agli upload.
+    """
+    with admission.image_slot(admission.PRIORITY_BULK):
+        try:
+            sizes = process_image(path)
+        except ImageTooLarge as e:
+            return None, str(e)
+        return file_metadata(path, sizes), None
+
+
+class BulkImporter:
+    """Import riprendibile di un archivio zip o di una cartella; lo stato vive in state_path (SQLite)"""
+
+    def __init__(self, source, media_dir, state_path, workers=None, batch_size=BATCH_SIZE):
+        self.source = os.path.abspath(str(source))
+        self.media_dir = str(media_dir)
+        self.state_path = str(state_path)
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(self.state_path)
+        self.conn.executescript(_SCHEMA)
+        self._archive = None
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # --- stato ---------------------------------------------------------
+
+    def _get(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM import_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set(self, key, value):
+        self.conn.execute(
+            "INSERT INTO import_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value)),
+        )
+
+    @property
+    def phase(self):
+        return self._get('phase', 'scan')
+
+    def reset(self):
+        """Ricomincia da zero (le voci già importate verrebbero importate di nuovo)"""
+        self.conn.execute("DELETE FROM import_entry")
+        self.conn.execute("DELETE FROM import_state")
+        self.conn.commit()
+
+    # --- fasi ----------------------------------------------------------
+
+    def scan(self):
+        """Registra le voci della sorgente (INSERT OR IGNORE: riprendibile)"""
+        self._set('source', self.source)
+        batch = []
+        for name, size in iter_source_entries(self.source):
+            reason = skip_reason(name, size)
+            extension = os.path.splitext(name)[1][1:].lower()
+            batch.append((
+                name, size, f"{uuid.uuid4().hex}.{extension}",
+                STATUS_SKIPPED if reason else STATUS_PENDING, reason,
+            ))
+            if len(batch) >= self.batch_size:
+                self._insert_entries(batch)
+                batch = []
+        if batch:
+            self._insert_entries(batch)
+        self._set('phase', 'process')
+        self.conn.commit()
+
+    def _insert_entries(self, batch):
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO import_entry (name, size, filename, status, message) VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+        self.conn.commit()
+
+    def process(self, progress=None):
+        """Estrae, elabora e registra le voci in attesa, un blocco alla volta"""
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        db = get_db()
+        try:
+            while True:
+                rows = self.conn.execute(
+                    "SELECT id, name, filename FROM import_entry WHERE status = ? ORDER BY id LIMIT ?",
+                    (STATUS_PENDING, self.batch_size),
+                ).fetchall()
+                if not rows:
+                    break
+                self._process_batch(db, rows, pool)
+                if progress:
+                    progress(self.report())
+        finally:
+            close_db(db)
+            if pool is not None:
+                pool.shutdown()
+        self._set('phase', 'done')
+        self.conn.commit()
+
+    def _open_entry(self, name):
+        if os.path.isdir(self.source):
+            return open(os.path.join(self.source, name), 'rb')
+        if self._archive is None:
+            self._archive = zipfile.ZipFile(self.source)
+        return self._archive.open(name)
+
+    def _extract(self, name, filename):
+        """Copia in streaming la voce in static/media (file .part rinominato a copia completa)"""
+        target = os.path.join(self.media_dir, filename)
+        partial = f"{target}.part"
+        copied = 0
+        with self._open_entry(name) as source, open(partial, 'wb') as destination:
+            while chunk := source.read(COPY_CHUNK):
+                copied += len(chunk)
+                if copied > MAX_FILE_SIZE:
+                    raise ValueError('File troppo grande')
+                destination.write(chunk)
+        os.replace(partial, target)
+        return target
+
+    def _process_batch(self, db, rows, pool):
+        os.makedirs(self.media_dir, exist_ok=True)
+        extracted = []
+        failed = []
+        for entry_id, name, filename in rows:
+            try:
+                extracted.append((entry_id, name, filename, self._extract(name, filename)))
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+                failed.append((STATUS_ERROR, str(e), entry_id))
+                try:
+                    os.remove(os.path.join(self.media_dir, f"{filename}.part"))
+                except OSError:
+                    pass
+
+        images = [path for *_, path in extracted if os.path.splitext(path)[1][1:].lower() != 'svg']
+        results = dict(zip(images, (pool.map(_process_file, images) if pool else map(_process_file, images))))
+        metadata = {path: columns for path, (columns, _) in results.items()}
+
+        # Immagini rifiutate (oltre il limite di pixel): nessuna riga Asset
+        rejected = {path: error for path, (_, error) in results.items() if error}
+        for entry_id, _, _, path in extracted:
+            if path in rejected:
+                failed.append((STATUS_ERROR, rejected[path], entry_id))
+                os.remove(path)
+        extracted = [entry for entry in extracted if entry[3] not in rejected]
+
+        # Righe già create da un'esecuzione interrotta dopo il commit: non duplicarle
+        filenames = [filename for _, _, filename, _ in extracted]
+        asset_ids = dict(db.execute(_EXISTING_ASSETS, {'urls': filenames}).all()) if filenames else {}
+        new_rows = [
+            {
+                'kind': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                'url': filename,
+                'alt': secure_filename(os.path.basename(name)),
+                # SVG: nessuna elaborazione, solo byte e hash del contenuto
+                **(metadata.get(path) or file_metadata(path)),
+            }
+            for _, name, filename, path in extracted
+            if filename not in asset_ids
+        ]
+        if new_rows:
+            inserted = db.execute(insert(Asset).returning(Asset.id, Asset.url), new_rows).all()
+            # Asset nuovi non ancora usati da carte: nessuna riga nel change feed
+            asset_ids.update({url: asset_id for asset_id, url in inserted})
+        db.commit()
+        for row in new_rows:
+            similarity.register(asset_ids[row['url']], row['phash'])
+
+        self.conn.executemany(
+            "UPDATE import_entry SET status = ?, asset_id = ? WHERE id = ?",
+            [(STATUS_DONE, asset_ids[filename], entry_id) for entry_id, _, filename, _ in extracted],
+        )
+        self.conn.executemany("UPDATE import_entry SET status = ?, message = ? WHERE id = ?", failed)
+        self.conn.commit()
+
+    def run(self, progress=None):
+        """Esegue (o riprende) le fasi mancanti e ritorna il report"""
+        source = self._get('source')
+        if source is not None and source != self.source:
+            raise RuntimeError(f"Lo stato appartiene a un altro import ({source}): usare reset()")
+        if self.phase == 'scan':
+            self.scan()
+        if self.phase == 'process':
+            self.process(progress)
+        return self.report()
+
+    # --- risultati -----------------------------------------------------
+
+    def report(self):
+        """Voci per stato e byte importati"""
+        counts = dict(self.conn.execute(
+            "SELECT status, COUNT(*) FROM import_entry GROUP BY status"
+        ).fetchall())
+        imported_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM import_entry WHERE status = ?", (STATUS_DONE,)
+        ).fetchone()[0]
+        return {
+            'phase': self.phase,
+            'entries': sum(counts.values()),
+            'pending': counts.get(STATUS_PENDING, 0),
+            'imported': counts.get(STATUS_DONE, 0),
+            'skipped': counts.get(STATUS_SKIPPED, 0),
+            'errors': counts.get(STATUS_ERROR, 0),
+            'imported_bytes': imported_bytes,
+        }
+
+    def iter_problems(self):
+        """Voci saltate o in errore: (nome, stato, motivo)"""
+        yield from self.conn.execute(
+            "SELECT name, status, message FROM import_entry WHERE status IN (?, ?) ORDER BY id",
+            (STATUS_SKIPPED, STATUS_ERROR),
+        )
@@ -0,0 +1,226 @@
+"""
+Change feed per la sincronizzazione incrementale dei client runtime
+Ogni modifica a Book/Page/Card/Asset aggiunge una riga compatta a change_log
+(entity, entity_id, op, book_id, page_id); l'id della riga è la versione. Un client che
+conosce la versione V scarica solo le righe successive con
+/api/books/<id>/changes?since=V e ricarica le sole entità indicate.
+
+- le modifiche ORM sono registrate da un listener after_flush (qualsiasi blueprint);
+- le operazioni Core in blocco (delete_book, delete_page, riordino, duplicazione)
+  chiamano record() esplicitamente;
+- gli asset sono condivisi: una modifica è registrata una volta per ogni libro
+  con carte che li usano (record_assets); un asset nuovo o non usato non
+  compare in nessun feed (la carta che lo userà è registrata con il suo libro);
+- gli eventi SSE del runtime (app.services.events) sono letti dalle stesse righe;
+- compact() elimina le righe superate e le tombstone vecchie; chi ha una
+  versione precedente alla soglia di compattazione riceve reset=True.
+
+Gli effetti di ON DELETE non sono registrati riga per riga: un client che riceve
+la delete di una pagina elimina le sue carte e azzera i collegamenti verso di essa.
+"""
+
+import time
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session
+from app.models.asset import Asset
+from app.models.book import Book
+from app.models.card import Card
+from app.models.change import Change
+from app.models.page import Page
+
+OP_INSERT = 'insert'
+OP_UPDATE = 'update'
+OP_DELETE = 'delete'
+OP_PURGE = 'purge'
+
+ENTITIES = {Book: 'book', Page: 'page', Card: 'card', Asset: 'asset'}
+
+# Riga speciale con la versione sotto la quale le tombstone sono state eliminate
+COMPACTION_ENTITY = 'compaction'
+
+DEFAULT_LIMIT = 500
+TOMBSTONE_RETENTION_SECONDS = 30 * 24 * 3600
+
+
+def record(db, entity, entity_id, op, book_id=None):
+    """Registra una modifica fatta fuori dal flush ORM (statement Core)"""
+    record_many(db, [(entity, entity_id, op, book_id)])
+
+
+def record_many(db, changes):
+    """Registra più modifiche [(entity, entity_id, op, book_id)] con un solo INSERT"""
+    rows = [
+        {
+            'entity': entity, 'entity_id': entity_id, 'op': op, 'book_id': book_id,
+            'page_id': entity_id if entity == 'page' else None,
+        }
+        for entity, entity_id, op, book_id in changes
+    ]
+    if rows:
+        db.execute(insert(Change), rows)
+
+
+def record_assets(db, asset_ids, op):
+    """Registra la modifica di asset (statement Core) nei libri che li usano"""
+    rows = _asset_changes(db.connection(), asset_ids, op)
+    if rows:
+        db.execute(insert(Change), rows)
+
+
+def _asset_changes(conn, asset_ids, op):
+    """Righe change_log di asset: una per pagina con carte che lo usano"""
+    if not asset_ids:
+        return []
+    usages = conn.execute(
+        select(Card.image_id, Page.book_id, Card.page_id).distinct()
+        .join(Page, Page.id == Card.page_id)
+        .where(Card.image_id.in_(list(asset_ids)))
+        .order_by(Card.image_id, Card.page_id)
+    ).all()
+    return [
+        {'entity': 'asset', 'entity_id': asset_id, 'op': op, 'book_id': book_id, 'page_id': page_id}
+        for asset_id, book_id, page_id in usages
+    ]
+
+
+def _page_books(session, objects, page_ids):
+    """page_id -> book_id, prima dagli oggetti del flush poi con una query"""
+    books = {obj.id: obj.book_id for obj in objects if isinstance(obj, Page)}
+    missing = set(page_ids) - set(books)
+    if missing:
+        books.update(session.connection().execute(
+            select(Page.id, Page.book_id).where(Page.id.in_(missing))
+        ).all())
+    return books
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_on_flush(session, flush_context):
+    """Una riga change_log per ogni Book/Page/Card/Asset inserito, modificato o eliminato"""
+    changed = []
+    for op, objects in ((OP_INSERT, session.new), (OP_UPDATE, session.dirty), (OP_DELETE, session.deleted)):
+        for obj in objects:
+            entity = ENTITIES.get(type(obj))
+            if entity is None:
+                continue
+            if op == OP_UPDATE and not session.is_modified(obj, include_collections=False):
+                continue
+            changed.append((entity, obj, op))
+
+    rows = []
+    # Asset: nei libri che lo usano (un asset appena inserito non è usato da nessuno)
+    assets = {}
+    for entity, obj, op in changed:
+        if isinstance(obj, Asset) and op != OP_INSERT:
+            assets.setdefault(op, []).append(obj.id)
+    for op, asset_ids in assets.items():
+        rows.extend(_asset_changes(session.connection(), asset_ids, op))
+
+    changed = [(entity, obj, op) for entity, obj, op in changed if not isinstance(obj, Asset)]
+    objects = [obj for _, obj, _ in changed]
+    page_books = _page_books(session, objects, {obj.page_id for obj in objects if isinstance(obj, Card)})
+    for entity, obj, op in changed:
+        page_id = None
+        if isinstance(obj, Book):
+            book_id = obj.id
+        elif isinstance(obj, Page):
+            book_id, page_id = obj.book_id, obj.id
+        else:
+            book_id, page_id = page_books.get(obj.page_id), obj.page_id
+        rows.append({'entity': entity, 'entity_id': obj.id, 'op': op, 'book_id': book_id, 'page_id': page_id})
+    if rows:
+        session.connection().execute(insert(Change), rows)
+
+
+def _book_filter(book_id):
+    # Righe globali (book_id NULL, versioni precedenti) escluse: non riguardano il libro
+    return Change.book_id == book_id
+
+
+def version_expression(book_id):
+    """Subquery scalare con l'ultima versione del libro (per includerla in un'altra query)"""
+    return select(func.coalesce(func.max(Change.id), 0)).where(
+        _book_filter(book_id), Change.entity != COMPACTION_ENTITY
+    ).scalar_subquery()
+
+
+def current_version(db, book_id):
+    """Ultima versione rilevante per il libro (0 se nessuna modifica registrata)"""
+    return db.execute(select(version_expression(book_id))).scalar()
+
+
+def compaction_floor(db):
+    """Versione minima da cui il feed è completo"""
+    return db.execute(
+        select(func.max(Change.entity_id)).where(Change.entity == COMPACTION_ENTITY)
+    ).scalar() or 0
+
+
+def changes_since(db, book_id, since, limit=DEFAULT_LIMIT):
+    """Modifiche del libro con versione > since, compresse per entità (vince l'ultima).
+    Ritorna {'version', 'changes': [...], 'more', 'reset'}.
+    """
+    if since < compaction_floor(db):
+        return {'version': current_version(db, book_id), 'changes': [], 'more': False, 'reset': True}
+
+    rows = db.execute(
+        select(Change.id, Change.entity, Change.entity_id, Change.op)
+        .where(_book_filter(book_id), Change.id > since, Change.entity != COMPACTION_ENTITY)
+        .order_by(Change.id)
+        .limit(limit + 1)
+    ).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for version, entity, entity_id, op in rows:
+        previous = latest.pop((entity, entity_id), None)
+        # insert seguito da update resta un insert; insert seguito da delete si annulla
+        if previous and previous['op'] == OP_INSERT:
+            if op == OP_DELETE:
+                continue
+            op = OP_INSERT
+        latest[(entity, entity_id)] = {'entity': entity, 'id': entity_id, 'op': op, 'version': version}
+
+    version = rows[-1].id if rows else since
+    return {
+        'version': version,
+        'changes': sorted(latest.values(), key=lambda change: change['version']),
+        'more': more,
+        'reset': False,
+    }
+
+
+def compact(db, retention_seconds=TOMBSTONE_RETENTION_SECONDS, now=None):
+    """Compatta il registro. Non esegue commit. Ritorna il numero di righe eliminate.
+    - per ogni entità (e libro, per gli asset) resta solo l'ultima riga;
+    - le righe di libri eliminati restano solo come tombstone del libro;
+    - le tombstone più vecchie di retention_seconds sono eliminate e la soglia
+      di compattazione avanza (i client più vecchi ricevono reset=True).
+    """
+    now = time.time() if now is None else now
+    removed = 0
+
+    latest_ids = select(func.max(Change.id)).group_by(Change.entity, Change.entity_id, Change.book_id)
+    removed += db.execute(
+        delete(Change).where(Change.entity != COMPACTION_ENTITY, Change.id.not_in(latest_ids))
+    ).rowcount
+
+    deleted_books = select(Change.entity_id).where(Change.entity == 'book', Change.op == OP_DELETE)
+    removed += db.execute(
+        delete(Change).where(Change.book_id.in_(deleted_books), Change.entity != 'book')
+    ).rowcount
+
+    cutoff = now - retention_seconds
+    floor = db.execute(
+        select(func.max(Change.id)).where(
+            Change.op == OP_DELETE, Change.entity != COMPACTION_ENTITY, Change.created_at < cutoff
+        )
+    ).scalar()
+    if floor:
+        removed += db.execute(
+            delete(Change).where(Change.op == OP_DELETE, Change.id <= floor)
+        ).rowcount
+        db.execute(delete(Change).where(Change.entity == COMPACTION_ENTITY))
+        db.execute(insert(Change).values(entity=COMPACTION_ENTITY, entity_id=floor, op=OP_PURGE, book_id=None))
+    return removed
@@ -0,0 +1,161 @@
+"""
+Compressione delle risposte (gzip, brotli se disponibile)
+- after_request: comprime le risposte testuali sopra una soglia di dimensione
+- static: serve le varianti precompresse .br/.gz create da compress_static.py,
+  senza costo CPU per richiesta
+"""
+
+import gzip
+import mimetypes
+import os
+from flask import request, send_from_directory, current_app
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # dipendenza opzionale (pip install .[compression])
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+)
+
+# Estensioni statiche che vale la pena precomprimere
+PRECOMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.json', '.txt')
+
+# Codifica -> estensione del file precompresso (ordine di preferenza)
+PRECOMPRESSED_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encodings, encodings=None):
+    """Prima codifica supportata accettata dal client (None se nessuna)"""
+    for encoding in encodings or available_encodings():
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, level=6, brotli_quality=5):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _should_compress(response, app):
+    if response.status_code < 200 or response.status_code >= 300 or response.status_code == 204:
+        return False
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in app.config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES):
+        return False
+    length = response.content_length
+    if length is None:
+        length = len(response.get_data())
+    return length >= app.config.get('COMPRESS_MIN_SIZE', 500)
+
+
+def _compress_response(response):
+    app = current_app
+    response.vary.add('Accept-Encoding')
+    if not _should_compress(response, app):
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+
+    body = compress(
+        response.get_data(),
+        encoding,
+        level=app.config.get('COMPRESS_LEVEL', 6),
+        brotli_quality=app.config.get('COMPRESS_BR_QUALITY', 5),
+    )
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(body))
+    if response.get_etag()[0]:
+        etag, _ = response.get_etag()
+        response.set_etag(f"{etag}-{encoding}", weak=True)
+    return response
+
+
+def serve_static(filename):
+    """View 'static' con supporto ai file precompressi (.br/.gz accanto all'originale)"""
+    app = current_app
+    static_folder = app.static_folder
+    max_age = app.get_send_file_max_age(filename)
+
+    if filename.endswith(PRECOMPRESS_EXTENSIONS):
+        original_path = safe_join(static_folder, filename)
+        for encoding, suffix in PRECOMPRESSED_SUFFIXES:
+            if request.accept_encodings[encoding] <= 0 or not original_path:
+                continue
+            # Solo se la variante esiste ed è aggiornata rispetto all'originale
+            try:
+                if os.path.getmtime(original_path + suffix) < os.path.getmtime(original_path):
+                    continue
+            except OSError:
+                continue
+            response = send_from_directory(static_folder, filename + suffix, max_age=max_age)
+            # Content-Type dell'originale, non di .gz/.br
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+
+    response = send_from_directory(static_folder, filename, max_age=max_age)
+    if filename.endswith(PRECOMPRESS_EXTENSIONS):
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def precompress_static(static_folder, exclude_dirs=('media',), min_size=500):
+    """Scrive le varianti .gz (e .br se disponibile) dei file statici testuali.
+    Riscrive solo i file più vecchi dell'originale. Ritorna [(path, originale, {codifica: bytes})].
+    """
+    results = []
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root.split(os.sep)[0] in exclude_dirs:
+            dirs[:] = []
+            continue
+        for name in files:
+            if not name.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            size = os.path.getsize(path)
+            if size < min_size:
+                continue
+            data = None
+            sizes = {}
+            for encoding, suffix in PRECOMPRESSED_SUFFIXES:
+                if encoding not in available_encodings():
+                    continue
+                target = path + suffix
+                if not (os.path.isfile(target) and os.path.getmtime(target) >= os.path.getmtime(path)):
+                    if data is None:
+                        with open(path, 'rb') as f:
+                            data = f.read()
+                    with open(target, 'wb') as f:
+                        f.write(compress(data, encoding, level=9, brotli_quality=11))
+                sizes[encoding] = os.path.getsize(target)
+            results.append((path, size, sizes))
+    return results
+
+
+def init_compression(app):
+    """Registra compressione dinamica e view statica con file precompressi"""
+    if app.config.get('COMPRESS_ENABLED', True):
+        app.after_request(_compress_response)
+    app.view_functions['static'] = serve_static
@@ -0,0 +1,57 @@
+"""
+Controllo di concorrenza ottimistico per gli editor di carte e pagine
+Page.version e Card.version sono version_id_col: ogni UPDATE ORM è un
+compare-and-swap (WHERE id = ? AND version = <letta>) e fallisce con
+StaleDataError se un altro editor ha salvato nel frattempo.
+
+- i form e le chiamate AJAX inviano la versione su cui l'utente ha lavorato:
+  se non è più quella attuale la modifica è rifiutata subito (409) con lo
+  stato corrente, invece di sovrascrivere in silenzio;
+- chi occupa uno slot (nuova carta, spostamento) incrementa Page.slot_version
+  con un CAS: due editor che scelgono lo stesso slot libero non possono salvare
+  entrambi. Page.version cambia solo con i campi della pagina: il form della
+  pagina resta valido se un collega aggiunge o sposta una carta.
+
+Nessun lock pessimistico: su SQLite un lock tenuto durante la modifica
+serializzerebbe tutti gli editor (un solo writer per database).
+"""
+
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
+from app.models.page import Page
+
+
+class VersionConflict(Exception):
+    """Entità modificata da un altro editor; entity è l'oggetto da ricaricare"""
+
+    def __init__(self, entity):
+        super().__init__(f"{type(entity).__name__} {entity.id} modificata da un altro utente")
+        self.entity = entity
+
+
+def check_version(entity, expected):
+    """Confronta la versione inviata dal client con quella letta (None = non inviata)"""
+    if expected is not None and expected != entity.version:
+        raise VersionConflict(entity)
+
+
+def claim_slots(db, page):
+    """Incrementa slot_version della pagina solo se è ancora quella letta
+    (dopo aver verificato che lo slot è libero); VersionConflict altrimenti.
+    """
+    result = db.execute(
+        update(Page)
+        .where(Page.id == page.id, Page.slot_version == page.slot_version)
+        .values(slot_version=page.slot_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise VersionConflict(page)
+    set_committed_value(page, 'slot_version', page.slot_version + 1)
+
+
+def release_slots(page):
+    """Griglia della pagina cambiata: le occupazioni di slot lette prima falliscono.
+    Espressione SQL (non il valore letto): non annulla un claim_slots concorrente.
+    """
+    page.slot_version = Page.slot_version + 1
@@ -0,0 +1,257 @@
+"""
+Eventi server-sent (SSE) per aggiornare il runtime dopo le modifiche
+Dopo ogni commit che tocca un libro viene pubblicato un evento breve
+{"book_id", "pages": [...], "book": bool} ("pagina X modificata").
+
+Gli eventi sono letti da change_log (app.services.change_feed), condiviso da
+tutti i worker: un solo thread per processo (ChangeLogBus) interroga le righe
+oltre l'ultimo id letto ogni POLL_SECONDS e le consegna al broker locale.
+L'id dell'evento è l'id di change_log, uguale in ogni worker: un client che si
+riconnette a un altro worker riprende da Last-Event-ID.
+
+Fan-out senza un thread per client: un buffer circolare di eventi e una sola
+Condition condivisa; ogni connessione SSE ricorda l'ultimo id letto e attende
+sulla Condition (con heartbeat). Con worker gthread ogni stream occupa un
+thread: oltre SSE_MAX_STREAMS stream per worker la connessione è chiusa subito
+con un retry lungo (il browser si riconnette e riprende da Last-Event-ID).
+Con worker gevent (default in gunicorn.conf.py se installato) sono greenlet.
+
+Solo le modifiche legate a un libro generano eventi: un asset caricato o
+indicizzato non raggiunge nessuno stream.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from app.db import get_db, close_db
+from app.models.change import Change
+from app.services import change_feed  # noqa: F401 (listener che scrive change_log)
+
+HISTORY_SIZE = 256
+HEARTBEAT_SECONDS = 15
+MAX_STREAM_SECONDS = 300
+RETRY_MILLISECONDS = 3000
+BUSY_RETRY_MILLISECONDS = 30000
+POLL_SECONDS = 1.0
+POLL_BATCH = 1000
+
+
+class EventBroker:
+    """Ultimi HISTORY_SIZE eventi con id crescente; i lettori attendono sulla Condition"""
+
+    def __init__(self, history=HISTORY_SIZE):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)  # (id, book_id, data)
+        self._last_id = 0
+        # Eventi con id <= _lost non sono più (o non sono mai stati) nel buffer
+        self._lost = 0
+
+    @property
+    def last_id(self):
+        with self._condition:
+            return self._last_id
+
+    def publish(self, book_id, data, event_id=None):
+        """Evento del libro book_id; event_id crescente (default: il successivo)"""
+        with self._condition:
+            self._last_id = max(self._last_id + 1, event_id or 0)
+            if len(self._events) == self._events.maxlen:
+                self._lost = self._events[0][0]
+            self._events.append((self._last_id, book_id, data))
+            self._condition.notify_all()
+            return self._last_id
+
+    def advance(self, event_id, lost=False):
+        """Avanza l'ultimo id senza eventi; lost=True se quelli precedenti non sono noti"""
+        with self._condition:
+            self._last_id = max(self._last_id, event_id)
+            if lost:
+                self._lost = max(self._lost, event_id)
+
+    def wait(self, book_id, after_id, timeout):
+        """Eventi del libro con id > after_id, attendendo al massimo timeout secondi.
+        Ritorna (ultimo id visto, [(id, data)], lagged); lagged=True se eventi
+        successivi ad after_id sono andati persi (il client deve ricaricare).
+        """
+        with self._condition:
+            if self._last_id <= after_id:
+                self._condition.wait(timeout)
+            if self._last_id <= after_id:
+                return after_id, [], False
+            lagged = self._lost > after_id
+            items = [
+                (event_id, data)
+                for event_id, event_book_id, data in self._events
+                if event_id > after_id and event_book_id == book_id
+            ]
+            return self._last_id, items, lagged
+
+
+def events_from_changes(rows):
+    """Eventi [(id, book_id, data)] da righe (id, book_id, page_id) di change_log:
+    uno per libro, con id l'ultima riga del libro. page_id NULL = libro intero.
+    """
+    books = {}
+    for change_id, book_id, page_id in rows:
+        last_id, pages = books.get(book_id, (0, set()))
+        pages.add(page_id)
+        books[book_id] = (max(last_id, change_id), pages)
+    events = [
+        (last_id, book_id, {
+            'book_id': book_id,
+            'pages': sorted(page_id for page_id in pages if page_id is not None),
+            'book': None in pages,
+        })
+        for book_id, (last_id, pages) in books.items()
+    ]
+    return sorted(events, key=lambda item: item[0])
+
+
+class ChangeLogBus:
+    """Bus condiviso tra i worker: ogni processo legge change_log con un solo thread"""
+
+    def __init__(self, broker, interval=POLL_SECONDS, batch_size=POLL_BATCH):
+        """interval None = nessun thread (lettura solo con poll(), es. nei test)"""
+        self.broker = broker
+        self.interval = interval
+        self.batch_size = batch_size
+        self._last_seen = None
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def _latest(self, db):
+        return db.execute(select(func.coalesce(func.max(Change.id), 0))).scalar()
+
+    def poll(self):
+        """Consegna al broker le righe successive all'ultima letta; ritorna gli eventi pubblicati"""
+        with self._lock:
+            db = get_db()
+            try:
+                if self._last_seen is None:
+                    # Prima lettura: nessuno storico, gli stream partono da qui
+                    self._last_seen = self._latest(db)
+                    self.broker.advance(self._last_seen, lost=True)
+                    return 0
+                published = 0
+                while True:
+                    rows = db.execute(
+                        select(Change.id, Change.book_id, Change.page_id)
+                        .where(Change.id > self._last_seen)
+                        .order_by(Change.id)
+                        .limit(self.batch_size)
+                    ).all()
+                    if not rows:
+                        return published
+                    # Righe senza libro (compattazione, versioni precedenti): nessun evento
+                    relevant = [row for row in rows if row.book_id is not None]
+                    for event_id, book_id, data in events_from_changes(relevant):
+                        self.broker.publish(book_id, data, event_id)
+                        published += 1
+                    self._last_seen = rows[-1].id
+                    self.broker.advance(self._last_seen)
+            finally:
+                close_db(db)
+
+    def start(self):
+        """Avvia il thread di lettura nel processo corrente (anche dopo il fork dei worker)"""
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._last_seen = None
+        self.poll()
+        if self.interval is not None:
+            threading.Thread(target=self._run, name='sse-change-log', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except SQLAlchemyError as e:  # il thread non deve terminare
+                print(f"Errore nella lettura di change_log: {e}")
+
+
+broker = EventBroker()
+bus = ChangeLogBus(broker)
+
+
+def set_bus(new_bus):
+    """Sostituisce il bus (es. nei test)"""
+    global bus
+    bus = new_bus
+
+
+_streams = 0
+_streams_lock = threading.Lock()
+
+
+def _open_stream(limit):
+    """Conta lo stream se sotto il limite per worker (0 = nessun limite)"""
+    global _streams
+    with _streams_lock:
+        if limit and _streams >= limit:
+            return False
+        _streams += 1
+        return True
+
+
+def _close_stream():
+    global _streams
+    with _streams_lock:
+        _streams -= 1
+
+
+def _format(event_id, name, data):
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def stream_events(book_id, last_event_id=None):
+    """Risposta text/event-stream per il libro; riprende da Last-Event-ID se ancora nel buffer"""
+    config = current_app.config
+    heartbeat = config.get('SSE_HEARTBEAT', HEARTBEAT_SECONDS)
+    max_duration = config.get('SSE_MAX_DURATION', MAX_STREAM_SECONDS)
+    bus.start()
+    broker = bus.broker
+    current = broker.last_id
+    after_id = current if last_event_id is None or last_event_id > current else last_event_id
+
+    if not _open_stream(config.get('SSE_MAX_STREAMS', 0)):
+        # Thread del worker esauriti: il browser riprova più tardi da Last-Event-ID
+        response = Response(f"retry: {BUSY_RETRY_MILLISECONDS}\n\n", mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def generate():
+        nonlocal after_id
+        # Il client si riconnette dopo max_duration: i worker non restano occupati per sempre
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        started = last_write = time.monotonic()
+        while True:
+            remaining = started + max_duration - time.monotonic()
+            if remaining <= 0:
+                return
+            after_id, items, lagged = broker.wait(book_id, after_id, min(heartbeat, remaining))
+            if lagged:
+                yield _format(after_id, 'reset', {'book_id': book_id})
+            for event_id, data in items:
+                yield _format(event_id, 'change', data)
+            if lagged or items:
+                last_write = time.monotonic()
+            elif time.monotonic() - last_write >= heartbeat:
+                # Commento SSE: mantiene viva la connessione attraverso i proxy
+                yield ": ping\n\n"
+                last_write = time.monotonic()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: niente buffering dello stream
+    response.call_on_close(_close_stream)
+    return response
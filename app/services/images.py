@@ -0,0 +1,245 @@
+"""
+Elaborazione delle immagini caricate: derivati ridimensionati e hash percettivo
+Senza dipendenze da Flask, così da poter essere eseguita anche nei processi
+worker dell'import in blocco (app.services.bulk_import).
+
+Memoria limitata per upload: le dimensioni sono lette dall'header prima di
+decodificare; i JPEG sono decodificati direttamente a 1/2, 1/4 o 1/8 della
+risoluzione (draft) e gli altri formati ridotti con reduce() alla dimensione
+del derivato più grande, da cui sono ricavati tutti gli altri; palette e CMYK
+sono convertiti in RGB a strisce, già ridotti. Oltre
+MAX_IMAGE_PIXELS pixel decodificati l'immagine è rifiutata (ImageTooLarge).
+"""
+
+import hashlib
+import os
+from PIL import Image
+from sqlalchemy import update
+from app.config import config
+from app.models.asset import DERIVATIVE_BITS, Asset, normalize_media_url
+from app.services import similarity
+
+# Configurazioni per upload
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp', 'svg'}
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+IMAGE_SIZES = {
+    'thumbnail': (150, 150),
+    'medium': (400, 400),
+    'large': (800, 800)
+}
+
+HASH_CHUNK = 1024 * 1024
+
+# reduce() intero prima del LANCZOS finale: qualità invariata, memoria e CPU ridotte
+REDUCING_GAP = 3.0
+# Modi convertiti (palette, CMYK): riduzione intera durante la conversione, almeno
+# 2 volte la dimensione finale, a strisce di circa CONVERT_STRIP_PIXELS pixel
+CONVERT_REDUCING_GAP = 2.0
+CONVERT_STRIP_PIXELS = 1024 * 1024
+
+
+class ImageTooLarge(ValueError):
+    """Immagine oltre il limite di pixel decodificabili (possibile decompression bomb)"""
+
+
+def open_image(path, max_pixels=None, draft_size=None):
+    """Apre l'immagine leggendo solo l'header e verifica il limite di pixel prima
+    della decodifica. Con draft_size i JPEG sono decodificati già ridotti.
+    """
+    max_pixels = max_pixels or config.MAX_IMAGE_PIXELS
+    try:
+        img = Image.open(path)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+    if draft_size:
+        img.draft('RGB', draft_size)
+    width, height = img.size
+    if width * height > max_pixels:
+        img.close()
+        raise ImageTooLarge(f"Immagine troppo grande ({width}×{height} pixel, massimo {max_pixels})")
+    return img
+
+
+def is_raster(path):
+    """True se Pillow riconosce l'immagine dall'header (nessuna decodifica).
+    SVG e file non leggibili: False; oltre il limite di pixel solleva ImageTooLarge.
+    """
+    try:
+        open_image(path).close()
+    except ImageTooLarge:
+        raise
+    except Exception:
+        return False
+    return True
+
+
+def _converted_reduced(img, mode, factor):
+    """img.convert(mode).reduce(factor) convertendo una striscia di righe alla volta:
+    la copia convertita non esiste mai a piena risoluzione
+    """
+    width, height = img.size
+    reduced = Image.new(mode, (-(-width // factor), -(-height // factor)))
+    rows = max(1, CONVERT_STRIP_PIXELS // (width * factor)) * factor
+    for top in range(0, height, rows):
+        strip = img.crop((0, top, width, min(top + rows, height)))
+        # Trasparenza premoltiplicata (RGBa), come fanno reduce() e resize() per RGBA
+        strip = strip.convert('RGBA').convert(mode) if mode == 'RGBa' else strip.convert(mode)
+        reduced.paste(strip.reduce(factor), (0, top // factor))
+    return reduced
+
+
+def reduce_to(img, size):
+    """Ridimensiona entro size. Palette, CMYK e gli altri modi non supportati dal
+    LANCZOS sono convertiti a strisce già ridotti (reduce() intero), poi ridimensionati
+    """
+    if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        transparent = 'transparency' in img.info or img.mode == 'PA'
+        factor = int(max(img.width / size[0], img.height / size[1]) / CONVERT_REDUCING_GAP)
+        if factor < 2:
+            img = img.convert('RGBA' if transparent else 'RGB')
+        else:
+            img = _converted_reduced(img, 'RGBa' if transparent else 'RGB', factor)
+            img.thumbnail(size, Image.Resampling.LANCZOS)
+            return img.convert('RGBA') if transparent else img
+    img.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+    return img
+
+
+def flatten(img):
+    """Nuova immagine RGB con la trasparenza composta su sfondo bianco
+    (sempre una copia: resta valida dopo la chiusura del file)
+    """
+    if img.mode in ('RGBA', 'LA'):
+        rgba = img.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return img.copy() if img.mode == 'RGB' else img.convert('RGB')
+
+
+def _bounding_size(sizes):
+    return (max(width for width, _ in sizes.values()), max(height for _, height in sizes.values()))
+
+
+def process_image(file_path, sizes=None, max_pixels=None):
+    """Crea i derivati ridimensionati e calcola l'hash percettivo.
+    Solleva ImageTooLarge oltre il limite di pixel; per gli altri errori
+    (es. SVG, file non leggibili) ritorna None.
+    """
+    if not sizes:
+        sizes = IMAGE_SIZES
+
+    try:
+        largest = _bounding_size(sizes)
+        with open_image(file_path, max_pixels, draft_size=largest) as img:
+            # Dimensioni originali dall'header (draft cambia solo la decodifica)
+            with Image.open(file_path) as header:
+                original_size = header.size
+            work = flatten(reduce_to(img, largest))
+
+        processed_sizes = {'original': original_size}
+        # Hash percettivo sull'immagine ridotta: stesso risultato, senza la copia a piena risoluzione
+        processed_sizes['phash'] = similarity.format_hash(similarity.dhash(work))
+
+        base_path = os.path.splitext(file_path)[0]
+
+        # Dal più grande al più piccolo, ognuno ricavato dal precedente
+        for size_name, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            work.thumbnail(size, Image.Resampling.LANCZOS)
+            work.save(f"{base_path}_{size_name}.jpg", 'JPEG', quality=90, optimize=True)
+            processed_sizes[size_name] = work.size
+
+        return processed_sizes
+
+    except ImageTooLarge:
+        raise
+    except Exception as e:
+        print(f"Errore nel processamento dell'immagine: {e}")
+        return None
+
+
+def render_derivative(source_path, size, target_path, max_pixels=None):
+    """Salva una sola versione ridimensionata (JPEG su sfondo bianco) di source_path.
+    Scrittura su file temporaneo e rename: le richieste concorrenti non vedono file parziali.
+    """
+    with open_image(source_path, max_pixels, draft_size=size) as img:
+        img = flatten(reduce_to(img, size))
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    partial = f"{target_path}.{os.getpid()}.part"
+    img.save(partial, 'JPEG', quality=90, optimize=True)
+    os.replace(partial, target_path)
+    return target_path
+
+
+def content_hash(path):
+    """sha256 esadecimale del contenuto, letto a blocchi"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_metadata(path, processed_sizes=None):
+    """Colonne Asset per un file appena salvato: dimensioni, byte, hash, derivati e phash
+    (processed_sizes è il risultato di process_image, None per SVG o immagini non elaborate)
+    """
+    processed_sizes = processed_sizes or {}
+    width, height = processed_sizes.get('original', (None, None))
+    return {
+        'width': width,
+        'height': height,
+        'byte_size': os.path.getsize(path),
+        'content_hash': content_hash(path),
+        'derivatives': sum(bit for name, bit in DERIVATIVE_BITS.items() if name in processed_sizes),
+        'phash': processed_sizes.get('phash'),
+    }
+
+
+def _existing_metadata(path):
+    """Metadati di un file già caricato: dimensioni dall'header, derivati presenti su disco"""
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+    except Exception:
+        width = height = None  # SVG o file non leggibile
+    base_path = os.path.splitext(path)[0]
+    return {
+        'width': width,
+        'height': height,
+        'byte_size': os.path.getsize(path),
+        'content_hash': content_hash(path),
+        'derivatives': sum(
+            bit for name, bit in DERIVATIVE_BITS.items() if os.path.exists(f"{base_path}_{name}.jpg")
+        ),
+    }
+
+
+def backfill_metadata(db, media_dir, batch_size=500):
+    """Compila i metadati degli asset caricati prima delle nuove colonne, con un UPDATE
+    e un commit per blocco (un'esecuzione interrotta riprende dagli asset mancanti).
+    Ritorna (aggiornati, file mancanti).
+    """
+    updated = missing = 0
+    last_id = 0
+    while True:
+        assets = db.query(Asset.id, Asset.url).filter(
+            Asset.content_hash.is_(None), Asset.id > last_id, Asset.url.not_like('library/%')
+        ).order_by(Asset.id).limit(batch_size).all()
+        if not assets:
+            return updated, missing
+        rows = []
+        for asset_id, url in assets:
+            url = normalize_media_url(url)
+            if not url.startswith('/static/media/'):
+                continue  # remoti e librerie di simboli
+            path = os.path.join(str(media_dir), url[len('/static/media/'):])
+            if not os.path.isfile(path):
+                missing += 1
+                continue
+            rows.append({'id': asset_id, **_existing_metadata(path)})
+        if rows:
+            db.execute(update(Asset), rows)
+        db.commit()
+        updated += len(rows)
+        last_id = assets[-1].id
@@ -0,0 +1,180 @@
+"""
+Ricerca di parole in carte, pagine e libri ("trova una parola" nel runtime)
+Interroga l'indice FTS5 di app.models.search_index: ogni parola della query
+è cercata come prefisso (typeahead), gli accenti sono ignorati e i risultati
+sono ordinati per rilevanza (bm25). Con book_id il filtro sul libro è un
+termine della stessa MATCH, quindi non si leggono le carte degli altri libri.
+
+Le carte trovate includono il percorso di pagine dalla home (link_graph).
+L'indice delle carte segue le bozze: carte e pagine di un libro pubblicato sono
+cercate nell'indice degli snapshot (scritto da publish_book) con una MATCH
+equivalente, e i due risultati sono uniti per bm25.
+"""
+
+import json
+import re
+from sqlalchemy import Integer, cast, null, select, text, union_all
+from app.models.asset import Asset
+from app.models.book import Book
+from app.models.card import Card
+from app.models.page import Page
+from app.models.search_index import (
+    book_search, card_search, page_search, snapshot_card_search, snapshot_page_search,
+)
+from app.services.link_graph import get_link_graph
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+MAX_WORDS = 8
+
+WORD_RE = re.compile(r'\w+')
+
+
+def match_expression(query, column, book_id=None):
+    """Espressione FTS5 per la query utente (None se non contiene parole).
+    Le parole sono tra virgolette: la sintassi FTS5 nella query non è interpretata.
+    """
+    words = WORD_RE.findall(query or '')[:MAX_WORDS]
+    if not words:
+        return None
+    terms = ' '.join(f'"{word}"*' for word in words)
+    expression = f'{column} : ({terms})'
+    if book_id is not None:
+        expression += f' AND book : "{int(book_id)}"'
+    return expression
+
+
+def _draft_cards(expression, drafts_only):
+    statement = (
+        select(
+            Card.id, Card.label, Card.page_id, Page.title.label('page_title'), Page.book_id,
+            Asset.url.label('image_url'), Asset.content_hash, card_search.c.rank, null().label('path'),
+        )
+        .select_from(card_search)
+        .join(Card, Card.id == card_search.c.rowid)
+        .join(Page, Page.id == Card.page_id)
+        .outerjoin(Asset, Asset.id == Card.image_id)
+        .where(card_search.c.card_search.op('MATCH')(expression))
+    )
+    if drafts_only:
+        # Libri pubblicati: cercati nell'indice degli snapshot
+        statement = statement.join(Book, Book.id == Page.book_id).where(Book.published_at.is_(None))
+    return statement
+
+
+def _published_cards(expression):
+    table = snapshot_card_search
+    return select(
+        table.c.rowid, table.c.label, table.c.page_id, table.c.page_title,
+        cast(table.c.book, Integer), table.c.image_url, table.c.content_hash, table.c.rank, table.c.path,
+    ).where(table.c.snapshot_card_search.op('MATCH')(expression))
+
+
+def _draft_pages(expression, drafts_only):
+    statement = (
+        select(Page.id, Page.title, Page.book_id, page_search.c.rank, null().label('path'))
+        .select_from(page_search)
+        .join(Page, Page.id == page_search.c.rowid)
+        .where(page_search.c.page_search.op('MATCH')(expression))
+    )
+    if drafts_only:
+        statement = statement.join(Book, Book.id == Page.book_id).where(Book.published_at.is_(None))
+    return statement
+
+
+def _published_pages(expression):
+    table = snapshot_page_search
+    return select(
+        table.c.rowid, table.c.title, cast(table.c.book, Integer), table.c.rank, table.c.path,
+    ).where(table.c.snapshot_page_search.op('MATCH')(expression))
+
+
+def _ranked(db, draft, published, limit):
+    """Bozze e (se richiesto) snapshot in una sola query, per bm25 (rank più basso = più rilevante)"""
+    statement = draft if published is None else union_all(draft, published)
+    return db.execute(statement.order_by(text('rank')).limit(limit)).all()
+
+
+def search_cards(db, query, book_id=None, limit=DEFAULT_LIMIT, drafts=False):
+    """Carte per rilevanza: righe (id, label, page_id, page_title, book_id, image_url,
+    content_hash, rank, path). I libri pubblicati sono cercati negli snapshot
+    (path: percorso dalla home pubblicata in JSON), salvo drafts=True.
+    """
+    expression = match_expression(query, 'label', book_id)
+    if not expression:
+        return []
+    return _ranked(db, _draft_cards(expression, not drafts),
+                   None if drafts else _published_cards(expression), limit)
+
+
+def search_pages(db, query, book_id=None, limit=DEFAULT_LIMIT, drafts=False):
+    """Pagine per rilevanza: righe (id, title, book_id, rank, path), come search_cards"""
+    expression = match_expression(query, 'title', book_id)
+    if not expression:
+        return []
+    return _ranked(db, _draft_pages(expression, not drafts),
+                   None if drafts else _published_pages(expression), limit)
+
+
+def search_books(db, query, limit=DEFAULT_LIMIT):
+    """Libri per rilevanza: righe (id, title)"""
+    expression = match_expression(query, 'title')
+    if not expression:
+        return []
+    return db.execute(
+        select(Book.id, Book.title)
+        .select_from(book_search)
+        .join(Book, Book.id == book_search.c.rowid)
+        .where(book_search.c.book_search.op('MATCH')(expression))
+        .order_by(book_search.c.rank)
+        .limit(limit)
+    ).all()
+
+
+def page_paths(db, page_ids_by_book):
+    """{page_id: [(id, title), ...]} percorso dalla home per le pagine trovate
+    (grafo di navigazione in cache, una query per i titoli delle pagine attraversate)
+    """
+    if not page_ids_by_book:
+        return {}
+    homes = dict(db.execute(
+        select(Book.id, Book.home_page_id).where(Book.id.in_(page_ids_by_book))
+    ).all())
+    paths = {}
+    for book_id, page_ids in page_ids_by_book.items():
+        home_page_id = homes.get(book_id)
+        if home_page_id is None:
+            continue
+        graph = get_link_graph(db, book_id)
+        for page_id in page_ids:
+            path = graph.path_to(home_page_id, page_id)
+            if path:
+                paths[page_id] = path
+    needed = {page_id for path in paths.values() for page_id in path}
+    titles = dict(db.execute(select(Page.id, Page.title).where(Page.id.in_(needed))).all()) if needed else {}
+    return {page_id: [(step, titles.get(step)) for step in path] for page_id, path in paths.items()}
+
+
+def search(db, query, book_id=None, limit=DEFAULT_LIMIT, drafts=False):
+    """{'cards', 'pages', 'books', 'paths'}: libri solo nella ricerca globale (book_id None).
+    I libri pubblicati sono cercati nell'indice degli snapshot, salvo drafts=True
+    (anteprima delle bozze di book_id); i risultati sono uniti per rilevanza.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    cards = search_cards(db, query, book_id, limit, drafts)
+    pages = search_pages(db, query, book_id, limit, drafts)
+    books = search_books(db, query, limit) if book_id is None else []
+
+    # Percorsi: già risolti alla pubblicazione, dal grafo di navigazione per le bozze
+    paths = {}
+    page_ids_by_book = {}
+    for found_book_id, page_id, path in (
+        [(card.book_id, card.page_id, card.path) for card in cards]
+        + [(page.book_id, page.id, page.path) for page in pages]
+    ):
+        if path is not None:
+            paths[page_id] = [tuple(step) for step in json.loads(path)]
+        else:
+            page_ids_by_book.setdefault(found_book_id, set()).add(page_id)
+    paths.update(page_paths(db, page_ids_by_book))
+    return {'cards': cards, 'pages': pages, 'books': books, 'paths': paths}
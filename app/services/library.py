@@ -0,0 +1,241 @@
+"""
+Librerie di simboli in sola lettura indicizzate sul posto
+Set di pittogrammi con licenza (decine di migliaia di PNG/SVG con JSON di
+metadati) montati in sola lettura: i file sono registrati come Asset senza
+copiarli (url 'library/<nome>/<percorso>', servito da /assets/library/...).
+
+- le parole chiave del JSON accanto all'immagine (<nome>.json) vanno in
+  Asset.alt/keywords, usati dalla ricerca degli asset;
+- il manifest library_file conserva mtime/size di immagine e JSON: una nuova
+  scansione legge solo le stat dei file e rielabora quelli cambiati;
+- i derivati (_thumbnail/_medium/_large) sono generati al primo accesso in
+  LIBRARY_CACHE_DIR, la cartella della libreria non viene mai scritta.
+"""
+
+import json
+import mimetypes
+import os
+from PIL import Image
+from sqlalchemy import delete, exists, insert, select, update
+from werkzeug.security import safe_join
+from app.models.asset import Asset
+from app.models.card import Card
+from app.models.library_file import LibraryFile
+from app.services import change_feed
+from app.services.images import ALLOWED_EXTENSIONS, IMAGE_SIZES, render_derivative
+
+URL_PREFIX = 'library/'
+BATCH_SIZE = 1000
+METADATA_EXTENSION = '.json'
+
+# Chiavi del JSON di metadati con l'etichetta del simbolo
+LABEL_KEYS = ('label', 'name', 'title')
+
+
+def asset_url(library, path):
+    return f"{URL_PREFIX}{library}/{path}"
+
+
+def split_url(url):
+    """(libreria, percorso) per un url 'library/...', None per gli altri asset"""
+    if not url or not url.startswith(URL_PREFIX):
+        return None
+    library, _, path = url[len(URL_PREFIX):].partition('/')
+    return (library, path) if library and path else None
+
+
+def iter_library_files(root):
+    """Scansione ricorsiva: (percorso relativo, mtime_ns, size), file e cartelle nascosti esclusi"""
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, rel_dir))
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir():
+                    stack.append(rel)
+                elif entry.is_file():
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    yield rel, stat.st_mtime_ns, stat.st_size
+
+
+def read_metadata(path):
+    """(etichetta, [parole chiave]) dal JSON di metadati; (None, []) se assente o non valido.
+    Accetta keywords come lista di stringhe o di oggetti {"keyword": ...}.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None, []
+    if not isinstance(data, dict):
+        return None, []
+    keywords = []
+    for item in data.get('keywords') or []:
+        word = item.get('keyword') if isinstance(item, dict) else item
+        if isinstance(word, str) and word.strip() and word.strip() not in keywords:
+            keywords.append(word.strip())
+    label = next((data[key] for key in LABEL_KEYS if isinstance(data.get(key), str) and data[key].strip()), None)
+    return (label.strip() if label else None), keywords
+
+
+def _image_size(path):
+    """(larghezza, altezza) dall'header, senza decodificare (None, None) per SVG"""
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None, None
+
+
+def _asset_values(root, path, size, meta_mtime_ns):
+    label, keywords = read_metadata(os.path.join(root, _metadata_path(path))) if meta_mtime_ns else (None, [])
+    stem = os.path.splitext(os.path.basename(path))[0]
+    width, height = _image_size(os.path.join(root, path))
+    return {
+        'alt': label or (keywords[0] if keywords else stem.replace('_', ' ')),
+        'keywords': ' '.join(keywords) or None,
+        'width': width,
+        'height': height,
+        'byte_size': size,
+    }
+
+
+def _metadata_path(path):
+    return os.path.splitext(path)[0] + METADATA_EXTENSION
+
+
+def index_library(db, name, root, batch_size=BATCH_SIZE):
+    """Registra o aggiorna gli Asset della libreria name (cartella root), con commit a blocchi.
+    Ritorna il report {'files', 'added', 'updated', 'unchanged', 'removed', 'missing'}.
+    """
+    root = str(root)
+    files = {}
+    for path, mtime_ns, size in iter_library_files(root):
+        files[path] = (mtime_ns, size)
+
+    manifest = {
+        row.path: row
+        for row in db.execute(
+            select(LibraryFile.id, LibraryFile.path, LibraryFile.mtime_ns, LibraryFile.size,
+                   LibraryFile.meta_mtime_ns, LibraryFile.asset_id).where(LibraryFile.library == name)
+        )
+    }
+
+    report = {'files': 0, 'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'missing': 0}
+    added, changed = [], []
+    for path in sorted(files):
+        if os.path.splitext(path)[1][1:].lower() not in ALLOWED_EXTENSIONS:
+            continue
+        report['files'] += 1
+        mtime_ns, size = files[path]
+        meta_mtime_ns = files.get(_metadata_path(path), (0, 0))[0]
+        known = manifest.get(path)
+        if known is None:
+            added.append((path, mtime_ns, size, meta_mtime_ns))
+        elif (known.mtime_ns, known.size, known.meta_mtime_ns) != (mtime_ns, size, meta_mtime_ns):
+            changed.append((known, mtime_ns, size, meta_mtime_ns))
+        else:
+            report['unchanged'] += 1
+
+    for start in range(0, len(added), batch_size):
+        _add_batch(db, name, root, added[start:start + batch_size])
+        report['added'] += len(added[start:start + batch_size])
+    for start in range(0, len(changed), batch_size):
+        _update_batch(db, root, changed[start:start + batch_size])
+        report['updated'] += len(changed[start:start + batch_size])
+
+    gone = [row for path, row in manifest.items() if path not in files]
+    for start in range(0, len(gone), batch_size):
+        removed = _remove_batch(db, gone[start:start + batch_size])
+        report['removed'] += removed
+        report['missing'] += len(gone[start:start + batch_size]) - removed
+    return report
+
+
+def _add_batch(db, name, root, entries):
+    rows = [
+        {
+            'kind': mimetypes.guess_type(path)[0] or 'application/octet-stream',
+            'url': asset_url(name, path),
+            **_asset_values(root, path, size, meta_mtime_ns),
+        }
+        for path, _, size, meta_mtime_ns in entries
+    ]
+    inserted = dict((url, asset_id) for asset_id, url in db.execute(
+        insert(Asset).returning(Asset.id, Asset.url), rows
+    ))
+    db.execute(insert(LibraryFile), [
+        {
+            'library': name, 'path': path, 'mtime_ns': mtime_ns, 'size': size,
+            'meta_mtime_ns': meta_mtime_ns, 'asset_id': inserted[asset_url(name, path)],
+        }
+        for path, mtime_ns, size, meta_mtime_ns in entries
+    ])
+    db.commit()  # asset nuovi: non ancora usati, nessuna riga nel change feed
+
+
+def _update_batch(db, root, entries):
+    db.execute(update(Asset), [
+        {'id': known.asset_id, **_asset_values(root, known.path, size, meta_mtime_ns)}
+        for known, _, size, meta_mtime_ns in entries
+    ])
+    db.execute(update(LibraryFile), [
+        {'id': known.id, 'mtime_ns': mtime_ns, 'size': size, 'meta_mtime_ns': meta_mtime_ns}
+        for known, mtime_ns, size, meta_mtime_ns in entries
+    ])
+    change_feed.record_assets(db, [known.asset_id for known, *_ in entries], change_feed.OP_UPDATE)
+    db.commit()
+
+
+def _remove_batch(db, rows):
+    """Elimina gli asset dei file spariti non usati da carte; quelli usati restano (file mancante)"""
+    asset_ids = [row.asset_id for row in rows]
+    unused = db.execute(
+        select(Asset.id).where(Asset.id.in_(asset_ids), ~exists().where(Card.image_id == Asset.id))
+    ).scalars().all()
+    if unused:
+        # library_file eliminato in cascata
+        # Non usati da nessuna carta: nessun libro da notificare
+        db.execute(delete(Asset).where(Asset.id.in_(unused)))
+    db.commit()
+    return len(unused)
+
+
+def source_path(libraries, name, path):
+    """Percorso del file originale (None se la libreria non è configurata o il percorso non è valido)"""
+    root = libraries.get(name)
+    return safe_join(str(root), path) if root else None
+
+
+def derivative_path(libraries, cache_dir, name, path, size_name):
+    """Derivato size_name del file, generato al primo accesso o se l'originale è cambiato.
+    None per SVG, file mancanti o immagini non leggibili.
+    """
+    source = source_path(libraries, name, path)
+    if not source or size_name not in IMAGE_SIZES or path.lower().endswith('.svg'):
+        return None
+    target = safe_join(str(cache_dir), name, f"{os.path.splitext(path)[0]}_{size_name}.jpg")
+    try:
+        source_mtime = os.stat(source).st_mtime_ns
+    except OSError:
+        return None
+    try:
+        if target and os.stat(target).st_mtime_ns >= source_mtime:
+            return target
+    except OSError:
+        pass
+    try:
+        return render_derivative(source, IMAGE_SIZES[size_name], target)
+    except Exception as e:
+        print(f"Errore nella generazione del derivato {name}/{path}: {e}")
+        return None
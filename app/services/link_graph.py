@@ -0,0 +1,178 @@
+"""
+Grafo di navigazione dei libri (Card.target_page_id)
+Calcolato con una sola query per libro e tenuto in cache in memoria finché
+una carta, pagina o asset non cambia (invalidata al commit); usato da runtime_book/runtime_page
+per emettere hint <link rel="prefetch"> verso le pagine raggiungibili.
+"""
+
+import threading
+import time
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.orm import Session, aliased
+from app.models.asset import Asset, normalize_media_url
+from app.models.card import Card
+from app.models.page import Page
+
+# Limite di sicurezza: la cache è per processo, un'altra istanza (worker)
+# può aver modificato il libro. Un hint obsoleto costa solo un prefetch inutile.
+CACHE_TTL_SECONDS = 300
+
+# Quanti hint emettere al massimo per pagina
+MAX_PREFETCH_PAGES = 6
+MAX_PREFETCH_IMAGES = 36
+
+
+class LinkGraph:
+    """Collegamenti uscenti e immagini delle carte per ogni pagina di un libro"""
+
+    def __init__(self, book_id, targets, images, card_pages=()):
+        self.book_id = book_id
+        self.card_pages = set(card_pages)  # pagine che contengono almeno una carta
+        self.targets = targets  # page_id -> [target_page_id, ...] (ordine griglia, senza duplicati)
+        self.images = images    # page_id -> [url immagine normalizzato, ...]
+        self.built_at = time.monotonic()
+        self._parents = {}      # home_page_id -> {page_id: pagina precedente} (visita in ampiezza)
+
+    @property
+    def page_ids(self):
+        return set(self.targets) | set(self.images) | self.card_pages
+
+    def prefetch_for(self, page_id, max_pages=MAX_PREFETCH_PAGES, max_images=MAX_PREFETCH_IMAGES):
+        """Pagine target e relative immagini da precaricare partendo da page_id"""
+        pages = [target for target in self.targets.get(page_id, []) if target != page_id][:max_pages]
+        current_images = set(self.images.get(page_id, []))
+        images = []
+        for target in pages:
+            for url in self.images.get(target, []):
+                if url not in current_images and url not in images:
+                    images.append(url)
+        return pages, images[:max_images]
+
+    def path_to(self, home_page_id, page_id):
+        """Percorso più breve di pagine dalla home a page_id (estremi inclusi),
+        None se page_id non è raggiungibile con le carte di navigazione
+        """
+        parents = self._parents.get(home_page_id)
+        if parents is None:
+            parents = {home_page_id: None}
+            queue = deque([home_page_id])
+            while queue:
+                current = queue.popleft()
+                for target in self.targets.get(current, []):
+                    if target not in parents:
+                        parents[target] = current
+                        queue.append(target)
+            self._parents[home_page_id] = parents
+        if page_id not in parents:
+            return None
+        path = []
+        while page_id is not None:
+            path.append(page_id)
+            page_id = parents[page_id]
+        return path[::-1]
+
+
+def build_link_graph(db, book_id):
+    """Una query: carte del libro con pagina target (stesso libro) e url immagine"""
+    target = aliased(Page)
+    rows = db.query(Card.page_id, target.id, Asset.url).join(
+        Page, Card.page_id == Page.id
+    ).outerjoin(
+        target, (Card.target_page_id == target.id) & (target.book_id == book_id)
+    ).outerjoin(
+        Asset, Card.image_id == Asset.id
+    ).filter(
+        Page.book_id == book_id
+    ).order_by(Card.page_id, Card.slot_row, Card.slot_col).all()
+
+    targets = {}
+    images = {}
+    card_pages = set()
+    for page_id, target_id, image_url in rows:
+        card_pages.add(page_id)
+        if target_id is not None:
+            page_targets = targets.setdefault(page_id, [])
+            if target_id not in page_targets:
+                page_targets.append(target_id)
+        if image_url:
+            images.setdefault(page_id, []).append(normalize_media_url(image_url))
+    return LinkGraph(book_id, targets, images, card_pages)
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def get_link_graph(db, book_id):
+    """Grafo del libro dalla cache, ricalcolato se assente o scaduto"""
+    with _lock:
+        graph = _cache.get(book_id)
+    if graph and time.monotonic() - graph.built_at < CACHE_TTL_SECONDS:
+        return graph
+    graph = build_link_graph(db, book_id)
+    with _lock:
+        _cache[book_id] = graph
+    return graph
+
+
+def invalidate(book_id=None, page_ids=()):
+    """Scarta il grafo di un libro o dei libri che contengono page_ids.
+    Senza argomenti, o se una pagina non è in nessun grafo in cache
+    (es. prima carta di una pagina nuova), svuota tutta la cache.
+    """
+    with _lock:
+        if book_id is None and not page_ids:
+            _cache.clear()
+            return
+        page_ids = set(page_ids)
+        matched = set()
+        for cached_id, graph in list(_cache.items()):
+            overlap = graph.page_ids & page_ids
+            if cached_id == book_id or overlap:
+                matched |= overlap
+                del _cache[cached_id]
+        if page_ids - matched:
+            _cache.clear()
+
+
+_PENDING_KEY = 'link_graph_pending'
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_on_flush(session, flush_context):
+    """Annota in session.info i libri/pagine toccati da carte, pagine o asset
+    modificati in qualsiasi blueprint; la cache è invalidata solo al commit
+    """
+    pending = session.info.setdefault(_PENDING_KEY, {'all': False, 'books': set(), 'pages': set()})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Asset):
+            pending['all'] = True
+        elif isinstance(obj, Card):
+            pending['pages'].add(obj.page_id)
+        elif isinstance(obj, Page):
+            pending['books'].add(obj.book_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    """Invalida la cache dopo il commit: prima un'altra richiesta ricostruirebbe
+    il grafo dai dati non ancora visibili (o poi annullati)
+    """
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    if pending['all']:
+        invalidate()
+        return
+    for book_id in pending['books']:
+        invalidate(book_id=book_id)
+    if pending['pages']:
+        invalidate(page_ids=pending['pages'])
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_on_rollback(session, previous_transaction):
+    """Rollback della transazione esterna: le modifiche annotate non esistono più"""
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
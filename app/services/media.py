@@ -0,0 +1,123 @@
+"""
+URL media con fingerprint del contenuto e consegna dei file
+Le immagini sono servite da /assets/media/<fingerprint>/<file> con
+Cache-Control immutable (1 anno); il fingerprint cambia se cambia il file.
+Con Asset.content_hash salvato il fingerprint unisce l'hash a dimensione e
+mtime del file (solo os.stat): un file sostituito sul posto cambia URL.
+In modalità offload la consegna dei byte è delegata al proxy (nginx
+X-Accel-Redirect o Apache/lighttpd X-Sendfile) e il worker Python non legge il file.
+"""
+
+import hashlib
+import mimetypes
+import os
+import threading
+from flask import Response, current_app, send_from_directory, url_for
+from sqlalchemy import select
+from werkzeug.security import safe_join
+from app.models.asset import Asset, normalize_media_url
+from app.services.images import content_hash
+
+MEDIA_URL_PREFIX = '/static/media/'
+
+OFFLOAD_X_ACCEL = 'x-accel-redirect'
+OFFLOAD_X_SENDFILE = 'x-sendfile'
+
+# (path, mtime_ns, size) -> fingerprint: il contenuto viene letto una sola volta
+_fingerprints = {}
+_lock = threading.Lock()
+
+
+def media_dir():
+    return os.path.join(current_app.static_folder, 'media')
+
+
+def _stamp(digest, stat):
+    """Fingerprint breve: hash del contenuto (sha256 esadecimale) con dimensione e mtime"""
+    return hashlib.sha256(f"{digest}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+
+
+def file_fingerprint(path):
+    """Fingerprint del file letto da disco (None se non esiste), in cache per mtime/size;
+    uguale a quello da Asset.content_hash se l'hash salvato è quello del contenuto
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _fingerprints.get(key)
+    if cached:
+        return cached
+    fingerprint = _stamp(content_hash(path), stat)
+    with _lock:
+        _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+def _stamped_fingerprint(stored_hash, path):
+    """Fingerprint da Asset.content_hash, dimensione e mtime del file (None se non esiste):
+    nessuna lettura del contenuto, ma un file riscritto dopo l'upload non tiene l'URL vecchio
+    """
+    try:
+        return _stamp(stored_hash, os.stat(path))
+    except OSError:
+        return None
+
+
+def media_url(asset_or_url):
+    """URL immutabile con fingerprint per un asset (o url salvato) locale.
+    Per URL remoti/data o file mancanti ritorna l'URL normalizzato.
+    Con Asset.content_hash salvato il file non viene letto (solo os.stat).
+    """
+    raw = getattr(asset_or_url, 'url', asset_or_url)
+    url = normalize_media_url(raw)
+    if not url.startswith(MEDIA_URL_PREFIX):
+        return url
+    filename = url[len(MEDIA_URL_PREFIX):]
+    stored_hash = getattr(asset_or_url, 'content_hash', None)
+    path = safe_join(media_dir(), filename)
+    if not path:
+        return url
+    fingerprint = _stamped_fingerprint(stored_hash, path) if stored_hash else file_fingerprint(path)
+    if not fingerprint:
+        return url
+    return url_for('assets.serve_media', fingerprint=fingerprint, filename=filename)
+
+
+def stored_fingerprint(db, filename):
+    """Fingerprint da Asset.content_hash per un file di static/media (None se non salvato
+    o se il file non esiste). Solo os.stat: con il worker appena avviato il contenuto non va riletto.
+    """
+    # Forme dell'url salvate per lo stesso file (vedi normalize_media_url)
+    urls = [filename, f"media/{filename}", f"/media/{filename}", f"{MEDIA_URL_PREFIX}{filename}"]
+    stored_hash = db.execute(
+        select(Asset.content_hash).where(Asset.url.in_(urls), Asset.content_hash.is_not(None)).limit(1)
+    ).scalar()
+    path = safe_join(media_dir(), filename)
+    return _stamped_fingerprint(stored_hash, path) if stored_hash and path else None
+
+
+def send_media(filename, immutable=False):
+    """Risposta per un file in static/media, con offload al proxy se configurato"""
+    max_age = current_app.config.get('MEDIA_MAX_AGE', 0) if immutable else 0
+    offload = current_app.config.get('MEDIA_OFFLOAD', '')
+
+    if offload in (OFFLOAD_X_ACCEL, OFFLOAD_X_SENDFILE):
+        path = safe_join(media_dir(), filename)
+        if not path or not os.path.isfile(path):
+            return Response('Not Found', status=404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = Response(status=200, mimetype=mimetype)
+        if offload == OFFLOAD_X_ACCEL:
+            prefix = current_app.config.get('MEDIA_ACCEL_PREFIX', '/_protected_media/')
+            response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + filename
+        else:
+            response.headers['X-Sendfile'] = path
+    else:
+        response = send_from_directory(media_dir(), filename, max_age=max_age)
+
+    if immutable:
+        response.headers['Cache-Control'] = f'public, max-age={max_age}, immutable'
+    return response
@@ -0,0 +1,358 @@
+"""
+Sweeper dei file media orfani e contabilità dello spazio occupato
+Confronta static/media con la tabella asset e trova i file senza riga
+(upload falliti, derivati _thumbnail/_medium/_large di asset eliminati).
+
+Memoria limitata anche su alberi con centinaia di migliaia di file:
+- la scansione usa os.scandir in streaming e scrive i file su un database
+  di stato SQLite (sqlite3) a blocchi, senza tenerli in memoria;
+- il confronto con la tabella asset è fatto a blocchi con query IN (...)
+  sull'indice asset.url;
+- ogni fase salva il proprio cursore, quindi un'esecuzione interrotta
+  riprende da dove si era fermata.
+
+I file modificati da meno di min_age secondi non sono mai orfani: l'upload
+scrive il file prima di salvare la riga e l'import massivo salva le righe a
+blocchi, quindi un file recente senza riga può essere un upload in corso.
+
+Una scansione completata da più di max_scan_age secondi non viene riusata:
+run() ricomincia da zero (un cron vede i nuovi orfani). Prima di spostare o
+eliminare, apply() ricontrolla sulla tabella asset ogni blocco di file.
+"""
+
+import os
+import shutil
+import sqlite3
+import time
+from sqlalchemy import bindparam, select
+from app.db import get_db, close_db
+from app.models.asset import Asset
+from app.services.images import ALLOWED_EXTENSIONS
+
+DERIVATIVE_SUFFIXES = ('_thumbnail.jpg', '_medium.jpg', '_large.jpg')
+
+# Cartelle gestite dall'app che non contengono asset (cache atlas e librerie, quarantena)
+EXCLUDED_DIRS = ('_atlas', '_library', '_quarantine')
+
+BATCH_SIZE = 500
+MIN_AGE = 3600  # secondi: file più recenti esclusi dagli orfani
+MAX_SCAN_AGE = 3600  # secondi: scansioni completate più vecchie sono rifatte
+
+# Statement unico con IN espandibile: i valori non restano nella cache di SQLAlchemy
+_EXISTING_URLS = select(Asset.url).where(Asset.url.in_(bindparam('urls', expanding=True)))
+
+ACTION_REPORT = 'report'
+ACTION_QUARANTINE = 'quarantine'
+ACTION_DELETE = 'delete'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sweep_file (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,      -- percorso relativo a static/media
+    stem TEXT NOT NULL,             -- nome senza estensione/suffisso derivato
+    derivative INTEGER NOT NULL,    -- 1 se _thumbnail/_medium/_large
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    recent INTEGER NOT NULL,        -- 1 se modificato entro min_age dalla scansione
+    referenced INTEGER,             -- NULL = non ancora verificato
+    handled INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_sweep_file_stem ON sweep_file (stem, derivative);
+CREATE TABLE IF NOT EXISTS sweep_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def split_name(name):
+    """(stem, derivative) per un nome file relativo"""
+    for suffix in DERIVATIVE_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)], 1
+    return os.path.splitext(name)[0], 0
+
+
+def asset_url_candidates(name):
+    """Forme con cui un file in static/media può essere salvato in asset.url"""
+    return (name, f"media/{name}", f"/media/{name}", f"/static/media/{name}")
+
+
+def iter_media_files(media_dir, excluded=EXCLUDED_DIRS):
+    """Scansione ricorsiva in streaming: (nome relativo, dimensione, mtime)"""
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(media_dir, rel_dir))
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if not (rel_dir == '' and entry.name in excluded):
+                        stack.append(rel)
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    yield rel, stat.st_size, stat.st_mtime
+
+
+class MediaSweeper:
+    """Sweep riprendibile di static/media; lo stato vive in state_path (SQLite)"""
+
+    def __init__(self, media_dir, state_path, batch_size=BATCH_SIZE, min_age=MIN_AGE, max_scan_age=MAX_SCAN_AGE):
+        self.media_dir = str(media_dir)
+        self.state_path = str(state_path)
+        self.batch_size = batch_size
+        self.min_age = min_age
+        self.max_scan_age = max_scan_age
+        self.conn = sqlite3.connect(self.state_path)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sweep_file)")}
+        if columns and 'mtime' not in columns:
+            # Stato di una versione precedente (senza mtime): si riscansiona
+            self.conn.executescript("DROP TABLE sweep_file; DROP TABLE IF EXISTS sweep_state;")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # --- stato ---------------------------------------------------------
+
+    def _get(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM sweep_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set(self, key, value):
+        self.conn.execute(
+            "INSERT INTO sweep_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value)),
+        )
+
+    @property
+    def phase(self):
+        return self._get('phase', 'scan')
+
+    def reset(self):
+        """Ricomincia da zero (nuova scansione)"""
+        self.conn.execute("DELETE FROM sweep_file")
+        self.conn.execute("DELETE FROM sweep_state")
+        self.conn.commit()
+
+    # --- fasi ----------------------------------------------------------
+
+    def scan(self):
+        """Registra i file del media tree (INSERT OR IGNORE: riprendibile)"""
+        # Soglia fissata alla prima scansione: stessa anche se ripresa
+        cutoff = float(self._get('recent_cutoff') or time.time() - self.min_age)
+        self._set('recent_cutoff', cutoff)
+        batch = []
+        for name, size, mtime in iter_media_files(self.media_dir):
+            stem, derivative = split_name(name)
+            batch.append((name, stem, derivative, size, mtime, int(mtime > cutoff)))
+            if len(batch) >= self.batch_size:
+                self._insert_files(batch)
+                batch = []
+        if batch:
+            self._insert_files(batch)
+        self._set('phase', 'check_originals')
+        self._set('scanned_at', time.time())
+        self.conn.commit()
+
+    def _insert_files(self, batch):
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO sweep_file (name, stem, derivative, size, mtime, recent) VALUES (?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+        self.conn.commit()
+
+    def check_originals(self):
+        """Per ogni blocco di file originali, una query IN su asset.url"""
+        db = get_db()
+        try:
+            cursor = int(self._get('check_cursor', 0))
+            while True:
+                rows = self.conn.execute(
+                    "SELECT id, name FROM sweep_file WHERE derivative = 0 AND id > ? ORDER BY id LIMIT ?",
+                    (cursor, self.batch_size),
+                ).fetchall()
+                if not rows:
+                    break
+                candidates = {}
+                for file_id, name in rows:
+                    for url in asset_url_candidates(name):
+                        candidates[url] = file_id
+                found = db.execute(_EXISTING_URLS, {'urls': list(candidates)}).scalars()
+                referenced_ids = {candidates[url] for url in found}
+                self.conn.executemany(
+                    "UPDATE sweep_file SET referenced = ? WHERE id = ?",
+                    [(1 if file_id in referenced_ids else 0, file_id) for file_id, _ in rows],
+                )
+                cursor = rows[-1][0]
+                self._set('check_cursor', cursor)
+                self.conn.commit()
+        finally:
+            close_db(db)
+        self._set('phase', 'check_derivatives')
+        self.conn.commit()
+
+    def check_derivatives(self):
+        """Un derivato è referenziato se lo è un originale con lo stesso stem (set-based in SQL)"""
+        self.conn.execute(
+            """
+            UPDATE sweep_file SET referenced = EXISTS (
+                SELECT 1 FROM sweep_file AS original
+                WHERE original.stem = sweep_file.stem
+                  AND original.derivative = 0
+                  AND original.referenced = 1
+            )
+            WHERE derivative = 1
+            """
+        )
+        self._set('phase', 'done')
+        self.conn.commit()
+
+    def run(self):
+        """Esegue (o riprende) le fasi mancanti e ritorna il report.
+        Una scansione completata più vecchia di max_scan_age è rifatta da zero.
+        """
+        if self.phase == 'done' and time.time() - float(self._get('scanned_at', 0)) >= self.max_scan_age:
+            self.reset()
+        while self.phase != 'done':
+            getattr(self, self.phase)()
+        return self.report()
+
+    # --- risultati -----------------------------------------------------
+
+    def report(self):
+        """Contabilità dello spazio: totale, referenziato e recuperabile"""
+        totals = self.conn.execute(
+            """
+            SELECT
+                COUNT(*), COALESCE(SUM(size), 0),
+                COALESCE(SUM(CASE WHEN referenced = 1 THEN size ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN referenced = 0 AND recent = 0 THEN 1 ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN referenced = 0 AND recent = 0 THEN size ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN referenced = 0 AND recent = 0 AND derivative = 1 THEN 1 ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN referenced = 0 AND recent = 0 AND handled = 1 THEN 1 ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN referenced = 0 AND recent = 1 THEN 1 ELSE 0 END), 0)
+            FROM sweep_file
+            """
+        ).fetchone()
+        return {
+            'phase': self.phase,
+            'files': totals[0],
+            'bytes': totals[1],
+            'referenced_bytes': totals[2],
+            'orphans': totals[3],
+            'reclaimable_bytes': totals[4],
+            'orphan_derivatives': totals[5],
+            'handled': totals[6],
+            'recent': totals[7],  # senza riga ma più recenti di min_age: non toccati
+        }
+
+    def iter_orphans(self, include_handled=False):
+        """Orfani (esclusi i file recenti) in streaming a blocchi: (nome, dimensione)"""
+        cursor = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, name, size FROM sweep_file "
+                "WHERE referenced = 0 AND recent = 0 AND id > ? AND (handled = 0 OR ?) ORDER BY id LIMIT ?",
+                (cursor, int(include_handled), self.batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            for _, name, size in rows:
+                yield name, size
+            cursor = rows[-1][0]
+
+    def apply(self, action, quarantine_dir=None):
+        """Sposta in quarantena o elimina gli orfani non ancora gestiti (riprendibile).
+        Un file tornato referenziato o modificato nel frattempo viene saltato.
+        """
+        if action == ACTION_REPORT:
+            return 0
+        if self.phase != 'done':
+            raise RuntimeError("Sweep non completato: eseguire run() prima di apply()")
+        quarantine_dir = quarantine_dir or os.path.join(
+            self.media_dir, '_quarantine', time.strftime('%Y%m%d-%H%M%S')
+        )
+        db = get_db()
+        handled = 0
+        try:
+            batch = []
+            for name, _ in self.iter_orphans():
+                batch.append(name)
+                if len(batch) >= self.batch_size:
+                    handled += self._apply_batch(db, batch, action, quarantine_dir)
+                    batch = []
+            if batch:
+                handled += self._apply_batch(db, batch, action, quarantine_dir)
+        finally:
+            close_db(db)
+        return handled
+
+    def _owners(self, name):
+        """File originali da cui dipende un file: sé stesso, o per un derivato ogni
+        originale possibile con lo stesso stem (anche se caricato dopo la scansione)
+        """
+        stem, derivative = split_name(name)
+        if not derivative:
+            return [name]
+        rows = self.conn.execute(
+            "SELECT name FROM sweep_file WHERE stem = ? AND derivative = 0", (stem,)
+        ).fetchall()
+        return sorted({row[0] for row in rows} | {f"{stem}.{extension}" for extension in ALLOWED_EXTENSIONS})
+
+    def _apply_batch(self, db, names, action, quarantine_dir):
+        # Ricontrollo: un upload concorrente può aver creato la riga dopo la scansione
+        owners = {name: self._owners(name) for name in names}
+        candidates = {
+            url: owner
+            for name_owners in owners.values()
+            for owner in name_owners
+            for url in asset_url_candidates(owner)
+        }
+        still_used = set()
+        if candidates:
+            still_used = {
+                candidates[url]
+                for url in db.execute(_EXISTING_URLS, {'urls': list(candidates)}).scalars()
+            }
+        done = []
+        cutoff = time.time() - self.min_age
+        for name in names:
+            if still_used.intersection(owners[name]):
+                continue
+            source = os.path.join(self.media_dir, name)
+            try:
+                # Riscritto dopo la scansione (es. stesso nome ricaricato): di nuovo recente
+                if os.stat(source).st_mtime > cutoff:
+                    continue
+            except FileNotFoundError:
+                pass
+            try:
+                if action == ACTION_QUARANTINE:
+                    target = os.path.join(quarantine_dir, name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.move(source, target)
+                elif action == ACTION_DELETE:
+                    os.remove(source)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Impossibile gestire {name}: {e}")
+                continue
+            done.append((name,))
+        self.conn.executemany("UPDATE sweep_file SET handled = 1 WHERE name = ?", done)
+        self.conn.commit()
+        return len(done)
@@ -0,0 +1,143 @@
+"""
+Ordinamento delle pagine di un libro con chiavi a intervalli (gap)
+Le chiavi Page.order sono multipli di ORDER_GAP: spostare una pagina tra due
+vicine assegna il valore intermedio e aggiorna una sola riga. Solo quando
+tra due vicine non c'è più spazio il libro viene rinumerato.
+Le query usano l'indice (book_id, order).
+"""
+
+from sqlalchemy import bindparam, func, select, update
+from app.models.page import Page
+from app.services import change_feed
+
+ORDER_GAP = 1024
+
+
+class ReorderError(ValueError):
+    """Lista di pagine non valida per il riordino"""
+
+
+def next_order(book_id):
+    """Chiave per una nuova pagina in coda al libro (MAX + gap, non COUNT), come
+    espressione SQL da assegnare a Page.order: è calcolata dentro l'INSERT, quindi
+    due creazioni concorrenti non leggono lo stesso MAX
+    """
+    return (
+        select(func.coalesce(func.max(Page.order), 0) + ORDER_GAP)
+        .where(Page.book_id == book_id)
+        .scalar_subquery()
+    )
+
+
+def ordered_pages(db, book_id):
+    """[(id, order)] delle pagine del libro nell'ordine di visualizzazione"""
+    return db.execute(
+        select(Page.id, Page.order).where(Page.book_id == book_id).order_by(Page.order, Page.id)
+    ).all()
+
+
+def page_position(db, page):
+    """Posizione 1-based della pagina nel libro (conteggio sull'indice)"""
+    before = db.execute(
+        select(func.count()).select_from(Page).where(
+            Page.book_id == page.book_id,
+            (Page.order < page.order) | ((Page.order == page.order) & (Page.id < page.id)),
+        )
+    ).scalar()
+    return before + 1
+
+
+def _stable_indexes(keys):
+    """Indici della più lunga sottosequenza strettamente crescente di keys:
+    le pagine corrispondenti mantengono la chiave attuale.
+    """
+    tails, tails_index, previous = [], [], [None] * len(keys)
+    for i, key in enumerate(keys):
+        low, high = 0, len(tails)
+        while low < high:
+            mid = (low + high) // 2
+            if tails[mid] < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low > 0:
+            previous[i] = tails_index[low - 1]
+        if low == len(tails):
+            tails.append(key)
+            tails_index.append(i)
+        else:
+            tails[low] = key
+            tails_index[low] = i
+    stable = set()
+    i = tails_index[-1] if tails_index else None
+    while i is not None:
+        stable.add(i)
+        i = previous[i]
+    return stable
+
+
+def plan_reorder(current, page_ids):
+    """Nuove chiavi {page_id: order} per ottenere l'ordine page_ids.
+    current: {page_id: order}. Cambia solo le pagine fuori dalla sequenza stabile;
+    se tra due vicine non c'è spazio rinumera tutto con ORDER_GAP.
+    """
+    keys = [current[page_id] for page_id in page_ids]
+    stable = _stable_indexes(keys)
+    changes = {}
+    i = 0
+    lower = None
+    while i < len(page_ids):
+        if i in stable:
+            lower = keys[i]
+            i += 1
+            continue
+        # Blocco di pagine spostate tra lower e la prossima chiave stabile
+        j = i
+        while j < len(page_ids) and j not in stable:
+            j += 1
+        upper = keys[j] if j < len(page_ids) else None
+        start = lower if lower is not None else (upper - ORDER_GAP * (j - i + 1) if upper is not None else 0)
+        end = upper if upper is not None else start + ORDER_GAP * (j - i + 1)
+        step = (end - start) // (j - i + 1)
+        if step < 1:
+            return {
+                page_id: (index + 1) * ORDER_GAP
+                for index, page_id in enumerate(page_ids)
+                if current[page_id] != (index + 1) * ORDER_GAP
+            }
+        for offset, index in enumerate(range(i, j), start=1):
+            changes[page_ids[index]] = start + step * offset
+        lower = changes[page_ids[j - 1]]
+        i = j
+    return changes
+
+
+def reorder_pages(db, book_id, page_ids):
+    """Applica l'ordine completo page_ids al libro (bulk UPDATE per chiave primaria).
+    Ritorna il numero di righe modificate; solleva ReorderError se la lista
+    non contiene esattamente le pagine del libro.
+    """
+    current = dict(ordered_pages(db, book_id))
+    if len(page_ids) != len(set(page_ids)) or set(page_ids) != set(current):
+        raise ReorderError("La lista deve contenere tutte le pagine del libro, una sola volta")
+
+    changes = plan_reorder(current, list(page_ids))
+    if changes:
+        # Statement Core sulla tabella: l'ordine non è versionato (app.services.concurrency),
+        # il riordino non va in conflitto con chi modifica titolo o carte delle pagine
+        pages = Page.__table__
+        db.execute(
+            update(pages).where(pages.c.id == bindparam('page_id')).values(order=bindparam('new_order')),
+            [{'page_id': page_id, 'new_order': order} for page_id, order in changes.items()],
+        )
+        change_feed.record_many(db, [('page', page_id, change_feed.OP_UPDATE, book_id) for page_id in changes])
+    return len(changes)
+
+
+def move_page(db, page, position):
+    """Sposta la pagina alla posizione 1-based indicata (di norma aggiorna una riga)"""
+    page_ids = [page_id for page_id, _ in ordered_pages(db, page.book_id)]
+    page_ids.remove(page.id)
+    index = max(0, min(position - 1, len(page_ids)))
+    page_ids.insert(index, page.id)
+    return reorder_pages(db, page.book_id, page_ids)
@@ -0,0 +1,39 @@
+"""
+Anteprima delle bozze di un libro pubblicato
+Runtime e API di un libro pubblicato servono gli snapshot; le bozze sono visibili
+solo con ?draft=<token>, un token firmato con SECRET_KEY e legato al libro che
+l'editor genera nella pagina del libro. Un ?draft=1 (o un token scaduto o di
+un altro libro) mostra la versione pubblicata.
+"""
+
+from flask import current_app, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+_SALT = 'draft-preview'
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=_SALT)
+
+
+def draft_token(book_id):
+    """Token per l'anteprima delle bozze del libro"""
+    return _serializer().dumps(book_id)
+
+
+def allows_draft(token, book_id):
+    """True se il token è valido (firma, scadenza) e appartiene al libro"""
+    if not token:
+        return False
+    try:
+        return _serializer().loads(token, max_age=current_app.config['DRAFT_PREVIEW_MAX_AGE']) == book_id
+    except BadSignature:  # comprende SignatureExpired
+        return False
+
+
+def request_draft(book):
+    """Token di anteprima della richiesta se valido per il libro pubblicato, altrimenti None"""
+    token = request.args.get('draft')
+    if book.published_at is not None and allows_draft(token, book.id):
+        return token
+    return None
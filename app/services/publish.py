@@ -0,0 +1,223 @@
+"""
+Pubblicazione dei libri: snapshot denormalizzati per il runtime
+publish_book materializza ogni pagina del libro in una riga page_snapshot con
+etichette, colori, URL immagini, pagine target, navigazione e hint di prefetch
+già risolti. Per un libro pubblicato runtime_book/runtime_page leggono una sola
+riga indicizzata per pagina e le modifiche in bozza restano invisibili fino
+alla pubblicazione successiva. Lo stesso vale per l'API JSON e la ricerca
+(app.routes.api; index_snapshots riscrive l'indice FTS5 degli snapshot per
+app.services.label_search).
+"""
+
+import json
+import time
+from types import SimpleNamespace
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import joinedload
+from app.models.book import Book
+from app.models.card import Card
+from app.models.page import Page
+from app.models.page_snapshot import PageSnapshot
+from app.models.asset import normalize_media_url
+from app.models.search_index import delete_snapshot_search, snapshot_card_search, snapshot_page_search
+from app.services import change_feed
+from app.services.link_graph import MAX_PREFETCH_IMAGES, MAX_PREFETCH_PAGES, LinkGraph
+
+
+def _serialize_card(card, titles):
+    target_id = card.target_page_id if card.target_page_id in titles else None
+    return {
+        'id': card.id,
+        'row': card.slot_row,
+        'col': card.slot_col,
+        'row_span': card.row_span or 1,
+        'col_span': card.col_span or 1,
+        'label': card.label,
+        'background_color': card.background_color,
+        'border_color': card.border_color,
+        'action_type': card.action_type,
+        'image': {
+            'id': card.image.id,
+            'url': normalize_media_url(card.image.url),
+            'content_hash': card.image.content_hash,
+            'width': card.image.width,
+            'height': card.image.height,
+        } if card.image else None,
+        'target_page_id': target_id,
+        'target_title': titles.get(target_id),
+    }
+
+
+def _prefetch(page_id, cards_by_page):
+    """Pagine target e loro immagini (stessa logica di LinkGraph.prefetch_for)"""
+    targets = []
+    for card in cards_by_page.get(page_id, []):
+        target = card['target_page_id']
+        if target and target != page_id and target not in targets:
+            targets.append(target)
+    targets = targets[:MAX_PREFETCH_PAGES]
+    current = {card['image']['url'] for card in cards_by_page.get(page_id, []) if card['image']}
+    images = []
+    for target in targets:
+        for card in cards_by_page.get(target, []):
+            url = card['image']['url'] if card['image'] else None
+            if url and url not in current and url not in images:
+                images.append(url)
+    return targets, images[:MAX_PREFETCH_IMAGES]
+
+
+def index_snapshots(db, book_id):
+    """Riscrive le righe FTS5 degli snapshot del libro (ricerca sulla versione pubblicata)
+    con pagina, immagine e percorso dalla home pubblicata. Accetta Session o Connection.
+    """
+    delete_snapshot_search(db, book_id)
+    snapshots = db.execute(
+        select(PageSnapshot.page_id, PageSnapshot.title, PageSnapshot.is_home, PageSnapshot.data)
+        .where(PageSnapshot.book_id == book_id)
+        .order_by(PageSnapshot.position)
+    ).all()
+    if not snapshots:
+        return
+
+    titles = {snapshot.page_id: snapshot.title for snapshot in snapshots}
+    cards = {snapshot.page_id: json.loads(snapshot.data)['cards'] for snapshot in snapshots}
+    targets = {
+        page_id: list(dict.fromkeys(card['target_page_id'] for card in page_cards if card['target_page_id']))
+        for page_id, page_cards in cards.items()
+    }
+    graph = LinkGraph(book_id, targets, {})
+    home_id = next((snapshot.page_id for snapshot in snapshots if snapshot.is_home), snapshots[0].page_id)
+
+    def path(page_id):
+        steps = graph.path_to(home_id, page_id)
+        return json.dumps([[step, titles.get(step)] for step in steps], separators=(',', ':')) if steps else None
+
+    book = str(book_id)
+    paths = {page_id: path(page_id) for page_id in titles}
+    db.execute(insert(snapshot_page_search), [
+        {'rowid': page_id, 'title': title, 'book': book, 'path': paths[page_id]}
+        for page_id, title in titles.items()
+    ])
+    card_rows = [
+        {
+            'rowid': card['id'], 'label': card['label'], 'book': book, 'page_id': page_id,
+            'page_title': titles[page_id],
+            'image_url': card['image']['url'] if card['image'] else None,
+            'content_hash': card['image']['content_hash'] if card['image'] else None,
+            'path': paths[page_id],
+        }
+        for page_id, page_cards in cards.items()
+        for card in page_cards
+    ]
+    if card_rows:
+        db.execute(insert(snapshot_card_search), card_rows)
+
+
+def publish_book(db, book_id):
+    """Sostituisce gli snapshot del libro con lo stato attuale delle bozze.
+    Non esegue commit. Ritorna il numero di pagine pubblicate (None se il libro non esiste).
+    """
+    book = db.get(Book, book_id)
+    if book is None:
+        return None
+
+    pages = db.query(Page).filter(Page.book_id == book_id).order_by(Page.order, Page.id).all()
+    cards = db.query(Card).options(joinedload(Card.image)).join(Page, Card.page_id == Page.id).filter(
+        Page.book_id == book_id
+    ).order_by(Card.slot_row, Card.slot_col, Card.id).all()
+
+    titles = {page.id: page.title for page in pages}
+    cards_by_page = {}
+    for card in cards:
+        cards_by_page.setdefault(card.page_id, []).append(_serialize_card(card, titles))
+
+    home_id = book.home_page_id if book.home_page_id in titles else None
+    rows = []
+    for index, page in enumerate(pages):
+        prefetch_pages, prefetch_images = _prefetch(page.id, cards_by_page)
+        data = {
+            'cards': cards_by_page.get(page.id, []),
+            'prev_page_id': pages[index - 1].id if index > 0 else None,
+            'next_page_id': pages[index + 1].id if index + 1 < len(pages) else None,
+            'total': len(pages),
+            'prefetch_pages': prefetch_pages,
+            'prefetch_images': prefetch_images,
+        }
+        rows.append({
+            'page_id': page.id,
+            'book_id': book_id,
+            'position': index + 1,
+            'is_home': page.id == home_id,
+            'title': page.title,
+            'grid_cols': page.grid_cols,
+            'grid_rows': page.grid_rows,
+            'data': json.dumps(data, separators=(',', ':')),
+        })
+
+    db.execute(delete(PageSnapshot).where(PageSnapshot.book_id == book_id))
+    if rows:
+        db.execute(insert(PageSnapshot), rows)
+    index_snapshots(db, book_id)
+    db.execute(update(Book).where(Book.id == book_id).values(published_at=time.time()))
+    # Evento 'book' per i client runtime (change feed e SSE)
+    change_feed.record(db, 'book', book_id, change_feed.OP_UPDATE, book_id)
+    return len(rows)
+
+
+def get_snapshot(db, book_id, page_id=None):
+    """Snapshot di una pagina pubblicata; senza page_id la home (o la prima pagina)"""
+    query = select(PageSnapshot).where(PageSnapshot.book_id == book_id)
+    if page_id is not None:
+        query = query.where(PageSnapshot.page_id == page_id)
+    else:
+        query = query.order_by(PageSnapshot.is_home.desc(), PageSnapshot.position).limit(1)
+    return db.execute(query).scalar()
+
+
+def get_snapshots(db, book_id):
+    """Snapshot delle pagine pubblicate del libro, in ordine di posizione"""
+    return db.execute(
+        select(PageSnapshot).where(PageSnapshot.book_id == book_id).order_by(PageSnapshot.position)
+    ).scalars().all()
+
+
+def snapshot_view(snapshot):
+    """Contesto per books/runtime_simple.html con gli stessi attributi dei modelli"""
+    data = json.loads(snapshot.data)
+    page = SimpleNamespace(
+        id=snapshot.page_id,
+        title=snapshot.title,
+        grid_cols=snapshot.grid_cols,
+        grid_rows=snapshot.grid_rows,
+    )
+    cards = [
+        SimpleNamespace(
+            id=card['id'],
+            slot_row=card['row'],
+            slot_col=card['col'],
+            row_span=card['row_span'],
+            col_span=card['col_span'],
+            label=card['label'],
+            background_color=card['background_color'],
+            border_color=card['border_color'],
+            action_type=card['action_type'],
+            image=SimpleNamespace(**card['image']) if card['image'] else None,
+            target_page_id=card['target_page_id'],
+            target_page=SimpleNamespace(id=card['target_page_id'], title=card['target_title'])
+            if card['target_page_id'] else None,
+        )
+        for card in data['cards']
+    ]
+    nav = {
+        'position': snapshot.position,
+        'total': data['total'],
+        'prev_page_id': data['prev_page_id'],
+        'next_page_id': data['next_page_id'],
+    }
+    return {
+        'current_page': page,
+        'cards': cards,
+        'nav': nav,
+        'prefetch_pages': data['prefetch_pages'],
+        'prefetch_images': data['prefetch_images'],
+    }
@@ -0,0 +1,206 @@
+"""
+Hash percettivo (dHash) e indice dei quasi-duplicati
+Il dHash a 64 bit è calcolato una volta durante process_image e salvato in
+Asset.phash (16 caratteri esadecimali). Immagini uguali a dimensioni o formati
+diversi hanno hash a distanza di Hamming piccola.
+
+La ricerca usa un BK-tree in memoria: con un raggio piccolo visita solo una
+frazione dei nodi, quindi resta sub-lineare anche con 100k asset. L'indice
+è per processo, costruito con una query e aggiornato agli upload; come la
+cache del grafo di navigazione viene ricostruito dopo INDEX_TTL_SECONDS.
+"""
+
+import os
+import threading
+import time
+from PIL import Image
+from sqlalchemy import select
+from app.models.asset import Asset, normalize_media_url
+
+HASH_SIZE = 8  # 8x8 confronti = 64 bit
+
+# Distanza di Hamming massima per considerare due immagini quasi-duplicate
+NEAR_DUPLICATE_DISTANCE = 6
+
+INDEX_TTL_SECONDS = 300
+
+
+def dhash(img, hash_size=HASH_SIZE):
+    """Difference hash: gradiente orizzontale di una miniatura in scala di grigi"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        # Trasparenza su bianco, come nei derivati JPEG
+        rgba = img.convert('RGBA')
+        background = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, rgba)
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()  # modo L: un byte per pixel
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def image_phash(path):
+    """dHash esadecimale di un file immagine (None se non leggibile o troppo grande, es. SVG)"""
+    from app.services.images import open_image, reduce_to
+    try:
+        with open_image(path, draft_size=(64, 64)) as img:
+            return format_hash(dhash(reduce_to(img, (64, 64))))
+    except Exception:
+        return None
+
+
+def format_hash(value):
+    return f"{value:016x}"
+
+
+def parse_hash(text):
+    return int(text, 16)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """BK-tree sulla distanza di Hamming: nodo = [hash, {distanza: figlio}, [asset_id, ...]]"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, asset_id):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, {}, [asset_id]]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[2].append(asset_id)
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}, [asset_id]]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """[(distanza, asset_id)] entro max_distance, ordinati per distanza.
+        Ritorna anche il numero di nodi visitati.
+        """
+        results = []
+        visited = 0
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            visited += 1
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, asset_id) for asset_id in node[2])
+            # Disuguaglianza triangolare: solo i figli con |d - distance| <= max_distance
+            for child_distance, child in node[1].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort()
+        return results, visited
+
+
+class SimilarityIndex:
+    """BK-tree degli asset con phash; gli asset eliminati sono filtrati fino alla ricostruzione"""
+
+    def __init__(self, rows=()):
+        self.tree = BKTree()
+        self.removed = set()
+        self.built_at = time.monotonic()
+        for asset_id, phash in rows:
+            self.add(asset_id, phash)
+
+    def add(self, asset_id, phash):
+        if phash:
+            self.tree.add(parse_hash(phash), asset_id)
+            self.removed.discard(asset_id)
+
+    def discard(self, asset_id):
+        self.removed.add(asset_id)
+
+    def similar(self, phash, max_distance=NEAR_DUPLICATE_DISTANCE, exclude=None, limit=20):
+        """[(distanza, asset_id)] più simili all'hash dato"""
+        results, _ = self.tree.search(parse_hash(phash), max_distance)
+        return [
+            (distance, asset_id)
+            for distance, asset_id in results
+            if asset_id != exclude and asset_id not in self.removed
+        ][:limit]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index(db):
+    """Indice del processo, costruito (una query) se assente o scaduto"""
+    global _index
+    with _lock:
+        index = _index
+    if index and time.monotonic() - index.built_at < INDEX_TTL_SECONDS:
+        return index
+    rows = db.execute(select(Asset.id, Asset.phash).where(Asset.phash.is_not(None))).all()
+    index = SimilarityIndex(rows)
+    with _lock:
+        _index = index
+    return index
+
+
+def register(asset_id, phash):
+    """Aggiunge un asset appena salvato all'indice (se già costruito)"""
+    with _lock:
+        if _index is not None:
+            _index.add(asset_id, phash)
+
+
+def unregister(asset_id):
+    with _lock:
+        if _index is not None:
+            _index.discard(asset_id)
+
+
+def reset():
+    global _index
+    with _lock:
+        _index = None
+
+
+def find_similar(db, phash, max_distance=NEAR_DUPLICATE_DISTANCE, exclude=None, limit=20):
+    """Asset quasi-duplicati: [(distanza, Asset)]"""
+    if not phash:
+        return []
+    matches = get_index(db).similar(phash, max_distance=max_distance, exclude=exclude, limit=limit)
+    if not matches:
+        return []
+    assets = {asset.id: asset for asset in db.query(Asset).filter(Asset.id.in_([a for _, a in matches]))}
+    return [(distance, assets[asset_id]) for distance, asset_id in matches if asset_id in assets]
+
+
+def backfill(db, media_dir, batch_size=500):
+    """Calcola phash per gli asset immagine che non lo hanno, con commit a blocchi
+    (un'esecuzione interrotta riprende dagli asset mancanti). Ritorna gli asset aggiornati.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        assets = db.query(Asset).filter(
+            Asset.phash.is_(None), Asset.id > last_id, Asset.kind.like('image/%')
+        ).order_by(Asset.id).limit(batch_size).all()
+        if not assets:
+            return updated
+        for asset in assets:
+            url = normalize_media_url(asset.url)
+            if url.startswith('/static/media/'):
+                asset.phash = image_phash(os.path.join(str(media_dir), url[len('/static/media/'):]))
+                updated += asset.phash is not None
+        last_id = assets[-1].id
+        db.commit()
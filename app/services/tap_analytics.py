@@ -0,0 +1,167 @@
+"""
+Statistiche dei tocchi sulle carte del runtime
+Ogni tocco è annotato in un buffer in memoria già aggregato per carta
+(nessuna scrittura SQLite nella richiesta); un thread del worker scrive il
+buffer ogni TAP_FLUSH_INTERVAL secondi, o prima se supera TAP_FLUSH_SIZE
+tocchi, con un solo UPSERT a blocchi nei contatori card_tap_count.
+
+- il buffer è limitato a TAP_BUFFER_SIZE tocchi in attesa: oltre (es. database
+  bloccato a lungo) i nuovi tocchi sono scartati e contati in dropped;
+- l'UPSERT legge la carta dal database: tocchi di carte eliminate o di altri
+  libri sono ignorati senza una query per richiesta;
+- i tocchi non ancora scritti non compaiono in top_cards (al più un intervallo).
+"""
+
+import atexit
+import os
+import threading
+import time
+from sqlalchemy import select, text
+from sqlalchemy.exc import SQLAlchemyError
+from app.config import config
+from app.db import get_db, close_db
+from app.models.card import Card
+from app.models.card_tap import CardTapCount
+
+DEFAULT_TOP = 20
+
+_UPSERT = text("""
+    INSERT INTO card_tap_count (card_id, book_id, count, last_tapped_at)
+    SELECT card.id, page.book_id, :count, :last_tapped_at
+    FROM card JOIN page ON page.id = card.page_id
+    WHERE card.id = :card_id AND page.book_id = :book_id
+    ON CONFLICT (card_id) DO UPDATE SET
+        count = count + excluded.count,
+        last_tapped_at = MAX(last_tapped_at, excluded.last_tapped_at)
+""")
+
+
+class TapBuffer:
+    """Tocchi in attesa {(book_id, card_id): [count, last_tapped_at]}, scritti da un thread.
+    flush_interval None = nessun thread (scrittura solo con flush(), es. nei test).
+    """
+
+    def __init__(self, max_pending=10000, flush_size=500, flush_interval=5.0):
+        self.max_pending = max_pending
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._pending = {}
+        self._events = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread_pid = None
+
+    @property
+    def pending(self):
+        with self._lock:
+            return self._events
+
+    def record(self, book_id, card_ids, tapped_at=None):
+        """Annota i tocchi; ritorna quanti sono stati accettati (gli altri scartati: buffer pieno)"""
+        tapped_at = tapped_at or time.time()
+        accepted = 0
+        with self._lock:
+            for card_id in card_ids:
+                if self._events >= self.max_pending:
+                    self.dropped += 1
+                    continue
+                entry = self._pending.setdefault((book_id, card_id), [0, tapped_at])
+                entry[0] += 1
+                entry[1] = max(entry[1], tapped_at)
+                self._events += 1
+                accepted += 1
+            full = self._events >= self.flush_size
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+        return accepted
+
+    def _take(self):
+        with self._lock:
+            batch, self._pending, self._events = self._pending, {}, 0
+        return batch
+
+    def _restore(self, batch):
+        """Rimette in attesa un blocco non scritto (i nuovi tocchi restano limitati da max_pending)"""
+        with self._lock:
+            for key, (count, tapped_at) in batch.items():
+                entry = self._pending.setdefault(key, [0, tapped_at])
+                entry[0] += count
+                entry[1] = max(entry[1], tapped_at)
+                self._events += count
+
+    def flush(self):
+        """Scrive i tocchi in attesa con un solo UPSERT a blocchi; ritorna le carte scritte"""
+        with self._flush_lock:
+            batch = self._take()
+            if not batch:
+                return 0
+            rows = [
+                {'book_id': book_id, 'card_id': card_id, 'count': count, 'last_tapped_at': tapped_at}
+                for (book_id, card_id), (count, tapped_at) in batch.items()
+            ]
+            db = get_db()
+            try:
+                db.execute(_UPSERT, rows)
+                db.commit()
+            except SQLAlchemyError as e:
+                db.rollback()
+                self._restore(batch)
+                print(f"Errore nella scrittura dei tocchi: {e}")
+                return 0
+            finally:
+                close_db(db)
+            return len(rows)
+
+    def _ensure_thread(self):
+        """Avvia il thread di scrittura nel processo corrente (anche dopo il fork dei worker)"""
+        if self.flush_interval is None or self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name='tap-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:  # il thread non deve terminare
+                print(f"Errore nella scrittura dei tocchi: {e}")
+
+
+_buffer = None
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = TapBuffer(config.TAP_BUFFER_SIZE, config.TAP_FLUSH_SIZE, config.TAP_FLUSH_INTERVAL)
+    return _buffer
+
+
+def set_buffer(buffer):
+    """Sostituisce il buffer (es. nei test); None = ricrea dalla configurazione"""
+    global _buffer
+    _buffer = buffer
+
+
+def record_taps(book_id, card_ids):
+    return get_buffer().record(book_id, card_ids)
+
+
+def top_cards(db, book_id, limit=DEFAULT_TOP):
+    """Carte più toccate del libro: righe (id, label, page_id, count, last_tapped_at)"""
+    return db.execute(
+        select(Card.id, Card.label, Card.page_id, CardTapCount.count, CardTapCount.last_tapped_at)
+        .join(Card, Card.id == CardTapCount.card_id)
+        .where(CardTapCount.book_id == book_id)
+        .order_by(CardTapCount.count.desc(), CardTapCount.card_id)
+        .limit(limit)
+    ).all()
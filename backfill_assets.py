@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Compila i metadati intrinseci (dimensioni, byte, hash del contenuto, derivati)
+degli asset caricati prima che fossero salvati su Asset
+
+Run:
+    python backfill_assets.py
+    python backfill_assets.py --batch-size 200
+
+I commit sono a blocchi: un'esecuzione interrotta riprende dagli asset senza metadati.
+"""
+
+import argparse
+
+from app.config import config
+from app.db import init_db, get_db, close_db
+from app.services.images import backfill_metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill metadati degli asset')
+    parser.add_argument('--batch-size', type=int, default=500, help='asset per commit')
+    args = parser.parse_args()
+
+    init_db()
+    db = get_db()
+    try:
+        updated, missing = backfill_metadata(db, config.MEDIA_DIR, batch_size=args.batch_size)
+        print(f"✅ Asset aggiornati: {updated}")
+        if missing:
+            print(f"⚠️  File mancanti: {missing}")
+    finally:
+        close_db(db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Calcolo dell'hash percettivo (Asset.phash) per gli asset caricati prima
+della ricerca dei quasi-duplicati
+
+Run:
+    python backfill_phash.py
+    python backfill_phash.py --batch-size 200
+
+I commit sono a blocchi: un'esecuzione interrotta riprende dagli asset senza hash.
+"""
+
+import argparse
+
+from app.config import config
+from app.db import init_db, get_db, close_db
+from app.services import similarity
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill hash percettivo degli asset')
+    parser.add_argument('--batch-size', type=int, default=500, help='asset per commit')
+    args = parser.parse_args()
+
+    init_db()
+    db = get_db()
+    try:
+        updated = similarity.backfill(db, config.MEDIA_DIR, batch_size=args.batch_size)
+        print(f"✅ Asset aggiornati: {updated}")
+    finally:
+        close_db(db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark byte trasferiti: pagine runtime e file statici
+senza compressione, con gzip e con brotli (se installato).
+
+Usa un database SQLite temporaneo con un libro 6×6 generato.
+
+Run: python benchmark_compression.py
+"""
+
+import os
+import tempfile
+
+DB_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+os.environ.setdefault('APP_ENV', 'production')
+
+from app import create_app  # noqa: E402
+from app.db import DatabaseSession  # noqa: E402
+from app.models import Book, Page, Card, Asset  # noqa: E402
+from app.services.compression import available_encodings  # noqa: E402
+
+
+def create_book(pages=5, cards=36):
+    with DatabaseSession() as db:
+        book = Book(title='Benchmark', locale='it-IT')
+        db.add(book)
+        db.flush()
+        page_objs = [Page(book_id=book.id, title=f'Pagina {p}', grid_cols=6, grid_rows=6, order=p) for p in range(pages)]
+        db.add_all(page_objs)
+        db.flush()
+        for p, page in enumerate(page_objs):
+            for c in range(cards):
+                db.add(Card(
+                    page_id=page.id, slot_row=c // 6, slot_col=c % 6, label=f'Parola {c}',
+                    image=Asset(kind='image/png', url=f'bench-{p}-{c}.png', alt=f'img {c}'),
+                    target_page_id=page_objs[(p + 1) % pages].id,
+                ))
+        db.commit()
+        return book.id, [page.id for page in page_objs]
+
+
+def main():
+    app = create_app()
+    client = app.test_client()
+    book_id, page_ids = create_book()
+
+    urls = [f'/books/{book_id}/runtime'] + [f'/books/{book_id}/runtime/{pid}' for pid in page_ids[1:3]]
+    urls += ['/static/css/main.css', '/static/js/main.js']
+    encodings = ('identity',) + available_encodings()
+
+    print(f"{'URL':<32}" + ''.join(f'{e:>12}' for e in encodings))
+    totals = dict.fromkeys(encodings, 0)
+    for url in urls:
+        row = f'{url:<32}'
+        for encoding in encodings:
+            response = client.get(url, headers={'Accept-Encoding': encoding})
+            size = len(response.get_data())
+            totals[encoding] += size
+            row += f'{size:>12}'
+        print(row)
+    print(f"{'Totale':<32}" + ''.join(f'{totals[e]:>12}' for e in encodings))
+    for encoding in encodings[1:]:
+        print(f"{encoding}: {100 * (1 - totals[encoding] / totals['identity']):.1f}% byte in meno")
+
+
+if __name__ == '__main__':
+    main()
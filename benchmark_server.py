@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark throughput: server di sviluppo Werkzeug vs gunicorn (gunicorn.conf.py)
+
+Avvia ciascun server in un sottoprocesso, esegue N richieste GET concorrenti
+sullo stesso percorso e stampa richieste/secondo e latenza media.
+
+Run: python benchmark_server.py [--path /books/] [--requests 500] [--concurrency 16]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SERVERS = {
+    'werkzeug-dev': lambda port: [
+        sys.executable, '-c',
+        f"from wsgi import app; app.run(host='127.0.0.1', port={port}, debug=False)",
+    ],
+    'gunicorn': lambda port: [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+        '--bind', f'127.0.0.1:{port}', 'wsgi:app',
+    ],
+}
+
+
+def wait_until_ready(url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return True
+        except Exception:
+            time.sleep(0.1)
+    return False
+
+
+def fetch(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=30) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def run_benchmark(name, port, path, total_requests, concurrency):
+    env = dict(os.environ, APP_ENV='production')
+    process = subprocess.Popen(
+        SERVERS[name](port), cwd=BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{port}{path}'
+    try:
+        if not wait_until_ready(url):
+            print(f'{name}: server non raggiungibile')
+            return None
+
+        # Warm-up
+        for _ in range(10):
+            fetch(url)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(lambda _: fetch(url), range(total_requests)))
+        elapsed = time.perf_counter() - start
+
+        rps = total_requests / elapsed
+        print(f'{name:>14}: {rps:8.1f} req/s  latenza media {1000 * sum(latencies) / len(latencies):6.1f} ms')
+        return rps
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--path', default='/books/')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    print(f'GET {args.path} x {args.requests} (concorrenza {args.concurrency})')
+    results = {}
+    for offset, name in enumerate(SERVERS):
+        results[name] = run_benchmark(name, 5100 + offset, args.path, args.requests, args.concurrency)
+
+    if all(results.values()):
+        print(f"gunicorn / werkzeug-dev: {results['gunicorn'] / results['werkzeug-dev']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
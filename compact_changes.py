@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Compattazione del change feed (tabella change_log)
+
+Run:
+    python compact_changes.py                  # retention tombstone: 30 giorni
+    python compact_changes.py --days 7
+
+Da eseguire periodicamente (es. cron giornaliero). I client con una versione
+precedente alla soglia di compattazione riceveranno reset=true e riscaricheranno il libro.
+"""
+
+import argparse
+
+from app.db import init_db, get_db, close_db
+from app.services import change_feed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compattazione change feed')
+    parser.add_argument('--days', type=float, default=change_feed.TOMBSTONE_RETENTION_SECONDS / 86400,
+                        help='giorni di conservazione delle tombstone (eliminazioni)')
+    args = parser.parse_args()
+
+    init_db()
+    db = get_db()
+    try:
+        removed = change_feed.compact(db, retention_seconds=args.days * 86400)
+        db.commit()
+        print(f"✅ Righe eliminate: {removed}")
+        print(f"📌 Soglia di compattazione: {change_feed.compaction_floor(db)}")
+    finally:
+        close_db(db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Build step: crea le varianti precompresse (.gz, .br se brotli è installato)
+dei file statici testuali (css/js/svg...), servite poi senza costo CPU.
+
+Run: python compress_static.py
+"""
+
+import os
+
+from app.services.compression import precompress_static
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static')
+
+
+def main():
+    results = precompress_static(STATIC_DIR)
+    for path, size, sizes in results:
+        variants = ', '.join(f"{encoding}: {compressed} B" for encoding, compressed in sizes.items())
+        print(f"{os.path.relpath(path, STATIC_DIR)}: {size} B -> {variants}")
+    print(f"✅ {len(results)} file precompressi")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Fixture pytest condivise
+Database SQLite temporaneo, dataset generati e conteggio delle query SQL
+"""
+
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine, event
+
+from app.db import Base, SessionLocal
+
+
+class QueryCounter:
+    """Registra gli statement SQL eseguiti su un engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+
+
+@contextmanager
+def query_budget(engine, budget):
+    """Fallisce se il blocco esegue più di `budget` statement SQL"""
+    with QueryCounter(engine) as counter:
+        yield counter
+    assert counter.count <= budget, (
+        f"Query budget superato: {counter.count} > {budget}\n"
+        + "\n".join(counter.statements)
+    )
+
+
+def populate(db, books=1, pages=1, cards=1):
+    """Genera libri, pagine e carte (con immagine e link alla pagina successiva)"""
+    from app.models import Book, Page, Card, Asset
+
+    created = []
+    for b in range(books):
+        book = Book(title=f"Libro {b}", locale="it-IT")
+        db.add(book)
+        db.flush()
+        book_pages = []
+        for p in range(pages):
+            page = Page(book_id=book.id, title=f"Pagina {p}", grid_cols=6, grid_rows=6, order=p)
+            db.add(page)
+            book_pages.append(page)
+        db.flush()
+        book.home_page_id = book_pages[0].id
+        for p, page in enumerate(book_pages):
+            target = book_pages[(p + 1) % len(book_pages)]
+            for c in range(cards):
+                asset = Asset(kind="image/png", url=f"b{b}-p{p}-c{c}.png", alt=f"img {c}")
+                db.add(Card(
+                    page_id=page.id,
+                    slot_row=c // 6,
+                    slot_col=c % 6,
+                    label=f"Carta {c}",
+                    image=asset,
+                    target_page_id=target.id,
+                ))
+        created.append((book, book_pages))
+    db.commit()
+    return [(book.id, [page.id for page in book_pages]) for book, book_pages in created]
+
+
+@pytest.fixture
+def db_engine(tmp_path):
+    """Engine SQLite isolato su file temporaneo, usato da get_db() durante il test"""
+    from app.models import book, page, card, asset  # noqa
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(bind=engine)
+    previous_bind = SessionLocal.kw.get("bind")
+    SessionLocal.configure(bind=engine)
+    yield engine
+    SessionLocal.configure(bind=previous_bind)
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(db_engine):
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def client(db_engine):
+    from app import create_app
+
+    app = create_app()
+    app.config["TESTING"] = True
+    return app.test_client()
+
+
+@pytest.fixture
+def event_bus(db_engine):
+    """Bus su change_log senza thread: letture esplicite con poll()"""
+    from app.services import events
+
+    previous = events.bus
+    bus = events.ChangeLogBus(events.EventBroker(), interval=None)
+    events.set_bus(bus)
+    bus.start()
+    yield bus
+    events.set_bus(previous)
@@ -0,0 +1,54 @@
+"""
+Configurazione gunicorn per la produzione
+Worker e thread derivati dal numero di CPU, app precaricata nel master
+(memoria condivisa copy-on-write tra i worker, solo con gthread) e riciclo
+graduale dei worker.
+
+Tutti i valori sono sovrascrivibili con variabili d'ambiente GUNICORN_*.
+"""
+
+import importlib.util
+import multiprocessing
+import os
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Processi: 2 * CPU + 1; thread per worker per le richieste I/O bound (SQLite, file)
+workers = int(os.environ.get('GUNICORN_WORKERS', cpu_count * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', max(2, min(cpu_count, 4))))
+# gevent (pip install -e .[events], default se installato): le connessioni SSE
+# inattive del runtime (/books/<id>/events) sono greenlet invece di thread del worker
+default_worker_class = 'gevent' if importlib.util.find_spec('gevent') else 'gthread'
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', default_worker_class)
+if worker_class == 'gevent':
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+else:
+    # Ogni stream SSE occupa un thread: al massimo threads - 1 per worker (uno resta
+    # per le altre richieste), oltre il browser riprova più tardi (app.services.events)
+    os.environ.setdefault('SSE_MAX_STREAMS', str(max(1, threads - 1)))
+
+# Carica create_app() una sola volta nel master prima del fork. Non con gevent:
+# il worker applica il monkey patching solo dopo il fork, e lock, Condition e thread
+# creati all'import (broker SSE, cache, buffer dei tocchi) resterebbero primitive
+# del sistema operativo condivise da tutti i greenlet del worker
+preload_app = worker_class != 'gevent'
+
+# Riciclo graduale: ogni worker viene sostituito dopo ~1000 richieste
+# (jitter per non riavviarli tutti insieme) e ha tempo per chiudere quelle in corso
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """Ogni worker scarta il pool di connessioni ereditato dal master"""
+    from app.db import dispose_engine
+    dispose_engine()
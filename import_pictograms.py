@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Import in blocco di pittogrammi da un archivio zip o da una cartella
+
+Run:
+    python import_pictograms.py simboli.zip
+    python import_pictograms.py /percorso/pittogrammi --workers 4
+    python import_pictograms.py simboli.zip --restart     # ignora lo stato salvato
+
+Lo stato è salvato in --state (default: media_import.db): un import interrotto
+riprende dalle voci non ancora importate.
+"""
+
+import argparse
+import sys
+
+from app.config import config
+from app.db import init_db
+from app.services.bulk_import import BulkImporter, BATCH_SIZE
+
+
+def print_progress(report):
+    done = report['imported'] + report['skipped'] + report['errors']
+    print(f"\r⏳ {done}/{report['entries']} voci", end='', file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import in blocco di pittogrammi')
+    parser.add_argument('source', help='archivio .zip o cartella')
+    parser.add_argument('--workers', type=int, default=None, help='processi per l\'elaborazione (default: CPU)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='voci per commit')
+    parser.add_argument('--restart', action='store_true', help='ricomincia l\'import da zero')
+    parser.add_argument('--state', default=str(config.BASE_DIR / 'media_import.db'), help='file di stato SQLite')
+    parser.add_argument('--list', action='store_true', help='elenca le voci saltate o in errore')
+    args = parser.parse_args()
+
+    init_db()
+    with BulkImporter(args.source, config.MEDIA_DIR, args.state,
+                      workers=args.workers, batch_size=args.batch_size) as importer:
+        if args.restart:
+            importer.reset()
+        report = importer.run(progress=print_progress)
+        print(file=sys.stderr)
+
+        print(f"✅ Importati: {report['imported']} ({report['imported_bytes'] / 1024 / 1024:.1f} MB)")
+        print(f"⏭️  Saltati: {report['skipped']}")
+        print(f"❌ Errori: {report['errors']}")
+
+        if args.list:
+            for name, status, message in importer.iter_problems():
+                print(f"   {name}: {message} ({status})")
+
+
+if __name__ == '__main__':
+    main()
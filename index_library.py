@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Indicizzazione delle librerie di simboli in sola lettura (PICTOGRAM_LIBRARIES)
+
+Run:
+    PICTOGRAM_LIBRARIES="arasaac=/mnt/simboli/arasaac" python index_library.py
+    python index_library.py arasaac            # solo le librerie indicate
+
+I file sono registrati come asset senza copiarli; le esecuzioni successive
+rielaborano solo i file con mtime/size cambiati (manifest library_file).
+"""
+
+import argparse
+import sys
+import time
+
+from app.config import config
+from app.db import init_db, get_db, close_db
+from app.services import library
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Indicizzazione librerie di simboli')
+    parser.add_argument('names', nargs='*', help='librerie da indicizzare (default: tutte)')
+    parser.add_argument('--batch-size', type=int, default=library.BATCH_SIZE, help='file per commit')
+    args = parser.parse_args()
+
+    libraries = config.PICTOGRAM_LIBRARIES
+    names = args.names or sorted(libraries)
+    unknown = [name for name in names if name not in libraries]
+    if not names or unknown:
+        print(f"❌ Librerie non configurate: {', '.join(unknown) or 'nessuna'} (variabile PICTOGRAM_LIBRARIES)")
+        sys.exit(1)
+
+    init_db()
+    db = get_db()
+    try:
+        for name in names:
+            started = time.monotonic()
+            report = library.index_library(db, name, libraries[name], batch_size=args.batch_size)
+            print(f"📚 {name}: {report['files']} file in {time.monotonic() - started:.1f}s")
+            print(f"   ✅ nuovi {report['added']}, aggiornati {report['updated']}, invariati {report['unchanged']}")
+            print(f"   🗑️  rimossi {report['removed']}, mancanti ma usati da carte {report['missing']}")
+    finally:
+        close_db(db)
+
+
+if __name__ == '__main__':
+    main()
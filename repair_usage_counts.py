@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Ricalcolo del contatore di utilizzo degli asset (Asset.usage_count)
+dal numero di carte che li usano
+
+Run:
+    python repair_usage_counts.py
+    python repair_usage_counts.py --batch-size 5000
+
+Normalmente non serve (i trigger su card lo mantengono): utile dopo modifiche
+fatte direttamente sul database.
+"""
+
+import argparse
+
+from app.db import init_db, get_db, close_db
+from app.services import asset_usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ricalcolo del contatore di utilizzo degli asset')
+    parser.add_argument('--batch-size', type=int, default=asset_usage.BATCH_SIZE, help='asset per commit')
+    args = parser.parse_args()
+
+    init_db()
+    db = get_db()
+    try:
+        fixed = asset_usage.recount(db, batch_size=args.batch_size)
+        print(f"✅ Asset corretti: {fixed}")
+    finally:
+        close_db(db)
+
+
+if __name__ == '__main__':
+    main()
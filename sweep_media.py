@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Sweeper dei file media orfani (file in static/media senza riga nella tabella asset)
+
+Run:
+    python sweep_media.py                  # solo report (spazio recuperabile)
+    python sweep_media.py --quarantine     # sposta gli orfani in static/media/_quarantine/
+    python sweep_media.py --delete         # elimina gli orfani
+    python sweep_media.py --restart        # ignora lo stato salvato e riscansiona
+
+Lo stato è salvato in --state (default: media_sweep.db): un'esecuzione
+interrotta riprende dalla fase e dal blocco in cui si era fermata. Una
+scansione completata più vecchia di --max-scan-age secondi è rifatta da zero.
+"""
+
+import argparse
+
+from app.config import config
+from app.services.media_sweeper import MediaSweeper, ACTION_REPORT, ACTION_QUARANTINE, ACTION_DELETE
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweeper file media orfani')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--quarantine', action='store_true', help='sposta gli orfani in quarantena')
+    group.add_argument('--delete', action='store_true', help='elimina gli orfani')
+    parser.add_argument('--restart', action='store_true', help='ricomincia la scansione da zero')
+    parser.add_argument('--state', default=str(config.BASE_DIR / 'media_sweep.db'), help='file di stato SQLite')
+    parser.add_argument('--list', action='store_true', help='elenca i file orfani')
+    parser.add_argument('--min-age', type=int, default=config.MEDIA_SWEEP_MIN_AGE,
+                        help='secondi: i file modificati più di recente non sono toccati')
+    parser.add_argument('--max-scan-age', type=int, default=config.MEDIA_SWEEP_MAX_SCAN_AGE,
+                        help='secondi: una scansione completata più vecchia viene rifatta')
+    args = parser.parse_args()
+
+    action = ACTION_QUARANTINE if args.quarantine else ACTION_DELETE if args.delete else ACTION_REPORT
+
+    with MediaSweeper(config.MEDIA_DIR, args.state, min_age=args.min_age,
+                      max_scan_age=args.max_scan_age) as sweeper:
+        if args.restart:
+            sweeper.reset()
+        report = sweeper.run()
+
+        print(f"📁 File: {report['files']} ({format_bytes(report['bytes'])})")
+        print(f"✅ Referenziati: {format_bytes(report['referenced_bytes'])}")
+        print(f"🗑️  Orfani: {report['orphans']} ({report['orphan_derivatives']} derivati), "
+              f"recuperabili {format_bytes(report['reclaimable_bytes'])}")
+        if report['recent']:
+            print(f"⏳ Recenti senza riga (non toccati): {report['recent']}")
+
+        if args.list:
+            for name, size in sweeper.iter_orphans():
+                print(f"   {name} ({format_bytes(size)})")
+
+        if action != ACTION_REPORT:
+            handled = sweeper.apply(action)
+            verb = 'spostati in quarantena' if action == ACTION_QUARANTINE else 'eliminati'
+            print(f"✅ {handled} file {verb}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Controllo di ammissione per l'elaborazione delle immagini
+"""
+
+import io
+import os
+import multiprocessing
+
+import pytest
+from PIL import Image
+
+from app.services import admission
+from app.services.admission import PRIORITY_BULK, PRIORITY_INTERACTIVE, Saturated, SlotLimiter
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    limiter = SlotLimiter(tmp_path / 'slots', slots=2, reserved=1, retry_after=7)
+    admission.set_limiter(limiter)
+    yield limiter
+    admission.set_limiter(None)
+
+
+def _hold_slot(lock_dir, ready, done):
+    limiter = SlotLimiter(lock_dir, slots=1, reserved=0)
+    slot = limiter.acquire()
+    ready.set()
+    done.wait(10)
+    limiter.release(slot)
+
+
+def test_bulk_work_leaves_reserved_slot_to_interactive(limiter):
+    bulk = limiter.acquire(PRIORITY_BULK, timeout=0)
+    with pytest.raises(Saturated) as error:
+        limiter.acquire(PRIORITY_BULK, timeout=0.1)
+    assert error.value.retry_after == 7
+
+    interactive = limiter.acquire(PRIORITY_INTERACTIVE, timeout=0)
+    with pytest.raises(Saturated):
+        limiter.acquire(PRIORITY_INTERACTIVE, timeout=0)
+
+    limiter.release(bulk)
+    limiter.release(interactive)
+    with limiter.slot(PRIORITY_BULK, timeout=0):
+        pass
+
+
+def test_slots_are_shared_across_processes(tmp_path):
+    ready, done = multiprocessing.Event(), multiprocessing.Event()
+    holder = multiprocessing.Process(target=_hold_slot, args=(tmp_path, ready, done))
+    holder.start()
+    try:
+        assert ready.wait(10)
+        with pytest.raises(Saturated):
+            SlotLimiter(tmp_path, slots=1, reserved=0).acquire(timeout=0.1)
+    finally:
+        done.set()
+        holder.join(10)
+    with SlotLimiter(tmp_path, slots=1, reserved=0).slot(timeout=1):
+        pass
+
+
+def test_saturated_upload_returns_503_with_retry_after(client, limiter, tmp_path):
+    client.application.static_folder = str(tmp_path)
+    client.application.config['IMAGE_QUEUE_TIMEOUT'] = 0.1
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), 'blue').save(buffer, 'PNG')
+
+    def upload():
+        buffer.seek(0)
+        return client.post('/assets/api/upload', data={'file': (io.BytesIO(buffer.getvalue()), 'blu.png')},
+                           content_type='multipart/form-data')
+
+    held = [limiter.acquire(timeout=0), limiter.acquire(timeout=0)]
+    response = upload()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+    assert not (tmp_path / 'media').exists() or not any((tmp_path / 'media').iterdir())
+
+    limiter.release(held.pop())
+    assert upload().status_code == 200
+    limiter.release(held.pop())
+
+
+def test_uploads_without_raster_processing_do_not_wait_for_slots(client, limiter, tmp_path):
+    client.application.static_folder = str(tmp_path)
+    client.application.config['IMAGE_QUEUE_TIMEOUT'] = 0.1
+    held = [limiter.acquire(timeout=0), limiter.acquire(timeout=0)]
+    try:
+        svg = b'<svg xmlns="http://www.w3.org/2000/svg" width="4" height="4"/>'
+        response = client.post('/assets/api/upload', data={'file': (io.BytesIO(svg), 'icona.svg')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 200
+
+        broken = io.BytesIO(b'non un png')
+        response = client.post('/assets/upload', data={'files': [(broken, 'rotto.png')]},
+                               content_type='multipart/form-data')
+        assert response.status_code == 302
+        assert sorted(path.suffix for path in (tmp_path / 'media').iterdir()) == ['.png', '.svg']
+    finally:
+        for slot in held:
+            limiter.release(slot)
+
+
+def test_atlas_library_thumbnail_waits_for_a_slot(limiter, tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    from app.config import config
+    from app.services import atlas
+
+    root = tmp_path / 'arasaac'
+    root.mkdir()
+    Image.new('RGB', (300, 300), 'red').save(root / 'casa.png')
+    monkeypatch.setattr(config, 'PICTOGRAM_LIBRARIES', {'arasaac': root})
+    monkeypatch.setattr(config, 'LIBRARY_CACHE_DIR', tmp_path / 'cache')
+    monkeypatch.setattr(atlas, 'LIBRARY_SLOT_TIMEOUT', 0.1)
+    asset = SimpleNamespace(url='library/arasaac/casa.png')
+
+    held = [limiter.acquire(timeout=0), limiter.acquire(timeout=0)]
+    assert atlas._local_image_path(asset) is None  # saturi: niente thumbnail generata
+    assert not (tmp_path / 'cache').exists()
+
+    limiter.release(held.pop())
+    path = atlas._local_image_path(asset)
+    assert path and os.path.isfile(path)
+    limiter.release(held.pop())
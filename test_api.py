@@ -0,0 +1,113 @@
+"""
+API JSON runtime: payload, sparse fieldsets, MessagePack e query per richiesta
+"""
+
+import pytest
+
+from conftest import QueryCounter, populate
+
+
+def test_get_page_returns_cards_with_images_and_targets(client, db_session):
+    (book_id, page_ids), = populate(db_session, pages=2, cards=3)
+
+    response = client.get(f'/api/books/{book_id}/pages/{page_ids[0]}')
+
+    assert response.status_code == 200
+    assert response.headers['X-API-Version'] == '1'
+    page = response.get_json()['page']
+    assert page['id'] == page_ids[0]
+    assert len(page['cards']) == 3
+    card = page['cards'][0]
+    assert card['image_url'] == '/static/media/b0-p0-c0.png'
+    assert card['target_page_id'] == page_ids[1]
+    assert card['target_title'] == 'Pagina 1'
+
+
+def test_get_page_is_a_single_query(client, db_engine, db_session):
+    (book_id, page_ids), = populate(db_session, pages=3, cards=36)
+
+    with QueryCounter(db_engine) as counter:
+        response = client.get(f'/api/books/{book_id}/pages/{page_ids[1]}')
+
+    assert response.status_code == 200
+    assert counter.count == 1
+
+
+def test_get_book_embeds_pages_in_a_single_query(client, db_engine, db_session):
+    (book_id, page_ids), = populate(db_session, pages=4, cards=5)
+
+    with QueryCounter(db_engine) as counter:
+        response = client.get(f'/api/books/{book_id}')
+
+    book = response.get_json()['book']
+    assert counter.count == 1
+    assert [page['id'] for page in book['pages']] == page_ids
+    assert all(len(page['cards']) == 5 for page in book['pages'])
+
+
+def test_sparse_fieldsets(client, db_session):
+    (book_id, page_ids), = populate(db_session, pages=1, cards=2)
+
+    response = client.get(
+        f'/api/books/{book_id}/pages/{page_ids[0]}?fields[page]=cards&fields[card]=label,image_url'
+    )
+
+    assert response.get_json()['page'] == {
+        'cards': [
+            {'label': 'Carta 0', 'image_url': '/static/media/b0-p0-c0.png'},
+            {'label': 'Carta 1', 'image_url': '/static/media/b0-p0-c1.png'},
+        ]
+    }
+    assert client.get(f'/api/books/{book_id}?fields[card]=nope').status_code == 400
+
+
+def test_missing_page_returns_404(client, db_session):
+    (book_id, _), = populate(db_session)
+
+    response = client.get(f'/api/books/{book_id}/pages/9999')
+
+    assert response.status_code == 404
+    assert response.get_json()['success'] is False
+
+
+def test_msgpack_encoding(client, db_session):
+    msgpack = pytest.importorskip('msgpack')
+    (book_id, page_ids), = populate(db_session, cards=4)
+    url = f'/api/books/{book_id}/pages/{page_ids[0]}'
+
+    response = client.get(url, headers={'Accept': 'application/msgpack'})
+
+    assert response.mimetype == 'application/msgpack'
+    assert msgpack.unpackb(response.data)['page'] == client.get(url).get_json()['page']
+    assert len(response.data) < len(client.get(url).data)
+
+
+def test_published_book_is_served_from_snapshots(client, db_engine, db_session):
+    from app.models import Card, Page
+    from app.services import preview
+
+    (book_id, page_ids), = populate(db_session, pages=2, cards=2)
+    client.post(f'/books/{book_id}/publish')
+    card = db_session.query(Card).filter_by(page_id=page_ids[0]).first()
+    card.label = 'Bozza'
+    db_session.add(Page(book_id=book_id, title='Nuova', order=5))
+    db_session.commit()
+
+    with QueryCounter(db_engine) as counter:
+        book = client.get(f'/api/books/{book_id}').get_json()['book']
+    assert counter.count == 2
+    assert [page['id'] for page in book['pages']] == page_ids
+    assert 'Bozza' not in {card['label'] for page in book['pages'] for card in page['cards']}
+
+    page = client.get(f'/api/books/{book_id}/pages/{page_ids[0]}').get_json()['page']
+    assert page['cards'][0]['label'] == 'Carta 0'
+    assert page['cards'][0]['image_url'] == '/static/media/b0-p0-c0.png'
+    assert page['cards'][0]['target_title'] == 'Pagina 1'
+    assert client.get(f'/api/books/{book_id}/pages/{page_ids[0]}?draft=1').get_json()['page'] == page
+
+    # Bozze solo con il token di anteprima del libro
+    with client.application.test_request_context():
+        token = preview.draft_token(book_id)
+    page = client.get(f'/api/books/{book_id}/pages/{page_ids[0]}?draft={token}').get_json()['page']
+    assert page['cards'][0]['label'] == 'Bozza'
+    assert len(client.get(f'/api/books/{book_id}?draft={token}').get_json()['book']['pages']) == 3
@@ -0,0 +1,68 @@
+"""
+Metadati intrinseci salvati su Asset
+"""
+
+import hashlib
+import io
+
+from PIL import Image
+
+from app.models.asset import DERIVATIVE_BITS
+from app.services.images import backfill_metadata
+
+
+def _png(size=(320, 200), color='orange'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_upload_stores_intrinsic_metadata(client, db_session, tmp_path):
+    from app.models import Asset
+
+    client.application.static_folder = str(tmp_path)
+    data = _png()
+    response = client.post('/assets/api/upload', data={'file': (io.BytesIO(data), 'arancio.png')},
+                           content_type='multipart/form-data').get_json()
+    assert response['asset']['width'] == 320 and response['asset']['height'] == 200
+
+    asset = db_session.get(Asset, response['asset']['id'])
+    assert (asset.width, asset.height, asset.byte_size) == (320, 200, len(data))
+    assert asset.content_hash == hashlib.sha256(data).hexdigest()
+    assert asset.derivatives == sum(DERIVATIVE_BITS.values())
+    assert asset.derivative_url('thumbnail') == f"/static/media/{asset.url[:-4]}_thumbnail.jpg"
+
+    # Fingerprint dall'hash salvato, senza leggere il file (solo dimensione e mtime)
+    from app.services import media
+    media._fingerprints.clear()
+    with client.application.test_request_context():
+        fingerprint = media._stamped_fingerprint(asset.content_hash, str(tmp_path / 'media' / asset.url))
+        assert media.media_url(asset) == f"/assets/media/{fingerprint}/{asset.url}"
+        assert media._fingerprints == {}
+        # Stesso contenuto letto da disco: stesso URL
+        assert media.media_url(asset.url) == media.media_url(asset)
+
+    html = client.get('/assets').get_data(as_text=True)
+    assert 'width="320" height="200"' in html
+    assert f'{asset.url[:-4]}_thumbnail.jpg' in html
+
+
+def test_backfill_fills_existing_rows_in_batches(db_session, tmp_path):
+    from app.models import Asset
+
+    data = _png((64, 48))
+    (tmp_path / 'vecchio.png').write_bytes(data)
+    Image.new('RGB', (10, 10)).save(tmp_path / 'vecchio_thumbnail.jpg')
+    db_session.add_all([
+        Asset(kind='image/png', url='vecchio.png'),
+        Asset(kind='image/png', url='sparito.png'),
+        Asset(kind='image/png', url='library/arasaac/casa.png'),
+    ])
+    db_session.commit()
+
+    assert backfill_metadata(db_session, tmp_path, batch_size=1) == (1, 1)
+    asset = db_session.query(Asset).filter_by(url='vecchio.png').one()
+    assert (asset.width, asset.height, asset.byte_size) == (64, 48, len(data))
+    assert asset.content_hash == hashlib.sha256(data).hexdigest()
+    assert asset.has_derivative('thumbnail') and not asset.has_derivative('large')
+    assert asset.derivative_url('large') == '/static/media/vecchio.png'
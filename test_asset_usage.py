@@ -0,0 +1,94 @@
+"""
+Contatore di utilizzo degli asset mantenuto dai trigger su card
+"""
+
+import sqlite3
+
+from sqlalchemy import create_engine, text
+
+from conftest import populate
+
+
+def _usage(db, asset_id):
+    from app.models import Asset
+
+    db.expire_all()
+    return db.get(Asset, asset_id).usage_count
+
+
+def test_usage_count_follows_card_edits_and_bulk_operations(client, db_session):
+    from app.models import Asset, Card
+
+    (book_id, page_ids), = populate(db_session, pages=2, cards=2)
+    shared = db_session.query(Asset).filter_by(url='b0-p0-c0.png').one()
+    other = db_session.query(Asset).filter_by(url='b0-p1-c0.png').one()
+    assert _usage(db_session, shared.id) == 1
+
+    # ORM: nuova carta e cambio immagine
+    db_session.add(Card(page_id=page_ids[1], slot_row=5, slot_col=5, label='Extra', image_id=shared.id))
+    moved = db_session.query(Card).filter_by(image_id=other.id).one()
+    moved.image_id = shared.id
+    db_session.commit()
+    assert (_usage(db_session, shared.id), _usage(db_session, other.id)) == (3, 0)
+
+    # Core: duplicazione con INSERT ... SELECT ed eliminazione in cascata
+    client.post(f'/books/{book_id}/duplicate')
+    assert _usage(db_session, shared.id) == 6
+    client.post(f'/books/{book_id}/delete')
+    assert _usage(db_session, shared.id) == 3
+
+    # Più usati per primi, poi i non usati
+    html = client.get('/assets?sort=usage&order=desc').get_data(as_text=True)
+    assert html.index('b0-p0-c0.png') < html.index('b0-p0-c1.png') < html.index('b0-p1-c0.png')
+
+    response = client.post(f'/assets/{shared.id}/delete')
+    assert response.headers['Location'].endswith(f'/assets/{shared.id}')
+    assert _usage(db_session, shared.id) == 3
+
+
+def test_recount_repairs_drifted_counters(db_session):
+    from app.models import Asset
+    from app.services import asset_usage
+
+    populate(db_session, pages=1, cards=3)
+    db_session.execute(text("UPDATE asset SET usage_count = 7 WHERE url = 'b0-p0-c1.png'"))
+    db_session.add(Asset(kind='image/png', url='libero.png', usage_count=2))
+    db_session.commit()
+
+    assert asset_usage.recount(db_session, batch_size=2) == 2
+    assert asset_usage.recount(db_session) == 0
+    counts = dict(db_session.query(Asset.url, Asset.usage_count))
+    assert counts == {'b0-p0-c0.png': 1, 'b0-p0-c1.png': 1, 'b0-p0-c2.png': 1, 'libero.png': 0}
+
+
+def test_migration_counts_existing_cards(tmp_path):
+    from app.db import init_db
+
+    path = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE book (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, locale VARCHAR,
+                           home_page_id INTEGER REFERENCES page(id));
+        CREATE TABLE page (id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL REFERENCES book(id),
+                           title VARCHAR NOT NULL, grid_cols INTEGER, grid_rows INTEGER, "order" INTEGER);
+        CREATE TABLE asset (id INTEGER PRIMARY KEY, kind VARCHAR NOT NULL, url VARCHAR NOT NULL, alt VARCHAR);
+        CREATE TABLE card (id INTEGER PRIMARY KEY, page_id INTEGER NOT NULL REFERENCES page(id),
+                           slot_row INTEGER NOT NULL, slot_col INTEGER NOT NULL, row_span INTEGER, col_span INTEGER,
+                           label VARCHAR NOT NULL, background_color VARCHAR, border_color VARCHAR, action_type VARCHAR,
+                           image_id INTEGER REFERENCES asset(id), target_page_id INTEGER REFERENCES page(id));
+        INSERT INTO book VALUES (1, 'Libro', 'it-IT', 1);
+        INSERT INTO page VALUES (1, 1, 'Home', 3, 3, 0);
+        INSERT INTO asset VALUES (1, 'image/png', 'a.png', 'a'), (2, 'image/png', 'b.png', 'b');
+        INSERT INTO card VALUES (1, 1, 0, 0, 1, 1, 'Uno', '#FFFFFF', '#000000', 'none', 1, NULL),
+                                (2, 1, 0, 1, 1, 1, 'Due', '#FFFFFF', '#000000', 'none', 1, NULL);
+    """)
+    conn.close()
+    engine = create_engine(f"sqlite:///{path}")
+
+    init_db(engine)
+
+    with engine.begin() as db:
+        assert db.execute(text("SELECT usage_count FROM asset ORDER BY id")).scalars().all() == [2, 0]
+        db.execute(text("UPDATE card SET image_id = 2 WHERE id = 1"))
+        assert db.execute(text("SELECT usage_count FROM asset ORDER BY id")).scalars().all() == [1, 1]
+    engine.dispose()
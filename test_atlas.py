@@ -0,0 +1,92 @@
+"""
+Atlas sprite per pagina runtime
+"""
+
+import os
+
+import pytest
+from PIL import Image
+
+from app.config import config
+from app.services import atlas as atlas_service
+from conftest import populate
+
+
+@pytest.fixture
+def media_dir(tmp_path, monkeypatch):
+    static_dir = tmp_path / 'static'
+    (static_dir / 'media').mkdir(parents=True)
+    monkeypatch.setattr(config, 'STATIC_DIR', static_dir)
+    monkeypatch.setattr(config, 'ATLAS_DIR', static_dir / 'media' / '_atlas')
+    return static_dir / 'media'
+
+
+def _write_images(media_dir, book=0, page=0, cards=1, color=(255, 0, 0)):
+    for c in range(cards):
+        Image.new('RGB', (300, 200), color).save(media_dir / f'b{book}-p{page}-c{c}.png')
+
+
+def _page_with_cards(db_session, page_id):
+    from app.models import Card, Page
+    page = db_session.get(Page, page_id)
+    return page, db_session.query(Card).filter_by(page_id=page_id).all()
+
+
+def test_atlas_composes_all_card_images(db_session, media_dir):
+    (_, page_ids), = populate(db_session, cards=8)
+    _write_images(media_dir, cards=8)
+    page, cards = _page_with_cards(db_session, page_ids[0])
+
+    atlas = atlas_service.get_page_atlas(page, cards)
+
+    assert set(atlas['css']) == {card.id for card in cards}
+    assert (atlas['width'], atlas['height']) == (6 * atlas_service.ATLAS_CELL_SIZE, 2 * atlas_service.ATLAS_CELL_SIZE)
+    assert atlas['css_size'] == (6 * atlas_service.ATLAS_DISPLAY_SIZE, 2 * atlas_service.ATLAS_DISPLAY_SIZE)
+    assert os.path.isfile(config.STATIC_DIR / atlas['url'][len('/static/'):])
+
+
+def test_atlas_is_regenerated_only_when_images_change(db_session, media_dir):
+    (_, page_ids), = populate(db_session, cards=2)
+    _write_images(media_dir, cards=2)
+    page, cards = _page_with_cards(db_session, page_ids[0])
+
+    first = atlas_service.get_page_atlas(page, cards)
+    assert atlas_service.get_page_atlas(page, cards)['url'] == first['url']
+
+    os.utime(media_dir / 'b0-p0-c1.png', ns=(1, 1))
+    second = atlas_service.get_page_atlas(page, cards)
+
+    assert second['url'] != first['url']
+    assert len(os.listdir(config.ATLAS_DIR)) == 2  # immagine + mappa, la versione vecchia è rimossa
+
+
+def test_concurrent_builds_use_separate_temp_files(db_session, media_dir, monkeypatch):
+    (_, page_ids), = populate(db_session, cards=2)
+    _write_images(media_dir, cards=2)
+    page, cards = _page_with_cards(db_session, page_ids[0])
+
+    partials = []
+    partial_path = atlas_service._partial_path
+
+    def record(path):
+        partials.append(partial_path(path))
+        return partials[-1]
+
+    monkeypatch.setattr(atlas_service, '_partial_path', record)
+    atlas_service.get_page_atlas(page, cards)
+    assert partial_path('x.png') != partial_path('x.png')
+    assert all(f'.{os.getpid()}.' in path for path in partials) and len(partials) == 2
+    # Nessun file temporaneo rimasto: pubblicati con os.replace
+    assert not [name for name in os.listdir(config.ATLAS_DIR) if name.endswith('.part')]
+
+
+def test_runtime_page_uses_atlas_when_requested(client, db_session, media_dir):
+    (book_id, page_ids), = populate(db_session, cards=3)
+    _write_images(media_dir, cards=3)
+
+    html = client.get(f'/books/{book_id}/runtime/{page_ids[0]}?atlas=1').get_data(as_text=True)
+
+    assert 'aac-card-sprite' in html
+    assert '/static/media/_atlas/page-' in html
+    assert 'background-position: -60px 0px;' in html
+    assert '<img src="/static/media/b0-p0-c0.png"' not in html
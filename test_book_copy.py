@@ -0,0 +1,50 @@
+"""
+Duplicazione libro con INSERT ... SELECT
+"""
+
+import time
+
+from conftest import QueryCounter, populate
+
+
+def test_duplicate_book_remaps_pages_and_shares_assets(client, db_engine, db_session):
+    from app.models import Asset, Book, Card, Page
+
+    (book_id, page_ids), (other_id, other_pages) = populate(db_session, books=2, pages=300, cards=4)
+    # Un collegamento verso un altro libro resta invariato nella copia
+    outbound = db_session.query(Card).filter_by(page_id=page_ids[0]).first()
+    outbound.target_page_id = other_pages[0]
+    db_session.commit()
+    assets_before = db_session.query(Asset).count()
+
+    started = time.perf_counter()
+    with QueryCounter(db_engine) as counter:
+        response = client.post(f'/books/{book_id}/duplicate')
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 302
+    assert counter.count <= 15, counter.statements
+    assert elapsed < 1.0
+
+    db_session.expire_all()
+    copy = db_session.query(Book).filter(Book.id != book_id, Book.id != other_id).one()
+    assert copy.title.endswith('(copia)')
+    copy_pages = db_session.query(Page).filter_by(book_id=copy.id).order_by(Page.order, Page.id).all()
+    original_pages = db_session.query(Page).filter_by(book_id=book_id).order_by(Page.order, Page.id).all()
+    assert [p.title for p in copy_pages] == [p.title for p in original_pages]
+    copy_ids = {p.id for p in copy_pages}
+    assert copy.home_page_id == copy_pages[0].id
+
+    copy_cards = db_session.query(Card).filter(Card.page_id.in_(copy_ids)).order_by(Card.id).all()
+    assert len(copy_cards) == 300 * 4
+    internal = [c for c in copy_cards if c.target_page_id in copy_ids]
+    assert len(internal) == 300 * 4 - 1
+    assert any(c.target_page_id == other_pages[0] for c in copy_cards)
+    assert db_session.query(Asset).count() == assets_before
+    original_images = {c.image_id for p in original_pages for c in p.cards}
+    assert {c.image_id for c in copy_cards} == original_images
+
+
+def test_duplicate_missing_book_redirects(client):
+    response = client.post('/books/999/duplicate')
+    assert response.status_code == 302
@@ -0,0 +1,84 @@
+"""
+Import in blocco da archivio zip o cartella
+"""
+
+import io
+import zipfile
+
+import pytest
+from PIL import Image
+
+from app.services import bulk_import, similarity
+from app.services.bulk_import import BulkImporter
+
+
+@pytest.fixture(autouse=True)
+def fresh_index():
+    similarity.reset()
+    yield
+    similarity.reset()
+
+
+def _png(color, size=64):
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _archive(path, count=5):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for i in range(count):
+            archive.writestr(f'set/simbolo_{i}.png', _png((i * 40, 0, 0)))
+        archive.writestr('set/leggimi.txt', b'testo')
+        archive.writestr('__MACOSX/set/._simbolo_0.png', b'x')
+    return path
+
+
+def test_zip_import_with_process_pool(tmp_path, db_session):
+    from app.models import Asset, Change
+
+    media = tmp_path / 'media'
+    with BulkImporter(_archive(tmp_path / 'set.zip'), media, tmp_path / 'state.db', workers=2, batch_size=2) as importer:
+        report = importer.run()
+
+    assert report['imported'] == 5
+    assert report['skipped'] == 2
+    assert report['errors'] == 0 and report['pending'] == 0
+
+    assets = db_session.query(Asset).order_by(Asset.id).all()
+    assert [asset.alt for asset in assets] == [f'simbolo_{i}.png' for i in range(5)]
+    assert all(asset.phash and asset.kind == 'image/png' for asset in assets)
+    for asset in assets:
+        assert (media / asset.url).exists()
+        assert (media / asset.url.replace('.png', '_thumbnail.jpg')).exists()
+    assert not list(media.glob('*.part'))
+    # Asset nuovi non usati da carte: nessuna riga nei change feed dei libri
+    assert db_session.query(Change).filter_by(entity='asset').count() == 0
+
+
+def test_interrupted_import_resumes_without_reprocessing(tmp_path, db_session, monkeypatch):
+    from app.models import Asset
+
+    source = tmp_path / 'cartella'
+    source.mkdir()
+    for i in range(6):
+        (source / f'p{i}.png').write_bytes(_png((0, i * 40, 0)))
+
+    processed = []
+    original = bulk_import._process_file
+    monkeypatch.setattr(bulk_import, '_process_file', lambda path: processed.append(path) or original(path))
+
+    def interrupt(report):
+        raise KeyboardInterrupt
+
+    with BulkImporter(source, tmp_path / 'media', tmp_path / 'state.db', workers=1, batch_size=2) as importer:
+        with pytest.raises(KeyboardInterrupt):
+            importer.run(progress=interrupt)
+    assert db_session.query(Asset).count() == 2
+    assert len(processed) == 2
+
+    with BulkImporter(source, tmp_path / 'media', tmp_path / 'state.db', workers=1, batch_size=2) as importer:
+        report = importer.run()
+    assert report['imported'] == 6
+    assert len(processed) == 6
+    assert db_session.query(Asset).count() == 6
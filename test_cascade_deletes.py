@@ -0,0 +1,81 @@
+"""
+Eliminazioni a cascata nel database (ON DELETE CASCADE / SET NULL)
+"""
+
+import sqlite3
+
+from sqlalchemy import create_engine, text
+
+from conftest import QueryCounter, populate
+
+
+def test_delete_large_book_runs_a_handful_of_statements(client, db_engine, db_session):
+    from app.models import Book, Page, Card
+
+    (book_id, page_ids), (other_id, other_pages) = populate(db_session, books=2, pages=1000, cards=1)
+    # Carta di un altro libro che punta a una pagina del libro da eliminare
+    foreign = db_session.query(Card).filter_by(page_id=other_pages[0]).first()
+    foreign.target_page_id = page_ids[5]
+    db_session.commit()
+
+    with QueryCounter(db_engine) as counter:
+        response = client.post(f'/books/{book_id}/delete')
+
+    assert response.status_code == 302
+    assert counter.count <= 5, counter.statements
+    db_session.expire_all()
+    assert db_session.get(Book, book_id) is None
+    assert db_session.query(Page).filter(Page.book_id == book_id).count() == 0
+    assert db_session.query(Card).filter(Card.page_id.in_(page_ids)).count() == 0
+    assert db_session.get(Card, foreign.id).target_page_id is None
+    assert db_session.query(Page).filter(Page.book_id == other_id).count() == 1000
+
+
+def test_delete_page_nulls_home_page_and_targets(client, db_session):
+    from app.models import Book, Card
+
+    (book_id, page_ids), = populate(db_session, pages=3, cards=2)
+    home_id = page_ids[0]
+
+    client.post(f'/books/{book_id}/pages/{home_id}/delete')
+
+    db_session.expire_all()
+    assert db_session.get(Book, book_id).home_page_id is None
+    assert db_session.query(Card).filter(Card.page_id == home_id).count() == 0
+    # Le carte dell'ultima pagina puntavano alla home (ciclo)
+    assert all(card.target_page_id is None for card in db_session.query(Card).filter_by(page_id=page_ids[2]))
+
+
+def test_migration_adds_cascading_foreign_keys(tmp_path):
+    from app.db import init_db, SCHEMA_VERSION, get_schema_version
+
+    path = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE book (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, locale VARCHAR,
+                           home_page_id INTEGER REFERENCES page(id));
+        CREATE TABLE page (id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL REFERENCES book(id),
+                           title VARCHAR NOT NULL, grid_cols INTEGER, grid_rows INTEGER, "order" INTEGER);
+        CREATE TABLE asset (id INTEGER PRIMARY KEY, kind VARCHAR NOT NULL, url VARCHAR NOT NULL, alt VARCHAR);
+        CREATE TABLE card (id INTEGER PRIMARY KEY, page_id INTEGER NOT NULL REFERENCES page(id),
+                           slot_row INTEGER NOT NULL, slot_col INTEGER NOT NULL, row_span INTEGER, col_span INTEGER,
+                           label VARCHAR NOT NULL, background_color VARCHAR, border_color VARCHAR, action_type VARCHAR,
+                           image_id INTEGER REFERENCES asset(id), target_page_id INTEGER REFERENCES page(id));
+        INSERT INTO book VALUES (1, 'Libro', 'it-IT', 1);
+        INSERT INTO page VALUES (1, 1, 'Home', 3, 3, 0), (2, 1, 'Altra', 3, 3, 1);
+        INSERT INTO card VALUES (1, 2, 0, 0, 1, 1, 'Vai', '#FFFFFF', '#000000', 'navigation', NULL, 1);
+    """)
+    conn.close()
+    engine = create_engine(f"sqlite:///{path}")
+
+    init_db(engine)
+
+    assert get_schema_version(engine) == SCHEMA_VERSION
+    with engine.begin() as db:
+        on_delete = {row[3]: row[6] for row in db.execute(text("PRAGMA foreign_key_list(card)"))}
+        assert on_delete == {'page_id': 'CASCADE', 'target_page_id': 'SET NULL', 'image_id': 'NO ACTION'}
+        assert db.execute(text("PRAGMA foreign_key_check")).fetchall() == []
+        db.execute(text("DELETE FROM page WHERE id = 1"))
+        assert db.execute(text("SELECT home_page_id FROM book")).scalar() is None
+        assert db.execute(text("SELECT target_page_id FROM card")).scalar() is None
+    engine.dispose()
@@ -0,0 +1,131 @@
+"""
+Change feed e sincronizzazione incrementale (/api/books/<id>/changes)
+"""
+
+from conftest import populate
+
+
+def _changes(client, book_id, since):
+    response = client.get(f'/api/books/{book_id}/changes?since={since}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_orm_edits_are_recorded_per_book(client, db_session):
+    from app.models import Card
+
+    (book_id, page_ids), (other_id, _) = populate(db_session, books=2, pages=2, cards=2)
+    version = client.get(f'/api/books/{book_id}').get_json()['version']
+    other_version = client.get(f'/api/books/{other_id}').get_json()['version']
+
+    card = db_session.query(Card).filter_by(page_id=page_ids[0]).first()
+    card.label = 'Modificata'
+    db_session.commit()
+
+    feed = _changes(client, book_id, version)
+    assert feed['changes'] == [{'entity': 'card', 'id': card.id, 'op': 'update', 'version': feed['version']}]
+    assert feed['reset'] is False
+    assert _changes(client, other_id, other_version)['changes'] == []
+    # Nessuna modifica successiva: risposta vuota con la stessa versione
+    assert _changes(client, book_id, feed['version']) == {
+        'v': 1, 'book_id': book_id, 'version': feed['version'], 'changes': [], 'more': False, 'reset': False,
+    }
+
+
+def test_insert_then_delete_cancels_out(client, db_session):
+    from app.models import Card
+
+    (book_id, page_ids), = populate(db_session, pages=1, cards=1)
+    version = _changes(client, book_id, 0)['version']
+
+    card = Card(page_id=page_ids[0], slot_row=5, slot_col=5, label='Temporanea')
+    db_session.add(card)
+    db_session.commit()
+    db_session.delete(card)
+    db_session.commit()
+
+    assert _changes(client, book_id, version)['changes'] == []
+
+
+def test_core_deletes_and_reorder_are_recorded(client, db_session):
+    (book_id, page_ids), = populate(db_session, pages=3, cards=0)
+    version = _changes(client, book_id, 0)['version']
+
+    client.post(f'/books/{book_id}/pages/reorder', json={'page_ids': [page_ids[2], page_ids[0], page_ids[1]]})
+    client.post(f'/books/{book_id}/pages/{page_ids[1]}/delete')
+
+    changes = _changes(client, book_id, version)['changes']
+    assert [(c['entity'], c['id'], c['op']) for c in changes] == [
+        ('page', page_ids[2], 'update'),
+        ('page', page_ids[1], 'delete'),
+    ]
+
+
+def test_asset_changes_reach_only_books_using_them(client, db_session):
+    from app.models import Asset, Card, Change
+    from app.services import change_feed
+
+    (book_id, page_ids), (other_id, _) = populate(db_session, books=2, pages=1, cards=1)
+    version = _changes(client, book_id, 0)['version']
+    other_version = _changes(client, other_id, 0)['version']
+
+    # Asset caricato (o importato) e non ancora usato: nessun feed
+    unused = Asset(kind='image/png', url='nuovo.png')
+    db_session.add(unused)
+    db_session.commit()
+    unused.alt = 'Nuovo'
+    db_session.commit()
+    assert _changes(client, book_id, version)['changes'] == []
+    assert _changes(client, other_id, other_version)['changes'] == []
+
+    # Asset usato dal primo libro: solo il suo feed (anche per gli statement Core)
+    used = db_session.query(Card).filter_by(page_id=page_ids[0]).one().image
+    used.alt = 'Cambiata'
+    db_session.commit()
+    change_feed.record_assets(db_session, [used.id, unused.id], change_feed.OP_UPDATE)
+    db_session.commit()
+
+    feed = _changes(client, book_id, version)
+    assert [(c['entity'], c['id'], c['op']) for c in feed['changes']] == [('asset', used.id, 'update')]
+    assert _changes(client, other_id, other_version)['changes'] == []
+    assert client.get(f'/api/books/{other_id}').get_json()['version'] == other_version
+
+    # Stesso asset in due libri: la compattazione tiene una riga per libro
+    other_card = db_session.query(Card).filter(Card.page.has(book_id=other_id)).first()
+    other_card.image_id = used.id
+    db_session.commit()
+    used.alt = 'Condivisa'
+    db_session.commit()
+    change_feed.compact(db_session)
+    db_session.commit()
+    assert {row.book_id for row in db_session.query(Change).filter_by(entity='asset', entity_id=used.id)} == {
+        book_id, other_id,
+    }
+
+
+def test_compaction_keeps_latest_and_resets_old_clients(client, db_session):
+    from app.models import Change, Page
+    from app.services import change_feed
+
+    (book_id, page_ids), = populate(db_session, pages=2, cards=1)
+    for title in ('A', 'B', 'C'):
+        db_session.get(Page, page_ids[0]).title = title
+        db_session.commit()
+    client.post(f'/books/{book_id}/pages/{page_ids[1]}/delete')
+    rows_before = db_session.query(Change).count()
+
+    change_feed.compact(db_session, retention_seconds=3600)
+    db_session.commit()
+    assert db_session.query(Change).count() < rows_before
+    assert db_session.query(Change).filter_by(entity='page', entity_id=page_ids[0]).count() == 1
+    assert _changes(client, book_id, 0)['reset'] is False
+
+    # Tombstone scadute: i client precedenti alla soglia devono riscaricare
+    change_feed.compact(db_session, retention_seconds=0, now=2 ** 40)
+    db_session.commit()
+    assert _changes(client, book_id, 0)['reset'] is True
+    assert _changes(client, book_id, change_feed.compaction_floor(db_session))['reset'] is False
+
+
+def test_changes_requires_since(client):
+    assert client.get('/api/books/1/changes').status_code == 400
@@ -0,0 +1,59 @@
+"""
+Compressione delle risposte e file statici precompressi
+"""
+
+import gzip
+
+import pytest
+
+from app.services.compression import precompress_static
+from conftest import populate
+
+
+def test_runtime_html_is_gzipped(client, db_session):
+    (book_id, _), = populate(db_session, cards=36)
+
+    response = client.get(f'/books/{book_id}/runtime', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    html = gzip.decompress(response.data).decode()
+    assert 'aac-grid-runtime' in html
+    assert int(response.headers['Content-Length']) == len(response.data)
+
+
+def test_brotli_preferred_when_available(client, db_session):
+    brotli = pytest.importorskip('brotli')
+    (book_id, _), = populate(db_session, cards=4)
+
+    response = client.get(f'/books/{book_id}/runtime', headers={'Accept-Encoding': 'gzip, br'})
+
+    assert response.headers['Content-Encoding'] == 'br'
+    assert b'aac-grid-runtime' in brotli.decompress(response.data)
+
+
+def test_small_or_unsupported_responses_are_not_compressed(client, db_session):
+    (book_id, page_ids), = populate(db_session)
+
+    small = client.get(f'/api/books/{book_id}/pages/{page_ids[0]}?fields[page]=id', headers={'Accept-Encoding': 'gzip'})
+    identity = client.get(f'/books/{book_id}/runtime', headers={'Accept-Encoding': 'identity'})
+
+    assert 'Content-Encoding' not in small.headers
+    assert 'Content-Encoding' not in identity.headers
+
+
+def test_precompressed_static_files_are_served(client, tmp_path, monkeypatch):
+    (tmp_path / 'css').mkdir()
+    css = ('body { color: red; }\n' * 100).encode()
+    (tmp_path / 'css' / 'site.css').write_bytes(css)
+    results = precompress_static(str(tmp_path))
+    assert results and 'gzip' in results[0][2]
+    monkeypatch.setattr(client.application, 'static_folder', str(tmp_path))
+
+    response = client.get('/static/css/site.css', headers={'Accept-Encoding': 'gzip'})
+    plain = client.get('/static/css/site.css', headers={'Accept-Encoding': 'identity'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert gzip.decompress(response.data) == css
+    assert plain.data == css and 'Content-Encoding' not in plain.headers
@@ -0,0 +1,144 @@
+"""
+Concorrenza ottimistica: versioni di carte e pagine, conflitti 409
+"""
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+
+from conftest import populate
+
+
+def edit_form(card, **fields):
+    form = {'text': card.label, 'x': card.slot_col, 'y': card.slot_row,
+            'action_type': 'none', 'image_asset_id': card.image_id or '', 'version': card.version}
+    form.update(fields)
+    return form
+
+
+def test_stale_card_form_is_rejected_with_current_state(client, db_session):
+    from app.models import Card
+
+    book_id, (page_id,) = populate(db_session, books=1, pages=1, cards=2)[0]
+    card = db_session.query(Card).filter_by(page_id=page_id).order_by(Card.id).first()
+    url = f'/books/{book_id}/pages/{page_id}/cards/{card.id}/edit'
+    stale = edit_form(card)
+
+    assert client.post(url, data=edit_form(card, text='Mela')).status_code == 302
+    db_session.expire_all()
+    assert card.label == 'Mela' and card.version == 2
+
+    # Secondo editor con il form aperto prima del salvataggio: niente sovrascrittura
+    response = client.post(url, data=dict(stale, text='Pera'))
+    assert response.status_code == 409
+    assert 'value="2"' in response.get_data(as_text=True)
+    db_session.expire_all()
+    assert card.label == 'Mela' and card.version == 2
+
+    # Con la versione attuale il salvataggio riesce
+    assert client.post(url, data=edit_form(card, text='Pera')).status_code == 302
+    db_session.expire_all()
+    assert card.label == 'Pera' and card.version == 3
+
+
+def test_move_card_conflicts_return_current_state(client, db_session):
+    from app.models import Card, Page
+
+    book_id, (page_id,) = populate(db_session, books=1, pages=1, cards=1)[0]
+    card = db_session.query(Card).filter_by(page_id=page_id).one()
+    url = f'/books/{book_id}/pages/{page_id}/cards/{card.id}/move'
+
+    response = client.post(url, json={'x': 2, 'y': 1, 'version': 1})
+    assert response.status_code == 200 and response.get_json()['version'] == 2
+    # Lo slot occupato incrementa il contatore degli slot, non la versione della pagina
+    page = db_session.get(Page, page_id)
+    assert page.slot_version == 2 and page.version == 1
+
+    response = client.post(url, json={'x': 3, 'y': 3, 'version': 1})
+    assert response.status_code == 409
+    body = response.get_json()
+    assert body['card'] == {'id': card.id, 'label': 'Carta 0', 'x': 2, 'y': 1, 'version': 2}
+    assert body['slot_version'] == 2
+
+    assert client.post(url, json={'x': 'a', 'y': 1}).status_code == 400
+    assert client.post(url, data='x').status_code == 400
+
+
+def test_concurrent_saves_compare_and_swap(db_engine, db_session):
+    from app.models import Card, Page
+    from app.services.concurrency import VersionConflict, claim_slots
+
+    book_id, (page_id,) = populate(db_session, books=1, pages=1, cards=1)[0]
+    Session = sessionmaker(bind=db_engine)
+    first, second = Session(), Session()
+    try:
+        # Stessa carta letta da due editor: il secondo salvataggio fallisce
+        card_a = first.query(Card).filter_by(page_id=page_id).one()
+        card_b = second.query(Card).filter_by(page_id=page_id).one()
+        card_a.label = 'Primo'
+        first.commit()
+        card_b.label = 'Secondo'
+        with pytest.raises(StaleDataError):
+            second.commit()
+        second.rollback()
+
+        # Stesso slot libero scelto da due editor: solo il primo lo occupa
+        page_a = first.get(Page, page_id)
+        page_b = second.get(Page, page_id)
+        claim_slots(first, page_a)
+        first.add(Card(page_id=page_id, slot_col=5, slot_row=5, label='A'))
+        first.commit()
+        with pytest.raises(VersionConflict):
+            claim_slots(second, page_b)
+        second.rollback()
+    finally:
+        first.close()
+        second.close()
+
+    assert db_session.query(Card).filter_by(page_id=page_id, slot_col=5, slot_row=5).count() == 1
+    assert db_session.query(Card).filter_by(label='Primo').count() == 1
+
+
+def test_stale_page_form_is_rejected(client, db_session):
+    from app.models import Page
+
+    book_id, (page_id, _) = populate(db_session, books=1, pages=2, cards=1)[0]
+    url = f'/books/{book_id}/pages/{page_id}/edit'
+    form = {'title': 'Nuovo', 'grid_cols': 6, 'grid_rows': 6, 'version': 1}
+
+    assert client.post(url, data=form).status_code == 302
+    response = client.post(url, data=dict(form, title='Altro'))
+    assert response.status_code == 409
+    page = db_session.get(Page, page_id)
+    assert page.title == 'Nuovo' and page.version == 2
+
+
+def test_page_form_survives_card_changes(client, db_engine, db_session):
+    from app.models import Card, Page
+    from app.services.concurrency import VersionConflict, claim_slots
+
+    book_id, (page_id,) = populate(db_session, books=1, pages=1, cards=1)[0]
+    card = db_session.query(Card).filter_by(page_id=page_id).one()
+    url = f'/books/{book_id}/pages/{page_id}/edit'
+    form = {'title': 'Nuovo', 'grid_cols': 6, 'grid_rows': 6, 'version': 1}
+
+    # Un collega aggiunge e sposta carte mentre il form della pagina è aperto
+    client.post(f'/books/{book_id}/pages/{page_id}/cards/{card.id}/move', json={'x': 2, 'y': 2, 'version': 1})
+    client.post(f'/books/{book_id}/pages/{page_id}/cards/new', data={'text': 'Nuova', 'x': 4, 'y': 4})
+    db_session.expire_all()
+    assert db_session.query(Card).filter_by(page_id=page_id).count() == 2
+    assert client.post(url, data=form).status_code == 302
+    db_session.expire_all()
+    assert db_session.get(Page, page_id).title == 'Nuovo'
+
+    # Griglia cambiata: uno slot scelto sulla griglia precedente non può essere occupato
+    page = db_session.get(Page, page_id)
+    stale = sessionmaker(bind=db_engine)()
+    try:
+        stale_page = stale.get(Page, page_id)
+        assert client.post(url, data=dict(form, grid_cols=3, version=page.version)).status_code == 302
+        with pytest.raises(VersionConflict):
+            claim_slots(stale, stale_page)
+        stale.rollback()
+    finally:
+        stale.close()
@@ -0,0 +1,247 @@
+"""
+Eventi SSE per il runtime (/books/<id>/events)
+"""
+
+import os
+import runpy
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from conftest import populate
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_broker_fan_out_and_lag():
+    from app.services.events import EventBroker
+
+    broker = EventBroker(history=2)
+    start = broker.last_id
+    broker.publish(1, {'pages': [1]})
+    broker.publish(2, {'pages': [2]})
+    broker.publish(1, {'pages': []})
+
+    last, items, lagged = broker.wait(1, start, timeout=0)
+    assert last == start + 3
+    assert [data for _, data in items] == [{'pages': []}]  # il primo evento è uscito dal buffer
+    assert lagged is True
+
+    assert broker.wait(1, last, timeout=0) == (last, [], False)
+
+
+def test_waiting_reader_is_woken_by_publish():
+    from app.services.events import EventBroker
+
+    broker = EventBroker()
+    timer = threading.Timer(0.05, broker.publish, args=(7, {'pages': [3]}))
+    timer.start()
+    _, items, _ = broker.wait(7, 0, timeout=5)
+    timer.join()
+    assert [data for _, data in items] == [{'pages': [3]}]
+
+
+def test_commit_publishes_changed_pages(db_session, event_bus):
+    from app.models import Card
+
+    (book_id, page_ids), = populate(db_session, pages=2, cards=1)
+    event_bus.poll()
+    broker = event_bus.broker
+    after = broker.last_id
+
+    card = db_session.query(Card).filter_by(page_id=page_ids[1]).first()
+    card.label = 'Nuova'
+    db_session.flush()
+    db_session.rollback()
+    assert event_bus.poll() == 0 and broker.last_id == after  # niente eventi per transazioni annullate
+
+    card.label = 'Nuova'
+    db_session.commit()
+    assert event_bus.poll() == 1
+    _, items, _ = broker.wait(book_id, after, timeout=0)
+    assert [data for _, data in items] == [{'book_id': book_id, 'pages': [page_ids[1]], 'book': False}]
+
+
+def test_global_asset_changes_reach_no_stream(db_session, event_bus):
+    from app.models import Asset, Card
+
+    (book_id, page_ids), (other_id, _) = populate(db_session, books=2, pages=2, cards=1)
+    event_bus.poll()
+    after = event_bus.broker.last_id
+
+    # Upload, import o indicizzazione: nessun libro coinvolto, nessun evento
+    db_session.add_all([Asset(kind='image/png', url=f'nuovo-{i}.png') for i in range(3)])
+    db_session.commit()
+    assert event_bus.poll() == 0
+
+    # Asset usato da una carta: solo il suo libro, a livello di pagina
+    db_session.query(Card).filter_by(page_id=page_ids[1]).one().image.alt = 'Cambiata'
+    db_session.commit()
+    assert event_bus.poll() == 1
+    _, items, _ = event_bus.broker.wait(book_id, after, timeout=0)
+    assert [data for _, data in items] == [{'book_id': book_id, 'pages': [page_ids[1]], 'book': False}]
+    assert event_bus.broker.wait(other_id, after, timeout=0)[1] == []
+
+
+def test_every_worker_sees_commits_with_the_same_ids(db_session, event_bus):
+    from app.models import Page
+    from app.services.events import ChangeLogBus, EventBroker
+
+    (book_id, page_ids), = populate(db_session, pages=1, cards=0)
+    other_worker = ChangeLogBus(EventBroker(), interval=None)
+    other_worker.start()
+    event_bus.poll()
+    after = event_bus.broker.last_id
+
+    db_session.get(Page, page_ids[0]).title = 'Altro worker'
+    db_session.commit()
+    event_bus.poll()
+    other_worker.poll()
+
+    first = event_bus.broker.wait(book_id, after, timeout=0)
+    second = other_worker.broker.wait(book_id, after, timeout=0)
+    assert first == second and len(first[1]) == 1
+    # Un client che si riconnette all'altro worker da un id non più noto deve ricaricare
+    assert other_worker.broker.wait(book_id, 0, timeout=0)[2] is True
+
+
+def test_event_stream_delivers_changes(client, db_session, event_bus):
+    (book_id, page_ids), = populate(db_session, pages=1, cards=0)
+    event_bus.poll()
+    broker = event_bus.broker
+    client.application.config.update(SSE_HEARTBEAT=0.05, SSE_MAX_DURATION=0.2)
+    last = broker.last_id
+    broker.publish(book_id, {'book_id': book_id, 'pages': [page_ids[0]], 'book': False})
+    broker.publish(book_id + 1, {'book_id': book_id + 1, 'pages': [], 'book': True})
+
+    response = client.get(f'/books/{book_id}/events', headers={'Last-Event-ID': str(last)})
+    body = response.get_data(as_text=True)
+    response.close()
+
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert body.startswith('retry: ')
+    assert f'id: {last + 1}\nevent: change\ndata: {{"book_id":{book_id},"pages":[{page_ids[0]}],"book":false}}' in body
+    assert f'"book_id":{book_id + 1}' not in body
+    assert ': ping' in body
+
+
+def test_event_stream_unknown_book(client):
+    assert client.get('/books/999/events').status_code == 404
+
+
+def test_streams_per_worker_are_limited(client, db_session, event_bus, monkeypatch):
+    from app.services import events
+
+    (book_id, _), = populate(db_session, pages=1, cards=0)
+    client.application.config.update(SSE_HEARTBEAT=0.05, SSE_MAX_DURATION=0.1, SSE_MAX_STREAMS=1)
+
+    response = client.get(f'/books/{book_id}/events')
+    assert response.get_data(as_text=True).startswith(f'retry: {events.RETRY_MILLISECONDS}\n')
+    response.close()  # il server WSGI chiude la risposta a fine stream
+    assert events._streams == 0
+
+    # Thread del worker occupati da altri stream: chiusa subito con un retry lungo
+    monkeypatch.setattr(events, '_streams', 1)
+    response = client.get(f'/books/{book_id}/events')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == f'retry: {events.BUSY_RETRY_MILLISECONDS}\n\n'
+
+
+_CREATE_BOOK = """
+from app import create_app
+from app.db import get_db
+from app.models import Book
+create_app()
+db = get_db()
+db.add(Book(title='Libro', locale='it-IT'))
+db.commit()
+print(db.query(Book.id).scalar())
+"""
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _open_stream(port, book_id):
+    """Connessione SSE aperta; ritorna il socket dopo le intestazioni e il retry iniziale"""
+    sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+    sock.sendall(f"GET /books/{book_id}/events HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    received = b''
+    while b'retry:' not in received:
+        chunk = sock.recv(4096)
+        assert chunk, received
+        received += chunk
+    return sock
+
+
+def _read_until(sock, marker):
+    received = b''
+    while marker not in received:
+        chunk = sock.recv(4096)
+        assert chunk, received
+        received += chunk
+    return received
+
+
+@pytest.mark.parametrize('worker_class, preload', [('gevent', False), ('gthread', True)])
+def test_gevent_worker_is_not_preloaded(monkeypatch, worker_class, preload):
+    monkeypatch.setenv('GUNICORN_WORKER_CLASS', worker_class)
+    monkeypatch.setenv('SSE_MAX_STREAMS', '0')  # non modificato nell'ambiente dei test
+    settings = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+    # Con gevent l'app è importata nel worker dopo il monkey patching
+    assert settings['preload_app'] is preload
+
+
+@pytest.mark.skipif(shutil.which('gunicorn') is None, reason='gunicorn non installato')
+def test_gevent_worker_serves_concurrent_streams(tmp_path):
+    pytest.importorskip('gevent')
+    port = _free_port()
+    env = dict(
+        os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'sse.db'}", APP_ENV='production',
+        GUNICORN_BIND=f'127.0.0.1:{port}', GUNICORN_WORKERS='1', GUNICORN_WORKER_CLASS='gevent',
+        GUNICORN_GRACEFUL_TIMEOUT='1',
+    )
+    book_id = subprocess.run([sys.executable, '-c', _CREATE_BOOK], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True).stdout.split()[-1]
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    streams = []
+    try:
+        deadline = time.monotonic() + 15
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                assert time.monotonic() < deadline, 'gunicorn non avviato'
+                time.sleep(0.2)
+
+        # Due stream aperti insieme nello stesso worker: nessuno blocca l'altro né le altre richieste
+        streams = [_open_stream(port, book_id), _open_stream(port, book_id)]
+        started = time.monotonic()
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/books/', timeout=5) as response:
+            assert response.status == 200
+        urllib.request.urlopen(urllib.request.Request(
+            f'http://127.0.0.1:{port}/books/{book_id}/publish', method='POST'), timeout=5).close()
+        for stream in streams:
+            assert b'event: change' in _read_until(stream, b'event: change')
+        assert time.monotonic() - started < 5
+    finally:
+        for stream in streams:
+            stream.close()
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
@@ -0,0 +1,106 @@
+"""
+Decodifica a memoria limitata delle immagini caricate
+"""
+
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+from PIL import Image
+
+from app.config import config
+from app.services.images import ImageTooLarge, process_image
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_MAKE_JPEG = """
+import sys
+from PIL import Image, ImageDraw
+img = Image.new('RGB', (8000, 8000), 'white')
+ImageDraw.Draw(img).ellipse((1000, 1000, 7000, 7000), fill='navy')
+img.save(sys.argv[1], 'JPEG', quality=85)
+"""
+
+# PNG a palette con trasparenza al limite di pixel (16 MB decodificati a 1 byte per pixel)
+_MAKE_PALETTE_PNG = """
+import sys
+from PIL import Image, ImageDraw
+img = Image.new('P', (4000, 4000), 0)
+img.putpalette([0, 0, 0, 0, 0, 128, 200, 30, 30] + [0] * 759)
+ImageDraw.Draw(img).ellipse((500, 500, 3500, 3500), fill=1)
+ImageDraw.Draw(img).line((0, 0, 4000, 4000), fill=2, width=9)
+img.save(sys.argv[1], 'PNG', transparency=0)
+"""
+
+# Picco di RSS (KB su Linux, byte su macOS) durante process_image, in un processo pulito
+_MEASURE = """
+import resource, sys
+from app.services.images import process_image
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+sizes = process_image(sys.argv[1])
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+scale = 1 if sys.platform == 'darwin' else 1024
+print((after - before) * scale, sizes['original'][0], sizes['large'][0])
+"""
+
+
+def _run(script, *args):
+    return subprocess.run([sys.executable, '-c', script, *map(str, args)], cwd=ROOT,
+                          capture_output=True, text=True, check=True).stdout
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='resource non disponibile')
+@pytest.mark.parametrize('name, make, width', [
+    # A piena risoluzione la sola decodifica occuperebbe 8000×8000×3 = 183 MB
+    ('foto.jpg', _MAKE_JPEG, 8000),
+    # Convertita in RGBA a piena risoluzione: 4000×4000×4 = 61 MB, più la copia premoltiplicata
+    ('simbolo.png', _MAKE_PALETTE_PNG, 4000),
+], ids=['jpeg', 'png-palette'])
+def test_large_image_peak_memory_stays_under_ceiling(tmp_path, name, make, width):
+    path = tmp_path / name
+    _run(make, path)
+
+    peak, original_width, large_width = map(int, _run(_MEASURE, path).split())
+    assert original_width == width and large_width == 800
+    assert peak < config.IMAGE_MEMORY_CEILING_MB * 1024 * 1024, peak
+    assert (tmp_path / (os.path.splitext(name)[0] + '_thumbnail.jpg')).exists()
+
+
+def test_palette_image_keeps_transparency_and_colors(tmp_path):
+    path = tmp_path / 'simbolo.png'
+    _run(_MAKE_PALETTE_PNG, path)
+
+    sizes = process_image(str(path))
+
+    assert sizes['large'] == (800, 800)
+    with Image.open(tmp_path / 'simbolo_large.jpg') as large:
+        assert large.getpixel((10, 790))[:3] == (255, 255, 255)  # trasparente su bianco
+        red, green, blue = large.getpixel((400, 560))
+        assert blue > 100 and red < 40  # cerchio blu
+
+
+def test_pixel_limit_rejects_before_decoding(tmp_path):
+    path = tmp_path / 'grande.png'
+    Image.new('RGBA', (400, 300), 'red').save(path)
+
+    with pytest.raises(ImageTooLarge):
+        process_image(str(path), max_pixels=100 * 100)
+    assert not (tmp_path / 'grande_thumbnail.jpg').exists()
+
+    sizes = process_image(str(path), max_pixels=400 * 300)
+    assert sizes['original'] == (400, 300) and sizes['large'] == (400, 300) and sizes['thumbnail'] == (150, 113)
+
+
+def test_upload_over_pixel_limit_is_rejected(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'MAX_IMAGE_PIXELS', 50 * 50)
+    client.application.static_folder = str(tmp_path)
+    buffer = io.BytesIO()
+    Image.new('RGB', (100, 100), 'green').save(buffer, 'PNG')
+    buffer.seek(0)
+
+    response = client.post('/assets/api/upload', data={'file': (buffer, 'verde.png')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert os.listdir(tmp_path / 'media') == []
@@ -0,0 +1,152 @@
+"""
+Ricerca full-text di etichette e titoli (indice FTS5 mantenuto dai trigger)
+"""
+
+import sqlite3
+import time
+
+from sqlalchemy import create_engine, text
+
+from conftest import QueryCounter, populate
+
+
+def test_book_search_returns_cards_with_page_path(client, db_engine, db_session):
+    from app.models import Card, Page
+
+    (book_id, page_ids), (other_id, _) = populate(db_session, books=2, pages=3, cards=2)
+    last = db_session.get(Page, page_ids[2])
+    last.title = 'Frutta'
+    db_session.add(Card(page_id=last.id, slot_row=3, slot_col=0, label='Mela rossa'))
+    db_session.add(Card(page_id=last.id, slot_row=3, slot_col=1, label='Perché'))
+    db_session.commit()
+
+    with QueryCounter(db_engine) as counter:
+        data = client.get(f'/api/books/{book_id}/search?q=me').get_json()
+    assert counter.count <= 6, counter.statements
+
+    assert [card['label'] for card in data['cards']] == ['Mela rossa']
+    card = data['cards'][0]
+    assert card['page_id'] == last.id and card['page_title'] == 'Frutta'
+    assert [step['id'] for step in card['path']] == page_ids
+    assert card['path'][-1]['title'] == 'Frutta'
+
+    # Prefissi di più parole, accenti ignorati, libro filtrato nella MATCH
+    assert [c['label'] for c in client.get(f'/api/books/{book_id}/search?q=ros me').get_json()['cards']] == ['Mela rossa']
+    assert [c['label'] for c in client.get(f'/api/books/{book_id}/search?q=perche').get_json()['cards']] == ['Perché']
+    assert client.get(f'/api/books/{other_id}/search?q=mela').get_json()['cards'] == []
+    assert [p['title'] for p in client.get(f'/api/books/{book_id}/search?q=fru').get_json()['pages']] == ['Frutta']
+    # La sintassi FTS5 nella query non è interpretata
+    assert client.get(f'/api/books/{book_id}/search?q=label:"*').get_json()['cards'] == []
+
+
+def test_index_follows_edits_duplicates_and_cascades(client, db_session):
+    from app.models import Book, Card
+
+    (book_id, page_ids), = populate(db_session, pages=2, cards=1)
+    card = db_session.query(Card).filter_by(page_id=page_ids[0]).one()
+    card.label = 'Gelato'
+    db_session.get(Book, book_id).title = 'Merenda'
+    db_session.commit()
+
+    def found(query):
+        data = client.get(f'/api/search?q={query}').get_json()
+        return sorted(c['label'] for c in data['cards']), sorted(b['title'] for b in data['books'])
+
+    assert found('gel') == (['Gelato'], [])
+    assert found('carta') == (['Carta 0'], [])
+    assert found('meren') == ([], ['Merenda'])
+
+    client.post(f'/books/{book_id}/duplicate', data={'title': 'Merenda copia'})
+    assert found('gel') == (['Gelato', 'Gelato'], [])
+    assert found('meren') == ([], ['Merenda', 'Merenda copia'])
+
+    client.post(f'/books/{book_id}/delete')
+    assert found('gel') == (['Gelato'], [])
+    assert found('meren') == ([], ['Merenda copia'])
+
+
+def test_search_scales_to_many_cards(db_session):
+    from app.services import label_search
+
+    (book_id, _), *_ = populate(db_session, books=20, pages=25, cards=20)
+
+    started = time.perf_counter()
+    results = label_search.search(db_session, 'carta 1', book_id=book_id, limit=10)
+    elapsed = time.perf_counter() - started
+
+    assert len(results['cards']) == 10
+    assert {card.book_id for card in results['cards']} == {book_id}
+    assert elapsed < 0.1
+
+
+def test_migration_indexes_existing_rows(tmp_path):
+    from app.db import init_db
+
+    path = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE book (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, locale VARCHAR,
+                           home_page_id INTEGER REFERENCES page(id));
+        CREATE TABLE page (id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL REFERENCES book(id),
+                           title VARCHAR NOT NULL, grid_cols INTEGER, grid_rows INTEGER, "order" INTEGER);
+        CREATE TABLE asset (id INTEGER PRIMARY KEY, kind VARCHAR NOT NULL, url VARCHAR NOT NULL, alt VARCHAR);
+        CREATE TABLE card (id INTEGER PRIMARY KEY, page_id INTEGER NOT NULL REFERENCES page(id),
+                           slot_row INTEGER NOT NULL, slot_col INTEGER NOT NULL, row_span INTEGER, col_span INTEGER,
+                           label VARCHAR NOT NULL, background_color VARCHAR, border_color VARCHAR, action_type VARCHAR,
+                           image_id INTEGER REFERENCES asset(id), target_page_id INTEGER REFERENCES page(id));
+        INSERT INTO book VALUES (1, 'Libro', 'it-IT', 1);
+        INSERT INTO page VALUES (1, 1, 'Home', 3, 3, 0);
+        INSERT INTO card VALUES (1, 1, 0, 0, 1, 1, 'Acqua', '#FFFFFF', '#000000', 'none', NULL, NULL);
+    """)
+    conn.close()
+    engine = create_engine(f"sqlite:///{path}")
+
+    init_db(engine)
+
+    with engine.begin() as db:
+        assert db.execute(text("SELECT rowid, book FROM card_search WHERE card_search MATCH 'acq*'")).all() == [(1, 1)]
+        assert db.execute(text("SELECT rowid FROM page_search WHERE page_search MATCH 'home'")).scalars().all() == [1]
+    engine.dispose()
+
+
+def test_published_book_search_uses_snapshots(client, db_engine, db_session):
+    from app.models import Card
+    from app.services import preview
+
+    (book_id, page_ids), (other_id, _) = populate(db_session, books=2, pages=2, cards=1)
+    card = db_session.query(Card).filter_by(page_id=page_ids[1]).one()
+    card.label = 'Gelato'
+    db_session.commit()
+    client.post(f'/books/{book_id}/publish')
+    card.label = 'Ghiacciolo'
+    db_session.commit()
+
+    data = client.get(f'/api/books/{book_id}/search?q=gel').get_json()
+    assert [c['label'] for c in data['cards']] == ['Gelato']
+    assert [step['id'] for step in data['cards'][0]['path']] == page_ids
+    assert client.get(f'/api/books/{book_id}/search?q=ghiac').get_json()['cards'] == []
+    assert [c['label'] for c in client.get('/api/search?q=GÉL').get_json()['cards']] == ['Gelato']
+    assert client.get('/api/search?q=ghiac').get_json()['cards'] == []
+    # Ricerca globale: snapshot del libro pubblicato e bozze (FTS) dell'altro
+    assert {c['book_id'] for c in client.get('/api/search?q=carta').get_json()['cards']} == {book_id, other_id}
+
+    with client.application.test_request_context():
+        token = preview.draft_token(book_id)
+    data = client.get(f'/api/books/{book_id}/search?q=ghiac&draft={token}').get_json()
+    assert [c['label'] for c in data['cards']] == ['Ghiacciolo']
+
+    # Nuova pubblicazione: l'indice degli snapshot è riscritto nella stessa transazione
+    client.post(f'/books/{book_id}/publish')
+    assert [c['label'] for c in client.get(f'/api/books/{book_id}/search?q=ghiac').get_json()['cards']] == ['Ghiacciolo']
+    assert client.get(f'/api/books/{book_id}/search?q=gel').get_json()['cards'] == []
+
+    # Bozze e snapshot in una sola MATCH per tipo; nessuna query per libro pubblicato
+    with QueryCounter(db_engine) as counter:
+        client.get('/api/search?q=carta')
+    assert counter.count <= 5, counter.statements
+
+    # Libro eliminato: righe degli snapshot rimosse dal trigger
+    client.post(f'/books/{book_id}/delete')
+    with db_engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM snapshot_card_search")).scalar() == 0
+        assert conn.execute(text("SELECT COUNT(*) FROM snapshot_page_search")).scalar() == 0
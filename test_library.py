@@ -0,0 +1,82 @@
+"""
+Librerie di simboli indicizzate sul posto
+"""
+
+import json
+import os
+
+from PIL import Image
+
+from app.services import library
+
+
+def _symbol(root, path, color='red', keywords=None, label=None):
+    target = root / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    Image.new('RGBA', (300, 300), color).save(target)
+    if keywords is not None:
+        metadata = {'keywords': [{'keyword': word} for word in keywords]}
+        if label:
+            metadata['label'] = label
+        target.with_suffix('.json').write_text(json.dumps(metadata), encoding='utf-8')
+
+
+def test_index_registers_in_place_and_rescans_only_changes(tmp_path, db_session, db_engine):
+    from app.models import Asset, LibraryFile
+    from conftest import QueryCounter
+
+    root = tmp_path / 'arasaac'
+    _symbol(root, 'casa/casa.png', keywords=['casa', 'abitazione'])
+    _symbol(root, 'cibo/mela.png', keywords=['mela', 'frutta'], label='Mela rossa')
+    _symbol(root, 'cibo/pane.png')
+    (root / 'LEGGIMI.txt').write_text('licenza')
+
+    report = library.index_library(db_session, 'arasaac', root, batch_size=2)
+    assert report['added'] == 3 and report['files'] == 3
+
+    assets = {asset.url: asset for asset in db_session.query(Asset)}
+    assert set(assets) == {'library/arasaac/casa/casa.png', 'library/arasaac/cibo/mela.png', 'library/arasaac/cibo/pane.png'}
+    assert assets['library/arasaac/casa/casa.png'].alt == 'casa'
+    assert assets['library/arasaac/casa/casa.png'].keywords == 'casa abitazione'
+    assert assets['library/arasaac/cibo/mela.png'].alt == 'Mela rossa'
+    assert assets['library/arasaac/cibo/pane.png'].alt == 'pane'
+    assert assets['library/arasaac/casa/casa.png'].normalized_url == '/assets/library/arasaac/casa/casa.png'
+    # Nessuna copia e nessun derivato nella libreria
+    assert sorted(os.listdir(root / 'cibo')) == ['mela.json', 'mela.png', 'pane.png']
+
+    with QueryCounter(db_engine) as counter:
+        report = library.index_library(db_session, 'arasaac', root)
+    assert report['unchanged'] == 3 and report['added'] == report['updated'] == 0
+    assert counter.count == 1, counter.statements
+
+    metadata = root / 'casa' / 'casa.json'
+    metadata.write_text(json.dumps({'keywords': ['dimora']}), encoding='utf-8')
+    os.utime(metadata, ns=(1, 1))
+    os.remove(root / 'cibo' / 'pane.png')
+    report = library.index_library(db_session, 'arasaac', root)
+    assert report['updated'] == 1 and report['removed'] == 1 and report['unchanged'] == 1
+
+    db_session.expire_all()
+    assert db_session.query(Asset).filter_by(url='library/arasaac/casa/casa.png').one().keywords == 'dimora'
+    assert db_session.query(Asset).filter_by(url='library/arasaac/cibo/pane.png').count() == 0
+    assert db_session.query(LibraryFile).count() == 2
+
+
+def test_library_files_are_served_with_lazy_derivatives(client, db_session, tmp_path):
+    root = tmp_path / 'sclera'
+    cache = tmp_path / 'cache'
+    _symbol(root, 'acqua.png', keywords=['acqua', 'bere'])
+    library.index_library(db_session, 'sclera', root)
+    client.application.config.update(PICTOGRAM_LIBRARIES={'sclera': str(root)}, LIBRARY_CACHE_DIR=cache)
+
+    response = client.get('/assets/library/sclera/acqua.png')
+    assert response.status_code == 200 and response.mimetype == 'image/png'
+    assert not cache.exists()
+
+    response = client.get('/assets/library/sclera/acqua.png?size=thumbnail')
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    with Image.open(cache / 'sclera' / 'acqua_thumbnail.jpg') as thumbnail:
+        assert max(thumbnail.size) == 150
+
+    assert client.get('/assets/library/sclera/../sclera/acqua.png').status_code == 404
+    assert client.get('/assets/library/altro/acqua.png').status_code == 404
@@ -0,0 +1,60 @@
+"""
+Hint di prefetch dal grafo di navigazione delle carte
+"""
+
+from app.services import link_graph
+from conftest import QueryCounter, populate
+
+
+def test_runtime_page_emits_prefetch_hints_for_targets(client, db_session):
+    (book_id, page_ids), = populate(db_session, pages=3, cards=2)
+
+    html = client.get(f'/books/{book_id}/runtime/{page_ids[0]}').get_data(as_text=True)
+
+    assert f'<link rel="prefetch" href="/books/{book_id}/runtime/{page_ids[1]}">' in html
+    assert '<link rel="prefetch" href="/static/media/b0-p1-c0.png" as="image">' in html
+    assert f'/books/{book_id}/runtime/{page_ids[2]}">' not in html
+
+
+def test_link_graph_is_cached_until_a_card_changes(db_engine, db_session):
+    from app.models import Card
+
+    (book_id, page_ids), = populate(db_session, pages=2, cards=1)
+    link_graph.invalidate()
+
+    link_graph.get_link_graph(db_session, book_id)
+    with QueryCounter(db_engine) as counter:
+        graph = link_graph.get_link_graph(db_session, book_id)
+    assert counter.count == 0
+    assert graph.prefetch_for(page_ids[0])[0] == [page_ids[1]]
+
+    card = db_session.query(Card).filter_by(page_id=page_ids[0]).first()
+    card.target_page_id = None
+    db_session.commit()
+
+    assert link_graph.get_link_graph(db_session, book_id).prefetch_for(page_ids[0]) == ([], [])
+
+
+def test_link_graph_is_invalidated_on_commit_not_on_flush(db_engine, db_session):
+    from app.models import Card
+
+    (book_id, page_ids), = populate(db_session, pages=2, cards=1)
+    link_graph.invalidate()
+    link_graph.get_link_graph(db_session, book_id)
+
+    card = db_session.query(Card).filter_by(page_id=page_ids[0]).first()
+    card.target_page_id = None
+    db_session.flush()
+    db_session.rollback()
+    # Rollback: il grafo in cache resta valido e nessuna query per ricostruirlo
+    with QueryCounter(db_engine) as counter:
+        graph = link_graph.get_link_graph(db_session, book_id)
+    assert counter.count == 0
+    assert graph.prefetch_for(page_ids[0])[0] == [page_ids[1]]
+
+    card = db_session.query(Card).filter_by(page_id=page_ids[0]).first()
+    card.target_page_id = None
+    db_session.flush()
+    assert link_graph._cache.get(book_id) is graph  # non ancora committato
+    db_session.commit()
+    assert book_id not in link_graph._cache
@@ -0,0 +1,142 @@
+"""
+URL media con fingerprint, Cache-Control immutable e offload al proxy
+"""
+
+import builtins
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from app.services import media
+
+MEDIA_FILE = 'test-media-fingerprint.png'
+
+
+@pytest.fixture
+def media_file(client):
+    path = os.path.join(client.application.static_folder, 'media', MEDIA_FILE)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG fake image bytes')
+    yield path
+    os.remove(path)
+
+
+def _fingerprinted_url(client):
+    with client.application.test_request_context():
+        return media.media_url(MEDIA_FILE)
+
+
+def test_media_url_carries_content_fingerprint(client, media_file):
+    url = _fingerprinted_url(client)
+    assert url.startswith('/assets/media/') and url.endswith('/' + MEDIA_FILE)
+
+    with open(media_file, 'ab') as f:
+        f.write(b'changed')
+    assert _fingerprinted_url(client) != url
+
+
+def test_fingerprinted_url_is_immutable(client, media_file):
+    response = client.get(_fingerprinted_url(client))
+
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert response.data == b'\x89PNG fake image bytes'
+
+
+def test_stale_fingerprint_redirects_to_current(client, media_file):
+    response = client.get(f'/assets/media/0000000000000000/{MEDIA_FILE}')
+
+    assert response.status_code == 302
+    assert response.headers['Location'] == _fingerprinted_url(client)
+
+
+@pytest.mark.parametrize('mode, header', [
+    ('x-accel-redirect', 'X-Accel-Redirect'),
+    ('x-sendfile', 'X-Sendfile'),
+])
+def test_offload_never_reads_file_bytes(client, media_file, monkeypatch, mode, header):
+    client.application.config['MEDIA_OFFLOAD'] = mode
+    url = _fingerprinted_url(client)  # il fingerprint viene calcolato (e messo in cache) qui
+
+    real_open = builtins.open
+
+    def guarded_open(file, *args, **kwargs):
+        assert os.path.basename(str(file)) != MEDIA_FILE, 'il worker ha letto il file media'
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, 'open', guarded_open)
+    monkeypatch.setattr(os, 'open', lambda *a, **k: pytest.fail('os.open chiamato dal worker'))
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers[header].endswith(MEDIA_FILE)
+    assert 'immutable' in response.headers['Cache-Control']
+    if mode == 'x-accel-redirect':
+        assert response.headers[header] == f'/_protected_media/{MEDIA_FILE}'
+
+
+def test_offload_with_cold_cache_uses_stored_hash(client, db_session, media_file, monkeypatch):
+    from app.models import Asset
+    from app.services.images import content_hash
+
+    client.application.config['MEDIA_OFFLOAD'] = 'x-accel-redirect'
+    stored = content_hash(media_file)
+    db_session.add(Asset(kind='image/png', url=f'media/{MEDIA_FILE}', content_hash=stored))
+    db_session.commit()
+    # Worker appena avviato: nessun fingerprint in cache
+    monkeypatch.setattr(media, '_fingerprints', {})
+
+    real_open = builtins.open
+
+    def guarded_open(file, *args, **kwargs):
+        assert os.path.basename(str(file)) != MEDIA_FILE, 'il worker ha letto il file media'
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, 'open', guarded_open)
+    fingerprint = media._stamped_fingerprint(stored, media_file)
+    response = client.get(f'/assets/media/{fingerprint}/{MEDIA_FILE}')
+
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == f'/_protected_media/{MEDIA_FILE}'
+    assert media._fingerprints == {}
+
+    # Fingerprint superato: redirect all'URL del hash salvato, sempre senza leggere il file
+    response = client.get(f'/assets/media/0000000000000000/{MEDIA_FILE}')
+    assert response.status_code == 302
+    assert response.headers['Location'] == f'/assets/media/{fingerprint}/{MEDIA_FILE}'
+
+
+def test_file_replaced_in_place_gets_a_new_url(client, db_session, media_file):
+    from app.models import Asset
+    from app.services.images import content_hash
+
+    asset = Asset(kind='image/png', url=MEDIA_FILE, content_hash=content_hash(media_file))
+    db_session.add(asset)
+    db_session.commit()
+    with client.application.test_request_context():
+        url = media.media_url(asset)
+
+    # Stessa dimensione, contenuto diverso, hash salvato non aggiornato
+    with open(media_file, 'wb') as f:
+        f.write(b'\x89PNG FAKE image bytes')
+    stat = os.stat(media_file)
+    os.utime(media_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    with client.application.test_request_context():
+        new_url = media.media_url(asset)
+
+    assert new_url != url
+    response = client.get(url)
+    assert response.status_code == 302 and response.headers['Location'] == new_url
+    assert client.get(new_url).data == b'\x89PNG FAKE image bytes'
+
+
+@pytest.mark.skipif(shutil.which('nginx') is None, reason='nginx non installato')
+def test_nginx_config_is_valid(tmp_path):
+    conf = tmp_path / 'nginx.conf'
+    site = open(os.path.join(os.path.dirname(__file__), 'deploy', 'nginx.conf')).read()
+    conf.write_text(f"pid {tmp_path}/nginx.pid; events {{}} http {{ {site} }}")
+    result = subprocess.run(['nginx', '-t', '-c', str(conf)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
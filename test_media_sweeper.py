@@ -0,0 +1,167 @@
+"""
+Sweeper dei file media orfani
+"""
+
+import os
+import time
+import tracemalloc
+
+from app.services.media_sweeper import MediaSweeper, ACTION_QUARANTINE, ACTION_DELETE
+
+
+OLD = time.time() - 2 * 24 * 3600
+
+
+def _touch(path, size=10, mtime=OLD):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def _media_tree(tmp_path, db_session):
+    from app.models import Asset
+
+    media = tmp_path / 'media'
+    _touch(media / 'used.png', 100)
+    _touch(media / 'used_thumbnail.jpg', 10)
+    _touch(media / 'legacy.png', 50)             # asset salvato come 'media/legacy.png'
+    _touch(media / 'failed.png', 200)            # upload fallito: nessuna riga
+    _touch(media / 'failed_thumbnail.jpg', 20)
+    _touch(media / 'gone_medium.jpg', 30)        # derivato di un asset eliminato
+    _touch(media / '_atlas' / 'page-1-abc.webp', 999)
+    db_session.add_all([
+        Asset(kind='image/png', url='used.png'),
+        Asset(kind='image/png', url='media/legacy.png'),
+    ])
+    db_session.commit()
+    return media
+
+
+def test_report_finds_orphans_and_reclaimable_bytes(tmp_path, db_session):
+    media = _media_tree(tmp_path, db_session)
+
+    with MediaSweeper(media, tmp_path / 'state.db') as sweeper:
+        report = sweeper.run()
+        orphans = sorted(name for name, _ in sweeper.iter_orphans())
+
+    assert orphans == ['failed.png', 'failed_thumbnail.jpg', 'gone_medium.jpg']
+    assert report['files'] == 6
+    assert report['bytes'] == 410
+    assert report['reclaimable_bytes'] == 250
+    assert report['orphan_derivatives'] == 2
+
+
+def test_sweep_resumes_after_interruption(tmp_path, db_session):
+    media = _media_tree(tmp_path, db_session)
+    state = tmp_path / 'state.db'
+
+    with MediaSweeper(media, state, batch_size=2) as sweeper:
+        sweeper.scan()
+    assert not os.path.exists(media / 'nothing')
+
+    with MediaSweeper(media, state) as sweeper:
+        assert sweeper.phase == 'check_originals'
+        assert sweeper.run()['orphans'] == 3
+
+
+def test_quarantine_and_delete(tmp_path, db_session):
+    from app.models import Asset
+
+    media = _media_tree(tmp_path, db_session)
+    quarantine = tmp_path / 'quarantine'
+
+    with MediaSweeper(media, tmp_path / 'state.db') as sweeper:
+        sweeper.run()
+        # Riga creata dopo la scansione: il file non deve essere toccato
+        db_session.add(Asset(kind='image/png', url='failed.png'))
+        db_session.commit()
+        assert sweeper.apply(ACTION_QUARANTINE, quarantine_dir=str(quarantine)) == 1
+
+    assert os.listdir(quarantine) == ['gone_medium.jpg']
+    assert (media / 'failed.png').exists() and (media / 'failed_thumbnail.jpg').exists()
+
+    with MediaSweeper(media, tmp_path / 'state2.db') as sweeper:
+        sweeper.run()
+        assert sweeper.apply(ACTION_DELETE) == 0
+
+
+def test_recent_files_without_row_are_left_alone(tmp_path, db_session):
+    from app.models import Asset
+
+    media = _media_tree(tmp_path, db_session)
+    # Upload in corso: file scritto, riga non ancora salvata
+    _touch(media / 'uploading.png', 70, mtime=None)
+    _touch(media / 'uploading_thumbnail.jpg', 7, mtime=None)
+    quarantine = tmp_path / 'quarantine'
+
+    with MediaSweeper(media, tmp_path / 'state.db') as sweeper:
+        report = sweeper.run()
+        assert report['recent'] == 2 and report['orphans'] == 3
+        assert 'uploading.png' not in {name for name, _ in sweeper.iter_orphans()}
+        assert sweeper.apply(ACTION_QUARANTINE, quarantine_dir=str(quarantine)) == 3
+
+    assert (media / 'uploading.png').exists() and (media / 'uploading_thumbnail.jpg').exists()
+
+    # Riscritto dopo la scansione: saltato anche se la scansione lo vedeva vecchio
+    _touch(media / 'failed.png', 200)
+    with MediaSweeper(media, tmp_path / 'state2.db') as sweeper:
+        sweeper.run()
+        os.utime(media / 'failed.png')
+        sweeper.apply(ACTION_DELETE)
+    assert (media / 'failed.png').exists()
+
+    # Riga salvata: l'upload è completato e resta al suo posto
+    db_session.add(Asset(kind='image/png', url='uploading.png'))
+    db_session.commit()
+    with MediaSweeper(media, tmp_path / 'state3.db', min_age=0) as sweeper:
+        assert sweeper.run()['recent'] == 0
+        assert [name for name, _ in sweeper.iter_orphans()] == ['failed.png']
+
+
+def test_finished_scan_is_redone_when_too_old(tmp_path, db_session):
+    from app.models import Asset
+
+    media = _media_tree(tmp_path, db_session)
+    state = tmp_path / 'state.db'
+
+    with MediaSweeper(media, state) as sweeper:
+        assert sweeper.run()['orphans'] == 3
+        # Nuovo orfano dopo la scansione: una scansione recente viene riusata
+        _touch(media / 'later.png', 40)
+        assert sweeper.run()['orphans'] == 3
+
+    # Cron successivo: la scansione completata è scaduta e viene rifatta
+    with MediaSweeper(media, state, max_scan_age=0) as sweeper:
+        assert sweeper.run()['orphans'] == 4
+        assert 'later.png' in {name for name, _ in sweeper.iter_orphans()}
+
+        # Originale caricato dopo la scansione con lo stesso stem di un derivato orfano
+        _touch(media / 'gone.png', 60)
+        db_session.add(Asset(kind='image/png', url='gone.png'))
+        db_session.commit()
+        sweeper.apply(ACTION_DELETE)
+
+    assert (media / 'gone_medium.jpg').exists()
+    assert not (media / 'later.png').exists()
+
+
+def test_memory_does_not_grow_with_tree_size(tmp_path, db_session):
+    def peak_for(count):
+        media = tmp_path / f'media-{count}'
+        media.mkdir()
+        for i in range(count):
+            (media / f'orphan-{i:06d}.png').write_bytes(b'x')
+        tracemalloc.start()
+        with MediaSweeper(media, tmp_path / f'state-{count}.db', batch_size=200, min_age=0) as sweeper:
+            sweeper.run()
+            sum(1 for _ in sweeper.iter_orphans())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    small = peak_for(1000)
+    large = peak_for(8000)
+
+    assert large < small * 2
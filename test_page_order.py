@@ -0,0 +1,109 @@
+"""
+Ordinamento pagine con chiavi a intervalli e riordino in blocco
+"""
+
+from conftest import QueryCounter, populate
+
+
+def _order(db_session, book_id):
+    from app.services.page_order import ordered_pages
+    return [page_id for page_id, _ in ordered_pages(db_session, book_id)]
+
+
+def test_plan_reorder_moving_one_page_changes_one_key():
+    from app.services.page_order import plan_reorder, ORDER_GAP
+
+    current = {page_id: page_id * ORDER_GAP for page_id in range(1, 11)}
+    ids = list(range(1, 11))
+    ids.insert(2, ids.pop(8))  # la pagina 9 va in terza posizione
+
+    changes = plan_reorder(current, ids)
+
+    assert list(changes) == [9]
+    assert current[2] < changes[9] < current[3]
+    assert plan_reorder(current, list(range(1, 11))) == {}
+
+
+def test_plan_reorder_renumbers_when_gap_is_exhausted():
+    from app.services.page_order import plan_reorder, ORDER_GAP
+
+    current = {1: 1, 2: 2, 3: 3}
+    changes = plan_reorder(current, [1, 3, 2])
+
+    keys = {**current, **changes}
+    assert sorted(keys, key=keys.get) == [1, 3, 2]
+    assert keys[3] == 2 * ORDER_GAP
+
+
+def test_reorder_endpoint_applies_full_order(client, db_engine, db_session):
+    (book_id, page_ids), = populate(db_session, pages=50, cards=0)
+    desired = list(page_ids)
+    desired.insert(0, desired.pop())
+
+    with QueryCounter(db_engine) as counter:
+        response = client.post(f'/books/{book_id}/pages/reorder', json={'page_ids': desired})
+
+    assert response.status_code == 200
+    assert response.get_json() == {'success': True, 'updated': 1}
+    assert counter.count <= 4, counter.statements
+    assert _order(db_session, book_id) == desired
+
+
+def test_reorder_endpoint_rejects_incomplete_list(client, db_session):
+    (book_id, page_ids), = populate(db_session, pages=3, cards=0)
+
+    response = client.post(f'/books/{book_id}/pages/reorder', json={'page_ids': page_ids[:2]})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+    response = client.post(f'/books/{book_id}/pages/reorder', json={'page_ids': 'x'})
+    assert response.status_code == 400
+
+
+def test_created_pages_go_after_the_last_key(client, db_session):
+    from app.models import Page
+
+    (book_id, page_ids), = populate(db_session, pages=3, cards=0)
+    # Una cancellazione non deve produrre chiavi duplicate (COUNT(*) lo faceva)
+    client.post(f'/books/{book_id}/pages/{page_ids[0]}/delete')
+    client.post(f'/books/{book_id}/pages/new', data={'title': 'Nuova', 'grid_cols': 3, 'grid_rows': 3})
+
+    db_session.expire_all()
+    orders = [page.order for page in db_session.query(Page).filter_by(book_id=book_id)]
+    assert len(orders) == len(set(orders)) == 3
+    assert _order(db_session, book_id)[:2] == page_ids[1:]
+
+
+def test_edit_page_moves_to_position(client, db_session):
+    (book_id, page_ids), = populate(db_session, pages=4, cards=0)
+
+    client.post(
+        f'/books/{book_id}/pages/{page_ids[3]}/edit',
+        data={'title': 'Spostata', 'grid_cols': 3, 'grid_rows': 3, 'position': 2},
+    )
+
+    assert _order(db_session, book_id) == [page_ids[0], page_ids[3], page_ids[1], page_ids[2]]
+
+
+def test_concurrent_creations_get_distinct_keys(db_engine, db_session):
+    from sqlalchemy.orm import Session
+    from app.models import Page
+    from app.services.page_order import next_order, ordered_pages
+
+    (book_id, _), = populate(db_session, pages=2, cards=0)
+    first, second = Session(db_engine), Session(db_engine)
+    try:
+        # Entrambe le richieste preparano la pagina prima che l'altra la salvi
+        pages = [Page(book_id=book_id, title=f'Nuova {i}', grid_cols=3, grid_rows=3, order=next_order(book_id))
+                 for i in range(2)]
+        first.add(pages[0])
+        second.add(pages[1])
+        first.commit()
+        second.commit()
+        assert pages[1].order == pages[0].order + 1024
+    finally:
+        first.close()
+        second.close()
+
+    orders = [order for _, order in ordered_pages(db_session, book_id)]
+    assert len(orders) == len(set(orders)) == 4
@@ -0,0 +1,83 @@
+"""
+Snapshot pubblicati per il runtime
+"""
+
+from conftest import QueryCounter, populate
+
+
+def _draft_token(client, book_id):
+    from app.services import preview
+
+    with client.application.test_request_context():
+        return preview.draft_token(book_id)
+
+
+def test_published_runtime_reads_one_snapshot_row(client, db_engine, db_session):
+    (book_id, page_ids), = populate(db_session, pages=5, cards=36)
+    assert client.post(f'/books/{book_id}/publish').status_code == 302
+
+    with QueryCounter(db_engine) as counter:
+        response = client.get(f'/books/{book_id}/runtime/{page_ids[2]}')
+    assert response.status_code == 200
+    assert counter.count <= 2, counter.statements
+
+    html = response.get_data(as_text=True)
+    assert 'Pagina 3 di 5' in html
+    assert 'Carta 35' in html
+    assert f"goToPage('{page_ids[3]}')" in html
+    # Pagina target e prefetch risolti alla pubblicazione
+    assert 'Pagina 3</span>' in html
+    assert f'/books/{book_id}/runtime/{page_ids[3]}"' in html
+
+    with QueryCounter(db_engine) as counter:
+        response = client.get(f'/books/{book_id}/runtime')
+    assert response.status_code == 200
+    assert counter.count <= 2, counter.statements
+    assert 'Pagina 1 di 5' in response.get_data(as_text=True)
+
+
+def test_drafts_stay_invisible_until_next_publish(client, db_session):
+    from app.models import Card
+
+    (book_id, page_ids), = populate(db_session, pages=2, cards=1)
+    client.post(f'/books/{book_id}/publish')
+
+    card = db_session.query(Card).filter_by(page_id=page_ids[0]).first()
+    card.label = 'Bozza'
+    db_session.commit()
+    client.post(f'/books/{book_id}/pages/{page_ids[1]}/delete')
+
+    html = client.get(f'/books/{book_id}/runtime/{page_ids[0]}').get_data(as_text=True)
+    assert 'Bozza' not in html
+    assert client.get(f'/books/{book_id}/runtime/{page_ids[1]}').status_code == 200
+    # Anteprima delle bozze solo con il token firmato della pagina del libro
+    assert 'Bozza' not in client.get(f'/books/{book_id}/runtime/{page_ids[0]}?draft=1').get_data(as_text=True)
+    token = _draft_token(client, book_id)
+    html = client.get(f'/books/{book_id}/runtime/{page_ids[0]}?draft={token}').get_data(as_text=True)
+    assert 'Bozza' in html
+    assert f'?draft={token}' in html  # la navigazione resta in anteprima
+    assert 'Bozza' not in client.get(
+        f'/books/{book_id}/runtime/{page_ids[0]}?draft={_draft_token(client, book_id + 1)}'
+    ).get_data(as_text=True)
+
+    client.post(f'/books/{book_id}/publish')
+    assert 'Bozza' in client.get(f'/books/{book_id}/runtime/{page_ids[0]}').get_data(as_text=True)
+    assert client.get(f'/books/{book_id}/runtime/{page_ids[1]}').status_code == 302
+
+
+def test_publish_emits_book_event(client, db_session, event_bus):
+    (book_id, _), = populate(db_session, pages=1, cards=0)
+    event_bus.poll()
+    broker = event_bus.broker
+    after = broker.last_id
+    client.post(f'/books/{book_id}/publish')
+    event_bus.poll()
+
+    _, items, _ = broker.wait(book_id, after, timeout=0)
+    assert [data for _, data in items] == [{'book_id': book_id, 'pages': [], 'book': True}]
+
+
+def test_unpublished_runtime_uses_live_pages(client, db_session):
+    (book_id, page_ids), = populate(db_session, pages=2, cards=1)
+    html = client.get(f'/books/{book_id}/runtime').get_data(as_text=True)
+    assert 'Pagina 1 di 2' in html
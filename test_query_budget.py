@@ -0,0 +1,87 @@
+"""
+Query budget per le route principali
+Il numero di statement SQL per richiesta non deve crescere con la quantità di dati:
+ogni route viene eseguita su un dataset piccolo e su uno grande.
+"""
+
+import pytest
+
+from conftest import QueryCounter, populate, query_budget
+
+# Statement massimi per richiesta (indipendenti dal numero di libri/pagine/carte)
+ROUTE_QUERY_BUDGETS = {
+    "main.index": 3,
+    "books.list_books": 3,
+    "books.runtime_book": 5,  # +1 per il grafo di navigazione se non in cache
+    "books.runtime_page": 5,
+    "pages.edit_page": 5,  # +1 per la posizione della pagina nel libro
+}
+
+SMALL = dict(books=1, pages=2, cards=2)
+LARGE = dict(books=10, pages=10, cards=36)
+
+
+def _route_urls(book_id, page_ids):
+    return {
+        "main.index": "/",
+        "books.list_books": "/books/",
+        "books.runtime_book": f"/books/{book_id}/runtime",
+        "books.runtime_page": f"/books/{book_id}/runtime/{page_ids[-1]}",
+        "pages.edit_page": f"/books/{book_id}/pages/{page_ids[-1]}/edit",
+    }
+
+
+def _measure(client, db_engine, db_session, sizes):
+    book_id, page_ids = populate(db_session, **sizes)[-1]
+    counts = {}
+    for endpoint, url in _route_urls(book_id, page_ids).items():
+        with QueryCounter(db_engine) as counter:
+            response = client.get(url)
+        assert response.status_code == 200, endpoint
+        counts[endpoint] = counter.count
+    return counts
+
+
+def test_query_budget_helper_fails_when_exceeded(db_engine, db_session):
+    from app.models import Book
+
+    with pytest.raises(AssertionError):
+        with query_budget(db_engine, 1):
+            db_session.query(Book).all()
+            db_session.query(Book).count()
+
+
+def test_route_query_budgets_do_not_grow_with_data(client, db_engine, db_session):
+    small = _measure(client, db_engine, db_session, SMALL)
+    large = _measure(client, db_engine, db_session, LARGE)
+
+    for endpoint, budget in ROUTE_QUERY_BUDGETS.items():
+        assert large[endpoint] <= budget, f"{endpoint}: {large[endpoint]} query > budget {budget}"
+        assert large[endpoint] == small[endpoint], (
+            f"{endpoint}: {small[endpoint]} query con pochi dati, {large[endpoint]} con dataset grande"
+        )
+
+
+def test_cross_book_targets_are_not_links_nor_extra_queries(client, db_engine, db_session):
+    from app.models import Card, Page
+
+    (book_id, page_ids), (other_id, other_page_ids) = populate(db_session, books=2, pages=2, cards=6)
+    url = f"/books/{book_id}/runtime/{page_ids[-1]}"
+    with QueryCounter(db_engine) as counter:
+        client.get(url)
+    same_book = counter.count
+
+    db_session.get(Page, other_page_ids[0]).title = "Altro libro"
+    cards = db_session.query(Card).filter(Card.page_id == page_ids[-1]).all()
+    for card in cards:
+        card.target_page_id = other_page_ids[0]
+    db_session.commit()
+
+    with QueryCounter(db_engine) as counter:
+        response = client.get(url)
+    body = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert counter.count == same_book <= ROUTE_QUERY_BUDGETS["books.runtime_page"]
+    assert "Altro libro" not in body
+    assert f'data-target-page="{other_page_ids[0]}"' not in body
@@ -0,0 +1,103 @@
+"""
+Hash percettivo e ricerca dei quasi-duplicati
+"""
+
+import io
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.services import similarity
+
+
+@pytest.fixture(autouse=True)
+def fresh_index():
+    similarity.reset()
+    yield
+    similarity.reset()
+
+
+def _pictogram(size=256, mode='RGB'):
+    img = Image.new(mode, (size, size), 'white')
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((size // 8, size // 8, size * 5 // 8, size * 5 // 8), fill='black')
+    draw.rectangle((size // 2, size // 2, size * 7 // 8, size * 7 // 8), fill='gray')
+    return img
+
+
+def _encode(img, fmt):
+    buffer = io.BytesIO()
+    img.save(buffer, fmt)
+    buffer.seek(0)
+    return buffer
+
+
+def test_bk_tree_matches_brute_force_and_prunes():
+    rng = random.Random(41)
+    hashes = [rng.getrandbits(64) for _ in range(10_000)]
+    tree = similarity.BKTree()
+    for asset_id, value in enumerate(hashes):
+        tree.add(value, asset_id)
+
+    for _ in range(20):
+        # Query vicina a un hash esistente (pochi bit invertiti)
+        query = hashes[rng.randrange(len(hashes))] ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        results, visited = tree.search(query, 4)
+        expected = sorted(
+            (similarity.hamming(query, value), asset_id)
+            for asset_id, value in enumerate(hashes)
+            if similarity.hamming(query, value) <= 4
+        )
+        assert results == expected
+        assert visited < len(hashes)
+
+
+def test_same_image_at_different_sizes_and_formats_is_near_duplicate():
+    original = _pictogram(512, 'RGBA')
+    png = Image.open(_encode(original, 'PNG'))
+    jpeg = Image.open(_encode(original.convert('RGB').resize((96, 96)), 'JPEG'))
+    other = _pictogram(512).transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+    assert similarity.hamming(similarity.dhash(png), similarity.dhash(jpeg)) <= similarity.NEAR_DUPLICATE_DISTANCE
+    assert similarity.hamming(similarity.dhash(png), similarity.dhash(other)) > similarity.NEAR_DUPLICATE_DISTANCE
+
+
+def test_upload_reports_similar_assets(client, db_session, tmp_path):
+    from app.models import Asset
+
+    client.application.static_folder = str(tmp_path)
+    first = client.post('/assets/api/upload', data={'file': (_encode(_pictogram(300), 'PNG'), 'casa.png')},
+                        content_type='multipart/form-data').get_json()
+    assert first['success'] and first['similar'] == []
+
+    second = client.post('/assets/api/upload', data={'file': (_encode(_pictogram(120), 'JPEG'), 'casa.jpg')},
+                         content_type='multipart/form-data').get_json()
+    assert second['success']
+    assert [item['id'] for item in second['similar']] == [first['asset']['id']]
+
+    assert db_session.get(Asset, second['asset']['id']).phash is not None
+
+    response = client.get(f"/assets/api/{first['asset']['id']}/similar").get_json()
+    assert response['success']
+    assert [item['id'] for item in response['similar']] == [second['asset']['id']]
+
+    client.post(f"/assets/{second['asset']['id']}/delete")
+    response = client.get(f"/assets/api/{first['asset']['id']}/similar").get_json()
+    assert response['similar'] == []
+
+
+def test_backfill_hashes_existing_assets(db_session, tmp_path):
+    from app.models import Asset
+
+    _pictogram(200).save(tmp_path / 'vecchio.png')
+    db_session.add_all([
+        Asset(kind='image/png', url='vecchio.png'),
+        Asset(kind='image/png', url='mancante.png'),
+    ])
+    db_session.commit()
+
+    assert similarity.backfill(db_session, tmp_path, batch_size=1) == 1
+    hashed = db_session.query(Asset).filter(Asset.phash.is_not(None)).one()
+    assert hashed.url == 'vecchio.png'
+    assert similarity.find_similar(db_session, hashed.phash)[0][1].id == hashed.id
@@ -0,0 +1,90 @@
+"""
+Benchmark di avvio: import del package + create_app entro un budget definito,
+e nessun DDL quando lo schema è già alla versione corrente.
+"""
+
+import os
+import subprocess
+import sys
+
+from conftest import QueryCounter
+
+# Budget per import + create_app in un processo nuovo (worker boot / avvio test)
+STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', '2.0'))
+
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from app import create_app
+create_app()
+print(time.perf_counter() - start)
+"""
+
+
+def _startup_time(env):
+    result = subprocess.run(
+        [sys.executable, '-c', STARTUP_SCRIPT],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def test_startup_within_budget(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}", APP_ENV='production')
+
+    # Primo avvio: crea lo schema. Secondo avvio: solo controllo di versione.
+    _startup_time(env)
+    elapsed = _startup_time(env)
+
+    print(f"Startup (import + create_app): {elapsed * 1000:.1f} ms")
+    assert elapsed < STARTUP_BUDGET_SECONDS
+
+
+def test_init_db_skips_ddl_when_schema_is_current(db_engine):
+    from app.db import init_db, get_schema_version, SCHEMA_VERSION
+
+    init_db(db_engine)
+    assert get_schema_version(db_engine) == SCHEMA_VERSION
+
+    with QueryCounter(db_engine) as counter:
+        init_db(db_engine)
+
+    assert counter.statements == ['PRAGMA user_version']
+
+
+def test_schemas_are_loaded_lazily():
+    script = "import app.schemas as s; print('BookRead' in vars(s)); s.BookRead; print('BookRead' in vars(s))"
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.split() == ['False', 'True']
+
+
+def test_init_db_migrates_existing_database(tmp_path):
+    import sqlite3
+    from sqlalchemy import create_engine, inspect
+    from app.db import init_db, get_schema_version, SCHEMA_VERSION
+
+    # Database creato prima del versioning (user_version 0, schema 1)
+    path = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE book (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, locale VARCHAR, home_page_id INTEGER);
+        CREATE TABLE asset (id INTEGER PRIMARY KEY, kind VARCHAR NOT NULL, url VARCHAR NOT NULL, alt VARCHAR);
+    """)
+    conn.close()
+    engine = create_engine(f"sqlite:///{path}")
+
+    init_db(engine)
+
+    assert get_schema_version(engine) == SCHEMA_VERSION
+    assert 'ix_asset_url' in {index['name'] for index in inspect(engine).get_indexes('asset')}
+    engine.dispose()
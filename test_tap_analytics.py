@@ -0,0 +1,82 @@
+"""
+Statistiche dei tocchi: buffer in memoria e scrittura a blocchi
+"""
+
+import pytest
+
+from conftest import QueryCounter, populate
+
+
+@pytest.fixture
+def taps():
+    from app.services import tap_analytics
+
+    buffer = tap_analytics.TapBuffer(max_pending=10, flush_size=5, flush_interval=None)
+    tap_analytics.set_buffer(buffer)
+    yield buffer
+    tap_analytics.set_buffer(None)
+
+
+def test_taps_are_buffered_and_flushed_in_one_batch(client, db_engine, db_session, taps):
+    from app.models import Card
+
+    (book_id, page_ids), (other_id, _) = populate(db_session, books=2, pages=1, cards=3)
+    first, second, third = [card.id for card in db_session.query(Card).filter_by(page_id=page_ids[0]).order_by(Card.id)]
+
+    with QueryCounter(db_engine) as counter:
+        response = client.post(f'/api/books/{book_id}/taps', json={'cards': [first, second, first]})
+        client.post(f'/api/books/{book_id}/taps', json={'cards': [first]})
+        # Carta di un altro libro e carta inesistente: ignorate alla scrittura
+        client.post(f'/api/books/{other_id}/taps', json={'cards': [third]})
+        client.post(f'/api/books/{book_id}/taps', json={'cards': [999999]})
+    assert response.status_code == 202 and response.get_json()['accepted'] == 3
+    assert counter.count == 0
+    assert taps.pending == 6
+
+    with QueryCounter(db_engine) as counter:
+        assert taps.flush() == 4
+    assert len([s for s in counter.statements if s.lstrip().startswith('INSERT')]) == 1
+    assert taps.pending == 0
+
+    client.post(f'/api/books/{book_id}/taps', json={'cards': [second, second]})
+    taps.flush()
+
+    top = client.get(f'/api/books/{book_id}/taps').get_json()['cards']
+    assert [(card['id'], card['count']) for card in top] == [(first, 3), (second, 3)]
+    assert top[0]['label'] == 'Carta 0'
+    assert client.get(f'/api/books/{other_id}/taps').get_json()['cards'] == []
+
+    # I contatori sono eliminati con la carta
+    db_session.delete(db_session.get(Card, first))
+    db_session.commit()
+    assert [card['id'] for card in client.get(f'/api/books/{book_id}/taps').get_json()['cards']] == [second]
+
+
+def test_buffer_is_bounded(client, taps):
+    response = client.post('/api/books/1/taps', json={'cards': list(range(1, 13))})
+
+    assert response.get_json()['accepted'] == 10
+    assert taps.pending == 10 and taps.dropped == 2
+    assert client.post('/api/books/1/taps', json={'cards': 'x'}).status_code == 400
+    assert client.post('/api/books/1/taps', json={'cards': list(range(201))}).status_code == 413
+
+
+def test_flush_thread_writes_when_buffer_fills(db_session):
+    import time
+    from app.models import Card, CardTapCount
+    from app.services.tap_analytics import TapBuffer
+
+    (book_id, _), = populate(db_session, pages=1, cards=1)
+    card_id = db_session.query(Card.id).scalar()
+
+    buffer = TapBuffer(max_pending=100, flush_size=3, flush_interval=60)
+    buffer.record(book_id, [card_id, card_id, card_id])
+
+    # Nessun flush() esplicito: il thread si sveglia prima dell'intervallo
+    deadline = time.monotonic() + 5
+    row = None
+    while row is None and time.monotonic() < deadline:
+        time.sleep(0.02)
+        db_session.expire_all()
+        row = db_session.get(CardTapCount, card_id)
+    assert row is not None and row.count == 3
@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+"""
+AAC Builder Flask App - entry point WSGI di produzione
+
+Run: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+
+# Crea l'applicazione Flask (caricata una volta nel master con preload_app)
+app = create_app()